@@ -1,5 +1,10 @@
-from .base_client import BaseClient
+from .http_pool import HttpPool
+from .sse_decoder import SSEDecoder, SSE_DONE
+from .timeouts import StageTimeouts, StageBudget, stage_budget
+from .base_client import BaseClient, UpstreamError, UpstreamTimeout
+from .endpoint_pool import Endpoint, EndpointPool
+from .hedging import HedgePolicy
 from .deepseek_client import DeepSeekClient
 from .gemini_client import GeminiClient
 
-__all__ = ['BaseClient', 'DeepSeekClient', 'GeminiClient']
+__all__ = ['HttpPool', 'SSEDecoder', 'SSE_DONE', 'StageTimeouts', 'StageBudget', 'stage_budget', 'BaseClient', 'UpstreamError', 'UpstreamTimeout', 'Endpoint', 'EndpointPool', 'HedgePolicy', 'DeepSeekClient', 'GeminiClient']
@@ -1,50 +1,198 @@
 """基础客户端类，定义通用接口"""
-from typing import AsyncGenerator, Any
+import json
+import logging
+import time
+import asyncio
+from contextlib import asynccontextmanager, aclosing
+from typing import AsyncGenerator, Awaitable, Any, Optional, TypeVar
 import aiohttp
 from app.utils.logger import logger
+from app.utils.tracing import KIND_CLIENT, start_span
 from abc import ABC, abstractmethod
+from .http_pool import HttpPool
+from .sse_decoder import SSEDecoder
+from .timeouts import StageBudget, StageTimeouts, stage_budget
+
+T = TypeVar("T")
+
+
+class UpstreamError(Exception):
+    """上游请求失败：连接错误或非 200 响应"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        """初始化异常
+
+        Args:
+            message: 错误信息
+            status: HTTP 状态码，连接错误时为 None
+        """
+        super().__init__(message)
+        self.status = status
+
+
+class UpstreamTimeout(UpstreamError):
+    """上游在分阶段超时或阶段截止时间内没有响应"""
+
+    def __init__(self, phase: str, message: Optional[str] = None):
+        """初始化异常
+
+        Args:
+            phase: 超时阶段，"connect"、"first_byte"、"idle" 或 "deadline"
+            message: 错误信息，默认按阶段生成
+        """
+        super().__init__(message or f"upstream timed out ({phase})")
+        self.phase = phase
+
+
+async def wait_upstream(awaitable: Awaitable[T], when: Optional[float], phase: str) -> T:
+    """在截止时间点之前等待上游
+
+    Args:
+        awaitable: 等待的上游操作
+        when: time.monotonic() 截止时间点，None 表示不限制
+        phase: 超时时报告的阶段名
+
+    Returns:
+        T: 上游操作的结果
+
+    Raises:
+        UpstreamTimeout: 到达截止时间点
+    """
+    if when is None:
+        return await awaitable
+    timer = asyncio.timeout(max(0.0, when - time.monotonic()))
+    try:
+        async with timer:
+            return await awaitable
+    except TimeoutError:
+        if not timer.expired():
+            # 上游操作自身抛出的超时（如 aiohttp 的建连超时），交给调用方分类
+            raise
+        raise UpstreamTimeout(phase) from None
 
 
 class BaseClient(ABC):
-    def __init__(self, api_key: str, api_url: str):
-        logger.debug(f"[初始化客户端] 正在初始化 {self.__class__.__name__} | API地址: {api_url}")
-        logger.debug(f"[Debug] Initializing {self.__class__.__name__} | API endpoint: {api_url}")
+    def __init__(self, api_key: str, api_url: str, http_pool: Optional[HttpPool] = None):
+        logger.debug("[初始化客户端] 正在初始化 %s | API地址: %s", self.__class__.__name__, api_url)
         """初始化基础客户端
         
         Args:
             api_key: API密钥
             api_url: API地址
+            http_pool: 共享连接池，未提供或未启动时每次请求临时创建会话
         """
         self.api_key = api_key
         self.api_url = api_url
-        
-    async def _make_request(self, headers: dict, data: dict) -> AsyncGenerator[bytes, None]:
-        logger.debug(f"[准备请求] 发送请求到API | 请求头: {headers}")
-        logger.debug(f"[准备请求] 请求数据: {json.dumps(data, ensure_ascii=False)}")
-        logger.debug(f"[Debug] Sending request | Headers: {headers}")
-        logger.debug(f"[Debug] Request data: {json.dumps(data, ensure_ascii=False)}")
+        self.http_pool = http_pool
+
+    @asynccontextmanager
+    async def _session(self) -> AsyncGenerator[aiohttp.ClientSession, None]:
+        """获取用于发送请求的会话
+
+        优先复用共享连接池中的会话，否则回退为一次性会话。
+        """
+        if self.http_pool is not None and self.http_pool.started:
+            yield self.http_pool.session
+        else:
+            async with aiohttp.ClientSession() as session:
+                yield session
+
+    async def _make_request(self, headers: dict, data: dict, url: Optional[str] = None) -> AsyncGenerator[bytes, None]:
+        if logger.isEnabledFor(logging.DEBUG):
+            # 请求体可能包含很长的对话历史，只在开启 DEBUG 时序列化一次
+            logger.debug("[准备请求] 发送请求到API | 地址: %s | 请求数据: %s",
+                         url or self.api_url, json.dumps(data, ensure_ascii=False))
         """发送请求并处理响应
         
         Args:
             headers: 请求头
             data: 请求数据
+            url: 请求地址，默认为 api_url
             
         Yields:
             bytes: 原始响应数据
+
+        Raises:
+            UpstreamError: 连接失败、读取中断或上游返回非 200 状态码
+            UpstreamTimeout: 超过当前阶段的建连、首字节或空闲超时，或到达阶段截止时间
         """
+        budget = stage_budget.get() or StageBudget(StageTimeouts())
+        kwargs = {}
+        if budget.timeouts.connect:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=None, sock_connect=budget.timeouts.connect)
+        span = start_span("upstream", KIND_CLIENT, {"http.url": url or self.api_url, "client": self.__class__.__name__})
+        traceparent = span.traceparent()
+        if traceparent is not None:
+            headers = {**headers, "traceparent": traceparent}
+        received_bytes = chunk_count = 0
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.api_url, headers=headers, json=data) as response:
+            async with self._session() as session:
+                # 首字节计时覆盖等待连接、发送请求、等待响应头和第一个分块
+                first_byte_at, phase = budget.first_byte_at(time.monotonic())
+                response = await wait_upstream(
+                    session.post(url or self.api_url, headers=headers, json=data, **kwargs), first_byte_at, phase)
+                span.add_event("response_headers")
+                span.set_attribute("http.status_code", response.status)
+                async with response:
                     if response.status != 200:
-                        error_text = await response.text()
+                        error_text = await wait_upstream(response.text(), *budget.idle_at())
                         logger.error(f"API 请求失败: {error_text}")
-                        return
-                        
-                    async for chunk in response.content.iter_any():
-                        yield chunk
+                        raise UpstreamError(f"HTTP {response.status}: {error_text[:200]}", response.status)
+
+                    chunks = response.content.iter_any()
+                    try:
+                        while True:
+                            try:
+                                # 只计量等待上游的时间，调用方处理分块（包括背压等待）不计入空闲超时
+                                chunk = await wait_upstream(anext(chunks), first_byte_at, phase)
+                            except StopAsyncIteration:
+                                break
+                            if not chunk_count:
+                                span.add_event("first_byte")
+                            chunk_count += 1
+                            received_bytes += len(chunk)
+                            yield chunk
+                            first_byte_at, phase = budget.idle_at()
+                    finally:
+                        if not response.content.at_eof():
+                            # 调用方提前退出（推理交接、客户端断开或超时），主动断开连接让上游停止生成
+                            response.close()
                         
+        except UpstreamError as e:
+            span.record_error(e)
+            raise
+        except TimeoutError as e:
+            # 未被分阶段计时捕获的超时来自 aiohttp 的建连超时
+            logger.error(f"连接 API 超时: {e}")
+            span.record_error(e)
+            raise UpstreamTimeout("connect", f"{type(e).__name__}: {e}") from e
         except Exception as e:
             logger.error(f"请求 API 时发生错误: {e}")
+            span.record_error(e)
+            raise UpstreamError(f"{type(e).__name__}: {e}") from e
+        finally:
+            # 调用方提前退出（交接、取消）时 Span 同样在此结束
+            span.set_attributes({"response.bytes": received_bytes, "response.chunks": chunk_count})
+            span.end()
+            
+    async def _stream_events(self, headers: dict, data: dict, url: Optional[str] = None) -> AsyncGenerator[Any, None]:
+        """发送请求并按 SSE 事件逐个产出解析后的数据
+        
+        Args:
+            headers: 请求头
+            data: 请求数据
+            url: 请求地址，默认为 api_url
+            
+        Yields:
+            Any: 解析后的 JSON 事件，`data: [DONE]` 以 `SSE_DONE` 表示
+        """
+        decoder = SSEDecoder()
+        async with aclosing(self._make_request(headers, data, url)) as chunks:
+            async for chunk in chunks:
+                for event in decoder.feed(chunk):
+                    yield event
+        for event in decoder.flush():
+            yield event
             
     @abstractmethod
     async def stream_chat(self, messages: list, model: str) -> AsyncGenerator[tuple[str, str], None]:
@@ -1,21 +1,40 @@
 """DeepSeek API 客户端"""
-import json
-from typing import AsyncGenerator
-from app.utils.logger import logger
-from .base_client import BaseClient
+import time
+import asyncio
+from contextlib import aclosing
+from typing import AsyncGenerator, Optional
+from app.utils.logger import logger, token_trace
+from app.utils.metrics import UPSTREAM_ERRORS, error_type
+from .base_client import BaseClient, UpstreamError, UpstreamTimeout
+from .endpoint_pool import Endpoint, EndpointPool
+from .hedging import HedgePolicy
+from .http_pool import HttpPool
+from .sse_decoder import SSE_DONE
 
 
 class DeepSeekClient(BaseClient):
-    def __init__(self, api_key: str, api_url: str = "https://dashscope.aliyuncs.com/compatible-mode/v1", model: str = "deepseek-r1"):
+    def __init__(self, api_key: str, api_url: str = "https://dashscope.aliyuncs.com/compatible-mode/v1", model: str = "deepseek-r1",
+                 http_pool: Optional[HttpPool] = None, provider: str = "deepseek",
+                 endpoint_pool: Optional[EndpointPool] = None, max_attempts: int = 3,
+                 hedge: Optional[HedgePolicy] = None):
         """初始化 DeepSeek 客户端
         
         Args:
             api_key: DeepSeek API密钥
             api_url: DeepSeek API地址
             model: 模型名称，默认为 deepseek-r1
+            http_pool: 共享连接池
+            provider: 模型提供商名称，仅用于日志
+            endpoint_pool: 多个兼容端点组成的端点池，为 None 时只使用 api_url
+            max_attempts: 首 token 之前失败时最多尝试的端点数
+            hedge: 对冲策略，为 None 时不发出对冲请求
         """
-        super().__init__(api_key, api_url)
+        super().__init__(api_key, api_url, http_pool)
         self.model = model
+        self.provider = provider
+        self.endpoint_pool = endpoint_pool or EndpointPool([Endpoint(api_url, api_key, name=provider, provider=provider)])
+        self.max_attempts = max_attempts
+        self.hedge = hedge
         
     def _process_think_tag_content(self, content: str) -> tuple[bool, str]:
         """处理包含 think 标签的内容
@@ -45,90 +64,238 @@ class DeepSeekClient(BaseClient):
                        presence_penalty: float = 0.0, frequency_penalty: float = 0.0) -> AsyncGenerator[tuple[str, str], None]:
         """流式对话
         
+        从端点池中选择端点；收到首 token 之前失败（连接错误、非 200 或空响应）时换一个端点重试，
+        收到首 token 之后不再重试。启用对冲时，首 token 超过对冲延迟仍未到达则再发出一个
+        相同请求，先产出首 token 的一方胜出，另一方立即取消。
+        
         Args:
             messages: 消息列表
-            model: 模型名称
+            model: 模型名称，端点配置了模型时使用端点的模型
             
         Yields:
             tuple[str, str]: (内容类型, 内容)
                 内容类型: "reasoning" 或 "content"
                 内容: 实际的文本内容
+
+        Raises:
+            UpstreamError: 所有尝试的端点都在首 token 之前失败
+            UpstreamTimeout: 首 token 之后超时、所有尝试的端点都超时，或到达阶段截止时间
+        """
+        used = []
+        stream = self._stream_with_retry(messages, model, used)
+        if self.hedge is not None:
+            # 对冲请求尽量避开主请求正在使用的端点
+            stream = self._stream_hedged(stream, lambda: self._stream_with_retry(messages, model, [], avoid=used))
+        async with aclosing(stream) as events:
+            async for item in events:
+                yield item
+
+    async def _stream_hedged(self, primary: AsyncGenerator,
+                             make_hedge) -> AsyncGenerator[tuple[str, str], None]:
+        """对冲执行：主请求首 token 超时后发出对冲请求，取先产出首 token 的一方
+
+        Args:
+            primary: 主请求的事件流
+            make_hedge: 创建对冲请求事件流的函数
+
+        Yields:
+            tuple[str, str]: 胜出一方的 (内容类型, 内容)
+        """
+        policy = self.hedge
+        policy.requests += 1
+        start = time.monotonic()
+        first = asyncio.ensure_future(anext(primary))
+        contenders = {first: primary}
+        winner = None
+        try:
+            delay = policy.delay()
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if not done and policy.try_fire():
+                logger.info(f"DeepSeek 首 token 超过 {delay:.2f} 秒未到达，发出对冲请求")
+                hedge = make_hedge()
+                contenders[asyncio.ensure_future(anext(hedge))] = hedge
+
+            pending = set(contenders)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if winner is None and not task.cancelled() and task.exception() is None:
+                        winner = task
+            if winner is None:
+                # 所有请求都在首 token 之前失败，抛出主请求的错误
+                error = first.exception()
+                if isinstance(error, StopAsyncIteration):
+                    return
+                raise error
+
+            policy.record(time.monotonic() - start)
+            if winner is not first:
+                policy.wins += 1
+                logger.info("对冲请求先到达首 token，取消主请求")
+            # 立即取消落后的一方，释放其上游连接
+            for task, stream in list(contenders.items()):
+                if task is not winner:
+                    await self._close_contender(task, stream)
+                    del contenders[task]
+
+            yield winner.result()
+            async for item in contenders[winner]:
+                yield item
+        finally:
+            for task, stream in contenders.items():
+                await self._close_contender(task, stream)
+
+    @staticmethod
+    async def _close_contender(task: asyncio.Future, stream: AsyncGenerator) -> None:
+        """取消仍在等待首 token 的请求并关闭其事件流"""
+        if not task.done():
+            task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await stream.aclose()
+
+    async def _stream_with_retry(self, messages: list, model: str, used: list,
+                                 avoid: Optional[list] = None) -> AsyncGenerator[tuple[str, str], None]:
+        """选择端点发起请求，首 token 之前失败时换一个端点重试
+
+        Args:
+            messages: 消息列表
+            model: 模型名称
+            used: 记录本请求已尝试的端点，供对冲请求避开
+            avoid: 优先避开的端点，没有其他端点可选时仍可使用
+
+        Yields:
+            tuple[str, str]: (内容类型, 内容)
+        """
+        last_error = None
+        for _ in range(self.max_attempts):
+            endpoint = self.endpoint_pool.pick(tuple(used) + tuple(avoid or ())) or self.endpoint_pool.pick(tuple(used))
+            if endpoint is None:
+                break
+            used.append(endpoint)
+            endpoint.requests += 1
+            endpoint.in_flight += 1
+            start = time.monotonic()
+            received = False
+            try:
+                async with aclosing(self._stream_endpoint(endpoint, messages, model)) as stream:
+                    async for item in stream:
+                        if not received:
+                            received = True
+                            self.endpoint_pool.record_success(endpoint, time.monotonic() - start)
+                        yield item
+                if received:
+                    return
+                last_error = UpstreamError("上游未返回任何内容")
+            except (asyncio.CancelledError, GeneratorExit):
+                if not received:
+                    # 对冲落败或客户端断开：已等待的时间是该端点首 token 延迟的下限
+                    self.endpoint_pool.record_abandoned(endpoint, time.monotonic() - start)
+                raise
+            except Exception as e:
+                if not received and isinstance(e, UpstreamTimeout) and e.phase == "deadline":
+                    # 阶段截止时间已到，换端点也来不及；已等待的时间只是首 token 延迟的下限，不计为端点失败
+                    self.endpoint_pool.record_abandoned(endpoint, time.monotonic() - start)
+                    UPSTREAM_ERRORS.labels("deepseek", error_type(e)).inc()
+                    raise
+                if received:
+                    # 已经输出过内容，无法透明重试
+                    self.endpoint_pool.record_failure(endpoint, e)
+                    UPSTREAM_ERRORS.labels("deepseek", error_type(e)).inc()
+                    raise
+                last_error = e
+            finally:
+                endpoint.in_flight -= 1
+            self.endpoint_pool.record_failure(endpoint, last_error)
+            UPSTREAM_ERRORS.labels("deepseek", error_type(last_error)).inc()
+            logger.warning(f"DeepSeek 端点 {endpoint.name} 在首 token 前失败: {last_error}")
+        if isinstance(last_error, UpstreamTimeout):
+            # 保留超时类型，由调用方决定是否降级
+            raise UpstreamTimeout(last_error.phase, f"所有 DeepSeek 端点均超时，最近错误: {last_error}")
+        raise UpstreamError(f"所有 DeepSeek 端点均失败，最近错误: {last_error}")
+
+    async def _stream_endpoint(self, endpoint: Endpoint, messages: list,
+                               model: str) -> AsyncGenerator[tuple[str, str], None]:
+        """向单个端点发起流式对话
+
+        Args:
+            endpoint: 端点
+            messages: 消息列表
+            model: 模型名称，端点配置了模型时使用端点的模型
+
+        Yields:
+            tuple[str, str]: (内容类型, 内容)
         """
         headers = {
-            "Authorization": f"Bearer {self.api_key}",
+            "Authorization": f"Bearer {endpoint.api_key}",
             "Content-Type": "application/json",
             "Accept": "text/event-stream",
         }
         data = {
-            "model": model,
+            "model": endpoint.model or model,
             "messages": messages,
             "stream": True,
         }
         
-        logger.debug(f"开始流式对话：{data}")
+        logger.debug("开始流式对话：%s", data)
 
+        # token 级调试日志按请求采样，未采样时每个 token 只多一次布尔判断
+        trace = token_trace.get()
         accumulated_content = ""
         is_collecting_think = False
         
-        async for chunk in self._make_request(headers, data):
-            chunk_str = chunk.decode('utf-8')
-            
-            try:
-                lines = chunk_str.splitlines()
-                for line in lines:
-                    if line.startswith("data: "):
-                        json_str = line[len("data: "):]
-                        if json_str == "[DONE]":
-                            return
-                        
-                        data = json.loads(json_str)
-                        if data and data.get("choices") and data["choices"][0].get("delta"):
-                            delta = data["choices"][0]["delta"]
-                            
-                            if delta.get("reasoning_content"):
-                                content = delta["reasoning_content"]
-                                logger.debug(f"提取推理内容：{content}")
-                                yield "reasoning", content
-                            
-                            if delta.get("reasoning_content") is None and delta.get("content"):
+        async with aclosing(self._stream_events(headers, data, url=endpoint.url)) as events:
+            async for frame in events:
+                if frame is SSE_DONE:
+                    return
+
+                try:
+                    if frame and frame.get("choices") and frame["choices"][0].get("delta"):
+                        delta = frame["choices"][0]["delta"]
+
+                        if delta.get("reasoning_content"):
+                            content = delta["reasoning_content"]
+                            if trace:
+                                logger.debug("提取推理内容：%s", content)
+                            yield "reasoning", content
+
+                        if delta.get("reasoning_content") is None and delta.get("content"):
+                            content = delta["content"]
+                            logger.info(f"提取内容信息，推理阶段结束: {content}")
+                            yield "content", content
+                        else:
+                            # 处理其他模型的输出
+                            if delta.get("content"):
                                 content = delta["content"]
-                                logger.info(f"提取内容信息，推理阶段结束: {content}")
-                                yield "content", content
-                            else:
-                                # 处理其他模型的输出
-                                if delta.get("content"):
-                                    content = delta["content"]
-                                    if content == "":  # 只跳过完全空的字符串
-                                        continue
-                                    logger.debug(f"非原生推理内容：{content}")
-                                    accumulated_content += content
-                                    
-                                    # 检查累积的内容是否包含完整的 think 标签对
-                                    is_complete, processed_content = self._process_think_tag_content(accumulated_content)
-                                    
-                                    if "<think>" in content and not is_collecting_think:
-                                        # 开始收集推理内容
-                                        logger.debug(f"开始收集推理内容：{content}")
-                                        is_collecting_think = True
+                                if content == "":  # 只跳过完全空的字符串
+                                    continue
+                                if trace:
+                                    logger.debug("非原生推理内容：%s", content)
+                                accumulated_content += content
+
+                                # 检查累积的内容是否包含完整的 think 标签对
+                                is_complete, processed_content = self._process_think_tag_content(accumulated_content)
+
+                                if "<think>" in content and not is_collecting_think:
+                                    # 开始收集推理内容
+                                    logger.debug("开始收集推理内容：%s", content)
+                                    is_collecting_think = True
+                                    yield "reasoning", content
+                                elif is_collecting_think:
+                                    if "</think>" in content:
+                                        # 推理内容结束
+                                        logger.debug("推理内容结束：%s", content)
+                                        is_collecting_think = False
                                         yield "reasoning", content
-                                    elif is_collecting_think:
-                                        if "</think>" in content:
-                                            # 推理内容结束
-                                            logger.debug(f"推理内容结束：{content}")
-                                            is_collecting_think = False
-                                            yield "reasoning", content
-                                            # 输出空的 content 来触发 Claude 处理
-                                            yield "content", ""
-                                            # 重置累积内容
-                                            accumulated_content = ""
-                                        else:
-                                            # 继续收集推理内容
-                                            yield "reasoning", content
+                                        # 输出空的 content 来触发 Claude 处理
+                                        yield "content", ""
+                                        # 重置累积内容
+                                        accumulated_content = ""
                                     else:
-                                        # 普通内容
-                                        yield "content", content
-                                        
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON 解析错误: {e}")
-            except Exception as e:
-                logger.error(f"处理 chunk 时发生错误: {e}")
+                                        # 继续收集推理内容
+                                        yield "reasoning", content
+                                else:
+                                    # 普通内容
+                                    yield "content", content
+
+                except Exception as e:
+                    logger.error(f"处理 chunk 时发生错误: {e}")
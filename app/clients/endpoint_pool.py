@@ -0,0 +1,162 @@
+"""多上游端点池：按首 token 延迟与错误率选择端点，不健康的端点暂时摘除"""
+import time
+from typing import Optional
+from app.utils.logger import logger
+
+
+class Endpoint:
+    """一个 OpenAI 兼容的上游端点及其健康统计"""
+
+    def __init__(self, url: str, api_key: str, model: Optional[str] = None,
+                 name: Optional[str] = None, provider: Optional[str] = None):
+        """初始化端点
+
+        Args:
+            url: chat/completions 接口地址
+            api_key: 该端点的 API 密钥
+            model: 该端点使用的模型名称，为 None 时使用请求中的模型
+            name: 端点名称，用于日志和统计，默认为 url
+            provider: 提供商名称，仅用于日志
+        """
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.name = name or url
+        self.provider = provider or self.name
+        self.ewma_ttft: Optional[float] = None  # 首 token 延迟的指数移动平均（秒），无样本时为 None
+        self.ewma_error = 0.0  # 失败率的指数移动平均
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+
+    def stats(self) -> dict:
+        """获取端点统计
+
+        Returns:
+            dict: 延迟、错误率、摘除状态及累计请求数
+        """
+        return {
+            "name": self.name,
+            "url": self.url,
+            "model": self.model,
+            "ewma_ttft_ms": round(self.ewma_ttft * 1000, 1) if self.ewma_ttft is not None else None,
+            "ewma_error": round(self.ewma_error, 4),
+            "ejected": self.ejected_until > time.monotonic(),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+        }
+
+
+class EndpointPool:
+    """端点选择器
+
+    每次选择得分最低的健康端点，得分为首 token 延迟 EWMA × (1 + 进行中请求数)，再按
+    错误率 EWMA 加权；没有延迟样本的端点优先被选中以获取样本。连续失败达到
+    `max_failures` 次或错误率超过 `eject_error_rate` 的端点被摘除 `cooldown` 秒；
+    所有端点都被摘除时，选择最早恢复的端点而不是直接失败。
+    """
+
+    def __init__(self, endpoints: list[Endpoint], alpha: float = 0.3, max_failures: int = 3,
+                 eject_error_rate: float = 0.6, cooldown: float = 30.0):
+        """初始化端点池
+
+        Args:
+            endpoints: 端点列表，至少一个
+            alpha: EWMA 的平滑系数，越大越偏向最近的样本
+            max_failures: 连续失败多少次后摘除
+            eject_error_rate: 错误率 EWMA 超过该值时摘除
+            cooldown: 摘除时长（秒）
+        """
+        if not endpoints:
+            raise ValueError("EndpointPool 至少需要一个端点")
+        self.endpoints = endpoints
+        self.alpha = alpha
+        self.max_failures = max_failures
+        self.eject_error_rate = eject_error_rate
+        self.cooldown = cooldown
+
+    def pick(self, exclude: tuple = ()) -> Optional[Endpoint]:
+        """选择一个端点
+
+        Args:
+            exclude: 本次请求已尝试过的端点
+
+        Returns:
+            Optional[Endpoint]: 选中的端点，所有端点都已尝试过时返回 None
+        """
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        healthy = [endpoint for endpoint in candidates if endpoint.ejected_until <= now]
+        if not healthy:
+            return min(candidates, key=lambda endpoint: endpoint.ejected_until)
+        return min(healthy, key=self._score)
+
+    @staticmethod
+    def _score(endpoint: Endpoint) -> float:
+        if endpoint.ewma_ttft is None:
+            return endpoint.in_flight * 1e-6
+        return endpoint.ewma_ttft * (1 + endpoint.in_flight) * (1 + 4 * endpoint.ewma_error)
+
+    def record_success(self, endpoint: Endpoint, ttft: float) -> None:
+        """记录一次成功收到首 token
+
+        Args:
+            endpoint: 端点
+            ttft: 首 token 延迟（秒）
+        """
+        self._observe_ttft(endpoint, ttft)
+        endpoint.ewma_error *= 1 - self.alpha
+        endpoint.consecutive_failures = 0
+
+    def record_abandoned(self, endpoint: Endpoint, elapsed: float) -> None:
+        """记录一次未收到首 token 就被放弃的请求（对冲落败或调用方取消）
+
+        已等待的时间只是首 token 延迟的下限，只在它高于当前估计时才计入，不计为失败。
+
+        Args:
+            endpoint: 端点
+            elapsed: 放弃前已等待的时间（秒）
+        """
+        if endpoint.ewma_ttft is None or elapsed > endpoint.ewma_ttft:
+            self._observe_ttft(endpoint, elapsed)
+
+    def _observe_ttft(self, endpoint: Endpoint, ttft: float) -> None:
+        if endpoint.ewma_ttft is None:
+            endpoint.ewma_ttft = ttft
+        else:
+            endpoint.ewma_ttft += self.alpha * (ttft - endpoint.ewma_ttft)
+
+    def record_failure(self, endpoint: Endpoint, error: Optional[BaseException] = None) -> None:
+        """记录一次失败，必要时摘除端点
+
+        Args:
+            endpoint: 端点
+            error: 失败原因，仅用于日志
+        """
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        endpoint.ewma_error += self.alpha * (1 - endpoint.ewma_error)
+        if endpoint.ejected_until > time.monotonic():
+            return
+        if endpoint.consecutive_failures >= self.max_failures or endpoint.ewma_error >= self.eject_error_rate:
+            endpoint.ejected_until = time.monotonic() + self.cooldown
+            endpoint.ejections += 1
+            logger.warning(
+                f"端点 {endpoint.name} 被摘除 {self.cooldown} 秒 | 连续失败: {endpoint.consecutive_failures} | "
+                f"错误率: {endpoint.ewma_error:.2f} | 最近错误: {error}"
+            )
+
+    def stats(self) -> list[dict]:
+        """获取所有端点的统计
+
+        Returns:
+            list[dict]: 每个端点的统计
+        """
+        return [endpoint.stats() for endpoint in self.endpoints]
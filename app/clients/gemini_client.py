@@ -1,38 +1,203 @@
-import google.generativeai as genai
-from typing import AsyncGenerator
-from app.clients.base_client import BaseClient
+import time
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import AsyncGenerator, Any, Optional
+from app.utils.logger import logger
+from app.utils.metrics import UPSTREAM_ERRORS, error_type
+from app.utils.tracing import KIND_CLIENT, start_span
+from app.clients.base_client import BaseClient, wait_upstream
+from app.clients.http_pool import HttpPool
+from app.clients.timeouts import StageBudget, StageTimeouts, stage_budget
+
+DEFAULT_MODEL = "gemini-pro"
+
 
 class GeminiClient(BaseClient):
-    """Google Gemini Pro客户端实现"""
-    
-    def __init__(self, api_key: str, api_url: str = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:streamGenerateContent"):
-        super().__init__(api_key, api_url)
-        genai.configure(api_key=api_key)
-        self.model_name = "gemini-pro"
-        
-    async def stream_chat(self, messages: list, model: str, **kwargs) -> AsyncGenerator[dict, None]:
+    """Google Gemini Pro客户端实现
+
+    默认（backend="http"）直接通过共享连接池请求 streamGenerateContent 的 SSE 接口；
+    backend="sdk" 时使用 google.generativeai 的原生异步接口。两种方式都不会阻塞事件循环。
+    SDK 导入耗时较长（约 0.5 秒），只在 backend="sdk" 时才导入。
+    """
+
+    def __init__(self, api_key: str, api_url: str = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:streamGenerateContent",
+                 http_pool: Optional[HttpPool] = None, provider: str = "google",
+                 backend: str = "http", max_output_tokens: int = 2048, model_cache_size: int = 32):
+        """初始化 Gemini 客户端
+
+        Args:
+            api_key: Gemini API密钥
+            api_url: Gemini API地址，路径中的模型名会按请求的模型替换
+            http_pool: 共享连接池
+            provider: 模型提供商名称，仅用于日志
+            backend: "http" 使用原生异步 HTTP 流，"sdk" 使用 google.generativeai 异步接口
+            max_output_tokens: 最大输出 token 数
+            model_cache_size: 缓存的模型句柄数量上限
+        """
+        super().__init__(api_key, api_url, http_pool)
+        if backend not in ("http", "sdk"):
+            raise ValueError(f"不支持的 Gemini backend: {backend}")
+        self.provider = provider
+        self.backend = backend
+        self.max_output_tokens = max_output_tokens
+        self.model_cache_size = model_cache_size
+        base_url, _, model_path = api_url.partition("/models/")
+        self._base_url = base_url
+        self.model_name = model_path.split(":", 1)[0] or DEFAULT_MODEL
+        # (模型, 生成参数) -> 模型句柄，http 模式下为 (请求地址, generationConfig)
+        self._model_cache: OrderedDict[tuple, Any] = OrderedDict()
+        self._genai = None
+        if backend == "sdk":
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            self._genai = genai
+
+    def _generation_config(self, model_arg: Optional[tuple]) -> tuple:
+        """将 model_arg 转换为可哈希的生成参数
+
+        Args:
+            model_arg: (temperature, top_p, presence_penalty, frequency_penalty)
+
+        Returns:
+            tuple: 排序后的 (参数名, 值) 元组
+        """
+        config = {"maxOutputTokens": self.max_output_tokens}
+        if model_arg:
+            temperature, top_p, presence_penalty, frequency_penalty = model_arg
+            config["temperature"] = temperature
+            config["topP"] = top_p
+            # 并非所有 Gemini 模型都支持惩罚项，只在显式设置时才下发
+            if presence_penalty:
+                config["presencePenalty"] = presence_penalty
+            if frequency_penalty:
+                config["frequencyPenalty"] = frequency_penalty
+        return tuple(sorted(config.items()))
+
+    def _model_handle(self, model: str, generation_config: tuple) -> Any:
+        """获取 (模型, 生成参数) 对应的模型句柄，按 LRU 缓存
+
+        Args:
+            model: 模型名称
+            generation_config: `_generation_config` 的返回值
+
+        Returns:
+            Any: http 模式为 (请求地址, generationConfig 字典)，sdk 模式为 GenerativeModel
+        """
+        key = (model, generation_config)
+        handle = self._model_cache.get(key)
+        if handle is not None:
+            self._model_cache.move_to_end(key)
+            return handle
+
+        config = dict(generation_config)
+        if self.backend == "sdk":
+            genai = self._genai
+            handle = genai.GenerativeModel(model, generation_config=genai.GenerationConfig(
+                max_output_tokens=config.get("maxOutputTokens"),
+                temperature=config.get("temperature"),
+                top_p=config.get("topP"),
+                presence_penalty=config.get("presencePenalty"),
+                frequency_penalty=config.get("frequencyPenalty"),
+            ))
+        else:
+            handle = (f"{self._base_url}/models/{model}:streamGenerateContent?alt=sse", config)
+
+        self._model_cache[key] = handle
+        if len(self._model_cache) > self.model_cache_size:
+            self._model_cache.popitem(last=False)
+        return handle
+
+    async def stream_chat(self, messages: list, model: Optional[str] = None,
+                          model_arg: Optional[tuple] = None, **kwargs) -> AsyncGenerator[tuple[str, str], None]:
+        """流式对话
+
+        Args:
+            messages: 消息列表
+            model: 模型名称，为空时使用 api_url 中的模型
+            model_arg: (temperature, top_p, presence_penalty, frequency_penalty)
+
+        Yields:
+            tuple[str, str]: ("answer", 文本片段)
+        """
+        model = model or self.model_name
+        handle = self._model_handle(model, self._generation_config(model_arg))
+        prompt = self._format_messages(messages)
         try:
-            model = genai.GenerativeModel(self.model_name)
-            chat = model.start_chat(history=[])
-            
-            response = chat.send_message(
-                content=self._format_messages(messages),
-                stream=True,
-                generation_config=genai.GenerationConfig(
-                    max_output_tokens=2048,
-                    temperature=0.7
-                )
-            )
-            
-            async for chunk in response:
-                yield {
-                    "content": chunk.text,
-                    "finish_reason": chunk.candidates[0].finish_reason.value
-                }
-                
+            if self.backend == "sdk":
+                stream = self._stream_sdk(handle, prompt)
+            else:
+                stream = self._stream_http(handle, prompt)
+            async with aclosing(stream) as chunks:
+                async for text in chunks:
+                    if text:
+                        yield "answer", text
         except Exception as e:
-            self.logger.error(f"Gemini API错误: {str(e)}")
-            yield {"error": str(e)}
-            
+            UPSTREAM_ERRORS.labels("gemini", error_type(e)).inc()
+            logger.error(f"Gemini API错误: {str(e)}")
+
+    async def _stream_http(self, handle: tuple, prompt: str) -> AsyncGenerator[str, None]:
+        """通过共享连接池请求 SSE 接口
+
+        Args:
+            handle: (请求地址, generationConfig)
+            prompt: 扁平化后的对话内容
+
+        Yields:
+            str: 文本片段
+        """
+        url, generation_config = handle
+        headers = {
+            "x-goog-api-key": self.api_key,
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+        }
+        data = {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": generation_config,
+        }
+        async with aclosing(self._stream_events(headers, data, url=url)) as events:
+            async for event in events:
+                if not isinstance(event, dict):
+                    continue
+                if event.get("error"):
+                    logger.error(f"Gemini 返回错误: {event['error']}")
+                    UPSTREAM_ERRORS.labels("gemini", "stream_error").inc()
+                    return
+                for candidate in event.get("candidates") or ():
+                    for part in (candidate.get("content") or {}).get("parts") or ():
+                        text = part.get("text")
+                        if text:
+                            yield text
+
+    async def _stream_sdk(self, handle: Any, prompt: str) -> AsyncGenerator[str, None]:
+        """通过 google.generativeai 的异步接口流式生成
+
+        Args:
+            handle: GenerativeModel 实例
+            prompt: 扁平化后的对话内容
+
+        Yields:
+            str: 文本片段
+
+        Raises:
+            UpstreamTimeout: 超过当前阶段的首字节或空闲超时，或到达阶段截止时间；建连超时由 SDK 自行处理
+        """
+        budget = stage_budget.get() or StageBudget(StageTimeouts())
+        with start_span("upstream", KIND_CLIENT, {"client": self.__class__.__name__, "backend": "sdk"}) as span:
+            when, phase = budget.first_byte_at(time.monotonic())
+            response = await wait_upstream(handle.generate_content_async(prompt, stream=True), when, phase)
+            span.add_event("response_headers")
+            chunks = aiter(response)
+            while True:
+                try:
+                    chunk = await wait_upstream(anext(chunks), when, phase)
+                except StopAsyncIteration:
+                    break
+                for candidate in chunk.candidates:
+                    for part in candidate.content.parts:
+                        if part.text:
+                            yield part.text
+                when, phase = budget.idle_at()
+
     def _format_messages(self, messages: list) -> str:
         return "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
@@ -0,0 +1,85 @@
+"""请求对冲策略：首 token 迟迟未到时发出第二个相同请求"""
+import math
+from collections import deque
+
+
+class HedgePolicy:
+    """对冲策略与统计
+
+    对冲延迟默认为固定阈值 `delay`；设置了 `percentile` 且样本足够时，使用最近首 token
+    延迟的对应分位数（不低于 `min_delay`）。对冲请求总数不超过主请求数的 `budget` 比例
+    再加 `burst` 次余量，避免上游整体变慢时对冲把负载翻倍。
+    """
+
+    def __init__(self, delay: float = 2.0, percentile: float = 0, min_delay: float = 0.2,
+                 budget: float = 0.1, burst: int = 1, window: int = 256, min_samples: int = 20):
+        """初始化对冲策略
+
+        Args:
+            delay: 固定的对冲延迟（秒），样本不足或未设置分位数时使用
+            percentile: 使用最近首 token 延迟的该分位数作为对冲延迟，0 表示只用固定阈值
+            min_delay: 自适应对冲延迟的下限（秒）
+            budget: 对冲请求数占主请求数的最大比例
+            burst: 在比例之外允许的对冲次数，使启动初期也能对冲
+            window: 保留的首 token 延迟样本数
+            min_samples: 启用分位数前至少需要的样本数
+        """
+        self.fixed_delay = delay
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.budget = budget
+        self.burst = burst
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.fired = 0
+        self.wins = 0
+        self.budget_denied = 0
+
+    def delay(self) -> float:
+        """获取当前的对冲延迟
+
+        Returns:
+            float: 等待首 token 多少秒后发出对冲请求
+        """
+        if not self.percentile or len(self._samples) < self.min_samples:
+            return self.fixed_delay
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, math.ceil(len(ordered) * self.percentile / 100) - 1)
+        return max(self.min_delay, ordered[index])
+
+    def record(self, ttft: float) -> None:
+        """记录一次请求的首 token 延迟
+
+        Args:
+            ttft: 首 token 延迟（秒）
+        """
+        self._samples.append(ttft)
+
+    def try_fire(self) -> bool:
+        """预算允许时占用一次对冲名额
+
+        Returns:
+            bool: 是否允许发出对冲请求
+        """
+        if self.fired >= self.budget * self.requests + self.burst:
+            self.budget_denied += 1
+            return False
+        self.fired += 1
+        return True
+
+    def stats(self) -> dict:
+        """获取对冲统计
+
+        Returns:
+            dict: 当前对冲延迟、主请求数、对冲触发与获胜次数、因预算拒绝的次数
+        """
+        return {
+            "delay_ms": round(self.delay() * 1000, 1),
+            "budget": self.budget,
+            "requests": self.requests,
+            "fired": self.fired,
+            "wins": self.wins,
+            "budget_denied": self.budget_denied,
+            "fire_ratio": round(self.fired / self.requests, 4) if self.requests else 0.0,
+        }
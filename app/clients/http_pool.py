@@ -0,0 +1,114 @@
+"""共享 HTTP 连接池，供所有上游客户端复用"""
+import asyncio
+from typing import Optional
+from urllib.parse import urlsplit
+import aiohttp
+from app.utils.logger import logger
+
+
+class HttpPool:
+    """应用级 aiohttp 连接池
+
+    由应用生命周期持有并负责启动/关闭，DeepSeek 与 Gemini 客户端共享同一个
+    ClientSession，从而复用 DNS 解析结果以及已建立的 TCP/TLS 连接。
+    """
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 32,
+                 dns_cache_ttl: int = 300, keepalive_timeout: float = 60.0,
+                 connect_timeout: float = 10.0):
+        """初始化连接池配置
+
+        Args:
+            limit: 连接池总连接数上限，0 表示不限制
+            limit_per_host: 单个上游主机的连接数上限，0 表示不限制
+            dns_cache_ttl: DNS 缓存时间（秒）
+            keepalive_timeout: 空闲连接的保活时间（秒）
+            connect_timeout: 建立连接的超时时间（秒）
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def started(self) -> bool:
+        """连接池是否已启动且可用"""
+        return self._session is not None and not self._session.closed
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """获取共享的 ClientSession
+
+        Raises:
+            RuntimeError: 连接池尚未启动或已关闭
+        """
+        if not self.started:
+            raise RuntimeError("HttpPool 尚未启动")
+        return self._session
+
+    async def start(self) -> None:
+        """创建连接器与共享会话，重复调用无副作用"""
+        if self.started:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        # 流式响应可能持续数分钟，这里只限制建连时间，不设置总超时
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        logger.info(
+            f"HTTP 连接池已启动 | 总连接上限: {self.limit} | 单主机上限: {self.limit_per_host} | "
+            f"DNS缓存: {self.dns_cache_ttl}s | 保活: {self.keepalive_timeout}s"
+        )
+
+    async def warmup(self, urls: list[str], connections_per_host: int = 1) -> None:
+        """预热连接，提前完成 DNS 解析和 TCP/TLS 握手
+
+        对每个不同的上游源站并发发送 HEAD 请求，响应读完后连接会留在池中
+        供后续请求复用。预热失败只记录警告，不影响启动。
+
+        Args:
+            urls: 上游 API 地址列表
+            connections_per_host: 每个源站预热的连接数
+        """
+        if connections_per_host <= 0:
+            return
+        origins = []
+        for url in urls:
+            if not url:
+                continue
+            parts = urlsplit(url)
+            if not parts.scheme or not parts.netloc:
+                continue
+            origin = f"{parts.scheme}://{parts.netloc}/"
+            if origin not in origins:
+                origins.append(origin)
+
+        async def _warm(origin: str) -> None:
+            try:
+                async with self.session.head(
+                    origin,
+                    allow_redirects=False,
+                    timeout=aiohttp.ClientTimeout(total=self.connect_timeout * 2),
+                ) as response:
+                    await response.read()
+            except Exception as e:
+                logger.warning(f"连接预热失败 {origin}: {e}")
+
+        await asyncio.gather(*(
+            _warm(origin) for origin in origins for _ in range(connections_per_host)
+        ))
+        logger.info(f"连接预热完成 | 源站: {origins} | 每源站连接数: {connections_per_host}")
+
+    async def close(self) -> None:
+        """关闭共享会话并释放所有连接"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("HTTP 连接池已关闭")
+        self._session = None
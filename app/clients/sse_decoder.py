@@ -0,0 +1,112 @@
+"""增量式 SSE 解码器，按字节缓冲处理任意分片的上游流"""
+import json
+from typing import Any, Callable, Optional
+from app.utils.logger import logger
+
+try:
+    import orjson
+    _default_loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:  # orjson 为可选依赖
+    _default_loads = json.loads
+    JSON_BACKEND = "json"
+
+
+class _Done:
+    """流结束标记（对应 `data: [DONE]`）"""
+
+    def __repr__(self) -> str:
+        return "SSE_DONE"
+
+
+SSE_DONE = _Done()
+
+
+class SSEDecoder:
+    """增量 SSE 解码器
+
+    维护一个滚动的字节缓冲区，只在遇到完整的事件（空行分隔）时才解析，
+    因此 JSON 帧或多字节 UTF-8 字符被网络拆分到多个 chunk 时也能正确还原。
+    每次 `feed` 只在末尾丢弃一次已消费的前缀，不会反复拷贝整个缓冲区。
+    """
+
+    def __init__(self, parse_json: bool = True, loads: Optional[Callable[[bytes], Any]] = None):
+        """初始化解码器
+
+        Args:
+            parse_json: 是否将每个事件的 data 解析为 JSON，为 False 时返回原始字节
+            loads: 自定义 JSON 解析函数，默认优先使用 orjson
+        """
+        self.parse_json = parse_json
+        self._loads = loads or _default_loads
+        self._buf = bytearray()
+        self._scan = 0  # 缓冲区中已确认不含换行符的前缀长度
+        self._data: list[bytearray] = []
+
+    def feed(self, chunk: bytes) -> list[Any]:
+        """喂入一段原始字节，返回其中所有已完整的事件
+
+        Args:
+            chunk: 上游返回的原始字节，可在任意位置被截断
+
+        Returns:
+            list[Any]: 解析后的事件数据；`data: [DONE]` 以 `SSE_DONE` 表示
+        """
+        buf = self._buf
+        buf += chunk
+        events = []
+        start = 0
+        search_from = self._scan
+        while True:
+            nl = buf.find(b"\n", search_from)
+            if nl < 0:
+                break
+            end = nl
+            if end > start and buf[end - 1] == 0x0D:  # \r\n
+                end -= 1
+            if end == start:
+                # 空行：一个事件结束
+                if self._data:
+                    self._dispatch(events)
+            elif buf.startswith(b"data:", start):
+                value_start = start + 5
+                if value_start < end and buf[value_start] == 0x20:
+                    value_start += 1
+                self._data.append(buf[value_start:end])
+            # 其他字段（event/id/retry）和注释行直接忽略
+            start = search_from = nl + 1
+
+        if start:
+            del buf[:start]
+        self._scan = len(buf)
+        return events
+
+    def flush(self) -> list[Any]:
+        """流结束时调用，处理末尾缺少空行分隔的事件
+
+        Returns:
+            list[Any]: 剩余的事件数据
+        """
+        events = []
+        if self._buf:
+            events.extend(self.feed(b"\n"))
+        if self._data:
+            self._dispatch(events)
+        self._buf.clear()
+        self._scan = 0
+        return events
+
+    def _dispatch(self, events: list) -> None:
+        """将当前累积的 data 行组装为一个事件"""
+        data = self._data[0] if len(self._data) == 1 else b"\n".join(self._data)
+        self._data = []
+        if data == b"[DONE]":
+            events.append(SSE_DONE)
+            return
+        if not self.parse_json:
+            events.append(bytes(data))
+            return
+        try:
+            events.append(self._loads(data))
+        except ValueError as e:
+            logger.error(f"SSE 事件 JSON 解析错误: {e}")
@@ -0,0 +1,51 @@
+"""上游请求的分阶段超时：建连、首字节、分块间空闲，以及所在阶段的截止时间"""
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class StageTimeouts:
+    """单个上游阶段的超时（秒），0 表示不限制"""
+
+    connect: float = 0  # 建立 TCP/TLS 连接
+    first_byte: float = 0  # 发出请求到收到响应体的第一个分块
+    idle: float = 0  # 相邻两个分块之间
+
+
+@dataclass(frozen=True)
+class StageBudget:
+    """一次阶段调用可用的超时与截止时间"""
+
+    timeouts: StageTimeouts
+    deadline: Optional[float] = None  # time.monotonic() 时间点，None 表示不限制
+
+    def first_byte_at(self, start: float) -> tuple[Optional[float], str]:
+        """等待首字节的截止时间点
+
+        Args:
+            start: 发出请求的时间点
+
+        Returns:
+            tuple[Optional[float], str]: (截止时间点, 超时阶段名)，不限制时时间点为 None
+        """
+        return self._cap(start + self.timeouts.first_byte if self.timeouts.first_byte else None, "first_byte")
+
+    def idle_at(self) -> tuple[Optional[float], str]:
+        """等待下一个分块的截止时间点
+
+        Returns:
+            tuple[Optional[float], str]: (截止时间点, 超时阶段名)，不限制时时间点为 None
+        """
+        return self._cap(time.monotonic() + self.timeouts.idle if self.timeouts.idle else None, "idle")
+
+    def _cap(self, when: Optional[float], phase: str) -> tuple[Optional[float], str]:
+        if self.deadline is not None and (when is None or self.deadline <= when):
+            return self.deadline, "deadline"
+        return when, phase
+
+
+# 当前阶段的超时预算，由流水线的阶段任务在调用客户端前设置，客户端在每次等待上游时读取；
+# 未设置时不限制（只受连接池的建连超时约束）
+stage_budget: ContextVar[Optional[StageBudget]] = ContextVar("stage_budget", default=None)
@@ -1 +1,13 @@
-__all__ = ["DeepGenimi"]
+from .deepgenimi import DeepGenimi
+from .reasoning_cache import ReasoningCache, CacheBackend, SQLiteCacheBackend
+from .single_flight import SingleFlight
+from .frame_batcher import FrameBatcher
+from .admission import AdmissionController, AdmissionPermit, OverloadedError
+from .reasoning_compactor import ReasoningCompactor, CompactionResult
+from .history_window import HistoryWindow
+from .reasoning_router import ReasoningRouter, RoutingDecision
+from .deadline import Deadline
+
+__all__ = ["DeepGenimi", "ReasoningCache", "CacheBackend", "SQLiteCacheBackend", "SingleFlight", "FrameBatcher",
+           "AdmissionController", "AdmissionPermit", "OverloadedError", "ReasoningCompactor", "CompactionResult",
+           "HistoryWindow", "ReasoningRouter", "RoutingDecision", "Deadline"]
@@ -0,0 +1,295 @@
+"""准入控制：按阶段限制上游并发，排队有上限，超载时快速拒绝"""
+import asyncio
+from collections import deque
+from typing import Optional
+from app.utils.logger import logger
+
+
+class OverloadedError(Exception):
+    """服务超载，请求未被接纳"""
+
+    def __init__(self, message: str, retry_after: int = 1, status: int = 429):
+        """初始化异常
+
+        Args:
+            message: 错误信息
+            retry_after: 建议客户端重试前等待的秒数
+            status: 返回给客户端的 HTTP 状态码，进程排空时为 503
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status = status
+
+
+class StageLimiter:
+    """单个上游阶段的并发限制器，记录进行中与排队中的数量
+
+    名额不足时按租户分别排队。每释放一个名额，就交给排队租户中「进行中数量 / 权重」
+    最小的那个，同一租户内按先来先服务，因此请求量大的租户不会挤占其他租户的名额。
+    """
+
+    def __init__(self, name: str, max_concurrency: int = 0):
+        """初始化限制器
+
+        Args:
+            name: 阶段名称，用于日志和统计
+            max_concurrency: 最大并发数，0 表示不限制
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_in_flight = 0
+        self._queues: dict[str, deque[asyncio.Future]] = {}
+        self._weights: dict[str, float] = {}
+        self._tenant_in_flight: dict[str, int] = {}
+
+    def full(self) -> bool:
+        """是否已达到并发上限"""
+        return self.max_concurrency > 0 and (self.in_flight >= self.max_concurrency or self.waiting > 0)
+
+    async def acquire(self, timeout: Optional[float] = None, tenant: str = "default", weight: float = 1.0) -> None:
+        """获取一个并发名额
+
+        Args:
+            timeout: 最长等待时间（秒），None 表示一直等待
+            tenant: 租户名称
+            weight: 租户权重
+
+        Raises:
+            TimeoutError: 等待超时
+        """
+        if not self.full():
+            # 有空闲名额时不创建计时器
+            self._grant(tenant)
+            return
+
+        self._weights[tenant] = weight
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(tenant, deque()).append(waiter)
+        self.waiting += 1
+        try:
+            async with asyncio.timeout(timeout):
+                await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # 名额已分配，但等待方在被唤醒前超时或被取消，归还名额
+                self.release(tenant)
+            else:
+                self._discard(tenant, waiter)
+            raise
+
+    def release(self, tenant: str = "default") -> None:
+        """归还一个并发名额
+
+        Args:
+            tenant: 租户名称，与获取时一致
+        """
+        self.in_flight -= 1
+        remaining = self._tenant_in_flight.get(tenant, 0) - 1
+        if remaining > 0:
+            self._tenant_in_flight[tenant] = remaining
+        else:
+            self._tenant_in_flight.pop(tenant, None)
+        self._dispatch()
+
+    def _grant(self, tenant: str) -> None:
+        self.in_flight += 1
+        self._tenant_in_flight[tenant] = self._tenant_in_flight.get(tenant, 0) + 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _dispatch(self) -> None:
+        """把空闲名额分给排队的租户"""
+        while self._queues and self.in_flight < self.max_concurrency:
+            tenant = min(
+                self._queues,
+                key=lambda name: self._tenant_in_flight.get(name, 0) / self._weights.get(name, 1.0),
+            )
+            queue = self._queues[tenant]
+            waiter = queue.popleft()
+            if not queue:
+                del self._queues[tenant]
+            self.waiting -= 1
+            if waiter.done():
+                # 等待方已被取消，尚未执行到清理逻辑
+                continue
+            self._grant(tenant)
+            waiter.set_result(None)
+
+    def _discard(self, tenant: str, waiter: asyncio.Future) -> None:
+        """移除放弃等待的请求"""
+        queue = self._queues.get(tenant)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self.waiting -= 1
+        if not queue:
+            del self._queues[tenant]
+
+    def stats(self) -> dict:
+        """获取阶段统计
+
+        Returns:
+            dict: 并发上限、进行中、排队中及峰值并发数，以及各租户进行中与排队数
+        """
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "peak_in_flight": self.peak_in_flight,
+            "tenants": {
+                name: {"in_flight": self._tenant_in_flight.get(name, 0), "waiting": len(self._queues.get(name, ()))}
+                for name in self._tenant_in_flight.keys() | self._queues.keys()
+            },
+        }
+
+
+class AdmissionPermit:
+    """一次请求持有的准入许可
+
+    接纳时已持有 DeepSeek 阶段名额；推理交接后释放 DeepSeek 名额，再获取 Gemini 名额。
+    跳过推理的请求不占用 DeepSeek 名额，接纳时直接获取 Gemini 名额。
+    所有释放操作都是幂等的。
+    """
+
+    def __init__(self, controller: "AdmissionController", tenant: str = "default", weight: float = 1.0,
+                 deepseek: bool = True):
+        self._controller = controller
+        self.tenant = tenant
+        self.weight = weight
+        self._deepseek_held = deepseek
+        self._gemini_held = False
+        self.claimed = False  # 是否已由流水线接管
+
+    def claim(self) -> None:
+        """标记许可已由流水线接管，此后由流水线负责释放"""
+        self.claimed = True
+
+    def release_deepseek(self) -> None:
+        """释放 DeepSeek 阶段名额"""
+        if self._deepseek_held:
+            self._deepseek_held = False
+            self._controller.deepseek.release(self.tenant)
+
+    async def acquire_gemini(self, timeout: Optional[float] = None) -> None:
+        """获取 Gemini 阶段名额，名额不足时等待
+
+        Args:
+            timeout: 最长等待时间（秒），None 表示一直等待
+
+        Raises:
+            TimeoutError: 等待超时
+        """
+        if not self._gemini_held:
+            await self._controller.gemini.acquire(timeout, tenant=self.tenant, weight=self.weight)
+            self._gemini_held = True
+
+    def release(self) -> None:
+        """释放持有的所有名额"""
+        self.release_deepseek()
+        if self._gemini_held:
+            self._gemini_held = False
+            self._controller.gemini.release(self.tenant)
+
+    def release_unclaimed(self) -> None:
+        """请求结束时调用：许可未被流水线接管（合并请求或流水线未启动）时释放"""
+        if not self.claimed:
+            self.release()
+
+
+class AdmissionController:
+    """准入控制器
+
+    每个请求在开始响应前先获取 DeepSeek 阶段名额，名额不足时按租户公平排队；排队人数达到上限、
+    等待超过 `max_queue_time`，或 Gemini 阶段排队已满时直接拒绝，由调用方返回 429。
+    Gemini 名额在推理交接时获取，此时响应已开始，因此只等待不拒绝。
+    路由为跳过推理的请求不经过 DeepSeek 阶段，以同样的排队与拒绝规则直接获取 Gemini 名额，
+    DeepSeek 阶段满载时不受影响。
+    """
+
+    def __init__(self, deepseek_concurrency: int = 0, gemini_concurrency: int = 0,
+                 max_queue: int = 0, max_queue_time: float = 10, retry_after: int = 1):
+        """初始化控制器
+
+        Args:
+            deepseek_concurrency: DeepSeek 阶段最大并发数，0 表示不限制
+            gemini_concurrency: Gemini 阶段最大并发数，0 表示不限制
+            max_queue: 每个阶段最多排队的请求数，0 表示不排队，名额不足时直接拒绝
+            max_queue_time: 排队的最长时间（秒）
+            retry_after: 拒绝时建议客户端等待的秒数
+        """
+        self.deepseek = StageLimiter("deepseek", deepseek_concurrency)
+        self.gemini = StageLimiter("gemini", gemini_concurrency)
+        self.max_queue = max_queue
+        self.max_queue_time = max_queue_time
+        self.retry_after = retry_after
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.draining = False
+
+    def begin_drain(self) -> None:
+        """进程即将退出：此后的请求直接以 503 拒绝，已接纳的请求照常完成"""
+        self.draining = True
+
+    async def admit(self, tenant: str = "default", weight: float = 1.0, skip_reasoning: bool = False) -> AdmissionPermit:
+        """接纳一个请求
+
+        Args:
+            tenant: 租户名称，排队时按租户公平分配名额
+            weight: 租户权重
+            skip_reasoning: 请求已路由为跳过推理，直接获取 Gemini 阶段名额
+
+        Returns:
+            AdmissionPermit: 持有 DeepSeek 阶段名额的许可，skip_reasoning 时持有 Gemini 阶段名额
+
+        Raises:
+            OverloadedError: 排队已满、排队超时或进程正在排空
+        """
+        if self.draining:
+            self.rejected += 1
+            raise OverloadedError("Server is shutting down", self.retry_after, status=503)
+        if self.gemini.full() and self.gemini.waiting >= self.max_queue:
+            self._reject("Gemini queue is full")
+        if skip_reasoning:
+            permit = AdmissionPermit(self, tenant, weight, deepseek=False)
+            stage = self.gemini
+        else:
+            if self.deepseek.full() and self.deepseek.waiting >= self.max_queue:
+                self._reject("DeepSeek queue is full")
+            permit = AdmissionPermit(self, tenant, weight)
+            stage = self.deepseek
+        try:
+            await stage.acquire(self.max_queue_time, tenant, weight)
+        except TimeoutError:
+            self.timed_out += 1
+            self._reject(f"queued longer than {self.max_queue_time}s")
+        if skip_reasoning:
+            permit._gemini_held = True
+        self.admitted += 1
+        return permit
+
+    def _reject(self, reason: str) -> None:
+        self.rejected += 1
+        logger.warning(
+            f"请求被拒绝: {reason} | DeepSeek 进行中/排队: {self.deepseek.in_flight}/{self.deepseek.waiting} | "
+            f"Gemini 进行中/排队: {self.gemini.in_flight}/{self.gemini.waiting}"
+        )
+        raise OverloadedError(f"Server overloaded: {reason}", self.retry_after)
+
+    def stats(self) -> dict:
+        """获取准入统计
+
+        Returns:
+            dict: 各阶段进行中与排队数，以及累计接纳、拒绝和超时次数
+        """
+        return {
+            "deepseek": self.deepseek.stats(),
+            "gemini": self.gemini.stats(),
+            "max_queue": self.max_queue,
+            "max_queue_time": self.max_queue_time,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "draining": self.draining,
+        }
@@ -0,0 +1,267 @@
+"""离线批处理：读取 JSONL 请求，以有限并发运行流水线，按完成顺序输出 JSONL 结果"""
+import asyncio
+import json
+import os
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Optional
+from app.utils.logger import logger
+from .admission import AdmissionPermit, OverloadedError
+from .deepgenimi import DeepGenimi
+
+
+async def iter_jsonl(chunks: AsyncIterable[bytes]) -> AsyncIterator[dict]:
+    """将任意分片的字节流按行解析为 JSON 对象，跳过空行
+
+    无法解析的行不会中断整个批次，而是产出 `{"_invalid": 错误信息}`，由执行器记为失败项。
+
+    Args:
+        chunks: 字节流，例如请求体或文件内容
+
+    Yields:
+        dict: 每一行的 JSON 对象
+    """
+    buf = b""
+    async for chunk in chunks:
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if buf.strip():
+        yield _parse_line(buf)
+
+
+def _parse_line(line: bytes) -> dict:
+    try:
+        item = json.loads(line)
+    except ValueError as e:
+        return {"_invalid": f"Invalid JSON: {e}"}
+    return item if isinstance(item, dict) else {"_invalid": "Each line must be a JSON object"}
+
+
+class BatchProgress:
+    """批处理进度文件：每完成一项追加一行结果，重新运行时跳过已成功的项
+
+    结果文件本身就是进度记录，中断后以同一路径重新运行即可续跑；失败的项会重新执行。
+    打开时对文件加排他锁，多个进程不会同时写入同一个批次。
+    构造时会读取已有结果，在事件循环中应通过 asyncio.to_thread 创建；追加的结果由后台
+    写入任务在线程中批量写入，不阻塞事件循环。
+    """
+
+    def __init__(self, path: str):
+        """初始化进度文件
+
+        Args:
+            path: 结果文件路径，不存在时创建
+
+        Raises:
+            BlockingIOError: 另一个进程正在运行同一批次
+        """
+        self.path = path
+        self.completed: dict[str, str] = {}
+        self._pending: list[str] = []
+        self._writer: Optional[asyncio.Task] = None
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._file.close()
+                raise
+        if os.path.getsize(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        result = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 中断时可能留下写了一半的最后一行
+                        continue
+                    if result.get("error") is None:
+                        self.completed[result["custom_id"]] = line.rstrip("\n")
+
+    def append(self, line: str) -> None:
+        """追加一行结果，由后台写入任务写入磁盘缓冲，需在事件循环中调用
+
+        Args:
+            line: 序列化后的结果，不含换行符
+        """
+        self._pending.append(line)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_pending())
+
+    async def _write_pending(self) -> None:
+        """写入期间新追加的结果在下一轮一起写入"""
+        while self._pending:
+            lines, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._write, lines)
+            except Exception as e:
+                # 结果已返回给调用方，只是没有记入进度，续跑时这些项会重新执行
+                logger.error(f"写入批处理进度失败 {self.path}: {e}")
+
+    def _write(self, lines: list[str]) -> None:
+        self._file.write("".join(line + "\n" for line in lines))
+        self._file.flush()
+
+    async def flush(self) -> None:
+        """等待已追加的结果全部写入磁盘缓冲"""
+        if self._writer is not None:
+            await asyncio.shield(self._writer)
+
+    def close(self) -> None:
+        """关闭文件，仍有结果在写入时由写入任务结束后关闭"""
+        writer = self._writer
+        if writer is not None and not writer.done():
+            writer.add_done_callback(lambda _: self._file.close())
+        else:
+            self._file.close()
+
+
+class BatchRunner:
+    """批处理执行器
+
+    直接调用非流式路径，不经过 SSE 编码；同时进行的请求数不超过 `concurrency`，
+    结果按完成顺序产出。每一项仍通过准入控制获取上游名额，排队已满时等待后重试而不是失败。
+    """
+
+    def __init__(self, deep_genimi: DeepGenimi, deepseek_model: str, gemini_model: str,
+                 parse_params: Callable[[dict], tuple], concurrency: int = 8,
+                 admit: Optional[Callable[..., Awaitable[AdmissionPermit]]] = None):
+        """初始化执行器
+
+        Args:
+            deep_genimi: 流水线实例
+            deepseek_model: DeepSeek 模型名称
+            gemini_model: Gemini 模型名称
+            parse_params: 从请求体提取 (temperature, top_p, presence_penalty, frequency_penalty) 的函数
+            concurrency: 同时进行的请求数上限
+            admit: 获取准入许可的函数，以关键字参数 skip_reasoning 调用，为 None 时不经过准入控制
+        """
+        self.deep_genimi = deep_genimi
+        self.deepseek_model = deepseek_model
+        self.gemini_model = gemini_model
+        self.parse_params = parse_params
+        self.concurrency = max(1, concurrency)
+        self.admit = admit
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+
+    async def run(self, items: AsyncIterable[dict], progress: Optional[BatchProgress] = None) -> AsyncIterator[str]:
+        """执行一批请求
+
+        每一项可以是 `{"custom_id": ..., "body": {chat 请求}}`，也可以直接是 chat 请求
+        （此时用 `custom_id` 或 `id` 字段标识，缺省为行号）。
+
+        Args:
+            items: 请求对象流，按需读取，读取速度受并发窗口限制
+            progress: 进度文件，提供时先输出已完成的结果并跳过这些项，新结果同时追加到文件
+
+        Yields:
+            str: 每项结果的 JSON 字符串，按完成顺序
+        """
+        completed = progress.completed if progress is not None else {}
+        for line in completed.values():
+            yield line
+
+        pending: set[asyncio.Task] = set()
+        try:
+            index = 0
+            async for item in items:
+                index += 1
+                custom_id = str(item.get("custom_id") or item.get("id") or f"line-{index}")
+                if custom_id in completed:
+                    self.skipped += 1
+                    continue
+                if "_invalid" in item:
+                    yield self._record({"custom_id": custom_id, "response": None,
+                                        "error": {"message": item["_invalid"]}}, progress)
+                    continue
+                if len(pending) >= self.concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield self._record(task.result(), progress)
+                pending.add(asyncio.create_task(self._run_one(custom_id, item.get("body", item))))
+                self.submitted += 1
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield self._record(task.result(), progress)
+        finally:
+            # 客户端断开或调用方停止读取时取消剩余请求，已完成的结果已写入进度文件
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def _record(self, result: dict, progress: Optional[BatchProgress]) -> str:
+        if result["error"] is None:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        line = json.dumps(result, ensure_ascii=False)
+        if progress is not None:
+            progress.append(line)
+        return line
+
+    async def _run_one(self, custom_id: str, body: dict) -> dict:
+        """执行单项请求，异常转为结果中的 error 字段"""
+        try:
+            model_arg = self.parse_params(body)
+            # 先决定推理路由，跳过推理的项不占用 DeepSeek 阶段名额
+            decision = self.deep_genimi.route(body["messages"], body.get("reasoning_effort"))
+            permit = await self._admit(decision.route == "skip")
+            try:
+                response = await self.deep_genimi.chat_completions_without_stream(
+                    messages=body["messages"],
+                    model_arg=model_arg,
+                    deepseek_model=self.deepseek_model,
+                    gemini_model=self.gemini_model,
+                    permit=permit,
+                    reasoning_effort=body.get("reasoning_effort"),
+                    decision=decision,
+                )
+            finally:
+                if permit is not None:
+                    permit.release_unclaimed()
+            if not response["choices"][0]["message"]["content"]:
+                # 上游失败时流水线只记录日志并返回空回答，标记为失败以便续跑时重试
+                return {"custom_id": custom_id, "response": None, "error": {"message": "Empty response from upstream"}}
+            return {"custom_id": custom_id, "response": response, "error": None}
+        except Exception as e:
+            logger.error(f"批处理项 {custom_id} 失败: {e}")
+            return {"custom_id": custom_id, "response": None, "error": {"message": str(e)}}
+
+    async def _admit(self, skip_reasoning: bool = False) -> Optional[AdmissionPermit]:
+        """获取准入许可，超载时按建议的等待时间重试"""
+        if self.admit is None:
+            return None
+        while True:
+            try:
+                return await self.admit(skip_reasoning=skip_reasoning)
+            except OverloadedError as e:
+                if e.status == 503:
+                    # 进程正在排空，本项记为失败，续跑时重新执行
+                    raise
+                await asyncio.sleep(e.retry_after)
+
+    def stats(self) -> dict:
+        """获取批处理统计
+
+        Returns:
+            dict: 提交、成功、失败及因已完成而跳过的项数
+        """
+        return {
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+        }
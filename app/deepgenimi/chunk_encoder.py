@@ -0,0 +1,66 @@
+"""SSE 输出帧编码器，预先计算每个请求固定不变的字节前后缀"""
+import json
+from json.encoder import encode_basestring_ascii
+
+
+class ChunkEncoder:
+    """chat.completion.chunk 帧编码器
+
+    每个 token 只需对增量文本做一次 JSON 转义，其余字段（id、created、model 等）
+    在请求开始时拼好。输出与 `json.dumps(response)` 逐字节一致。
+    """
+
+    def __init__(self, chat_id: str, created: int, reasoning_model: str, answer_model: str):
+        """初始化编码器
+
+        Args:
+            chat_id: 会话ID
+            created: 创建时间戳
+            reasoning_model: 推理阶段（DeepSeek）的模型名称
+            answer_model: 回答阶段（Gemini）的模型名称
+        """
+        head = (
+            f'data: {{"id": {json.dumps(chat_id)}, "object": "chat.completion.chunk", '
+            f'"created": {json.dumps(created)}, "model": '
+        )
+        delta = ', "choices": [{"index": 0, "delta": {"role": "assistant", '
+        self._reasoning_prefix = head + json.dumps(reasoning_model) + delta + '"reasoning_content": '
+        self._reasoning_suffix = ', "content": ""}}]}\n\n'
+        self._answer_prefix = head + json.dumps(answer_model) + delta + '"content": '
+        self._answer_suffix = '}}]}\n\n'
+
+    def reasoning(self, text: str) -> bytes:
+        """编码推理片段
+
+        Args:
+            text: 推理文本
+
+        Returns:
+            bytes: 完整的 SSE 帧
+        """
+        return (self._reasoning_prefix + encode_basestring_ascii(text) + self._reasoning_suffix).encode("ascii")
+
+    def answer(self, text: str) -> bytes:
+        """编码回答片段
+
+        Args:
+            text: 回答文本
+
+        Returns:
+            bytes: 完整的 SSE 帧
+        """
+        return (self._answer_prefix + encode_basestring_ascii(text) + self._answer_suffix).encode("ascii")
+
+    def encode(self, content_type: str, text: str) -> bytes:
+        """按内容类型编码
+
+        Args:
+            content_type: "reasoning" 或 "answer"
+            text: 文本
+
+        Returns:
+            bytes: 完整的 SSE 帧
+        """
+        if content_type == "reasoning":
+            return self.reasoning(text)
+        return self.answer(text)
@@ -0,0 +1,36 @@
+"""请求截止时间：整个请求的时间预算及其在推理与回答两个阶段间的分配"""
+import time
+from typing import Optional
+
+
+class Deadline:
+    """一个请求的截止时间
+
+    从请求到达时开始计时，推理阶段最多使用总预算的 `reasoning_share`，推理提前结束时
+    剩余的时间全部留给 Gemini 阶段。
+    """
+
+    def __init__(self, timeout: float = 0, reasoning_share: float = 0.6):
+        """初始化截止时间
+
+        Args:
+            timeout: 总预算（秒），0 表示不限制
+            reasoning_share: 推理阶段可用的预算比例
+        """
+        self.timeout = timeout
+        self.reasoning_share = reasoning_share
+        self.start = time.monotonic()
+        self.at: Optional[float] = self.start + timeout if timeout > 0 else None
+
+    @property
+    def reasoning_at(self) -> Optional[float]:
+        """推理阶段的截止时间点（time.monotonic()），不限制时为 None"""
+        if self.at is None:
+            return None
+        return self.start + self.timeout * self.reasoning_share
+
+    def remaining(self) -> Optional[float]:
+        """剩余的预算（秒），不限制时为 None"""
+        if self.at is None:
+            return None
+        return max(0.0, self.at - time.monotonic())
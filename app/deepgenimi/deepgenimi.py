@@ -1,10 +1,37 @@
 """DeepClaude 服务，用于协调 DeepSeek 和 Gemini API 的调用"""
-import json
 import time
 import asyncio
-from typing import AsyncGenerator
-from app.utils.logger import logger
-from app.clients import DeepSeekClient, GeminiClient
+import itertools
+from contextlib import aclosing
+from typing import AsyncGenerator, Optional
+from app.utils.logger import logger, token_trace, sample_token_trace
+from app.utils.tokens import estimate_tokens, estimate_message_tokens, estimate_tokens_from_size
+from app.utils import metrics
+from app.utils.tracing import Span, NOOP_SPAN, current_span
+from app.clients import (DeepSeekClient, GeminiClient, HttpPool, EndpointPool, HedgePolicy, StageTimeouts,
+                         StageBudget, UpstreamTimeout, stage_budget)
+from .stream_buffer import StreamBuffer, text_size
+from .chunk_encoder import ChunkEncoder
+from .frame_batcher import FrameBatcher, drain
+from .reasoning_cache import ReasoningCache, make_request_key
+from .single_flight import SingleFlight
+from .admission import AdmissionPermit
+from .reasoning_compactor import ReasoningCompactor
+from .history_window import HistoryWindow
+from .reasoning_router import ReasoningRouter, RoutingDecision
+from .deadline import Deadline
+
+
+# 常用的带标签子指标，避免每次记录时查找
+_ACTIVE_STREAM = metrics.ACTIVE_REQUESTS.labels("stream")
+_ACTIVE_NON_STREAM = metrics.ACTIVE_REQUESTS.labels("non_stream")
+_STREAM_DURATION = metrics.STREAM_DURATION.labels("stream")
+_NON_STREAM_DURATION = metrics.STREAM_DURATION.labels("non_stream")
+
+# 未配置路由器时所有请求都走完整的两阶段流程
+_FULL_REASONING = RoutingDecision("full", "default")
+# 跳过推理时交给 Gemini 阶段的标记，与推理失败时的空字符串区分
+_SKIPPED = object()
 
 
 class DeepGenimi:
@@ -12,25 +39,129 @@ class DeepGenimi:
 
     def __init__(self, deepseek_api_key: str, gemini_api_key: str, 
                  deepseek_api_url: str = "https://api.deepseek.com/v1/chat/completions", 
-                 gemini_api_url: str = "https://api.gemini.com/v1/messages",
+                 gemini_api_url: str = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:streamGenerateContent",
                  gemini_provider: str = "gemini",
-                 is_origin_reasoning: bool = True):
+                 is_origin_reasoning: bool = True,
+                 gemini_backend: str = "http",
+                 http_pool: Optional[HttpPool] = None,
+                 max_buffered_frames: int = 512,
+                 max_buffered_bytes: int = 256 * 1024,
+                 reasoning_cache: Optional[ReasoningCache] = None,
+                 cache_replay_chunk_size: int = 256,
+                 single_flight: Optional[SingleFlight] = None,
+                 frame_batcher: Optional[FrameBatcher] = None,
+                 deepseek_endpoints: Optional[EndpointPool] = None,
+                 deepseek_max_attempts: int = 3,
+                 deepseek_hedge: Optional[HedgePolicy] = None,
+                 reasoning_compactor: Optional[ReasoningCompactor] = None,
+                 history_window: Optional[HistoryWindow] = None,
+                 reasoning_router: Optional[ReasoningRouter] = None,
+                 request_timeout: float = 0,
+                 max_request_timeout: float = 0,
+                 reasoning_deadline_share: float = 0.6,
+                 deepseek_timeouts: Optional[StageTimeouts] = None,
+                 gemini_timeouts: Optional[StageTimeouts] = None):
         """初始化 API 客户端
         
         Args:
             deepseek_api_key: DeepSeek API密钥
             gemini_api_key: Gemini API密钥
+            gemini_backend: Gemini 调用方式，"http" 或 "sdk"
+            http_pool: 共享连接池，由应用生命周期负责启动和关闭
+            max_buffered_frames: 每个请求输出缓冲的最大帧数，0 表示不限制
+            max_buffered_bytes: 每个请求输出缓冲的最大字节数，0 表示不限制
+            reasoning_cache: 推理内容缓存，为 None 时不启用
+            cache_replay_chunk_size: 命中缓存时回放推理内容的分块字符数
+            single_flight: 相同请求合并器，为 None 时每个请求独立调用上游
+            frame_batcher: 输出帧合并器，为 None 时每个增量单独成帧
+            deepseek_endpoints: 多个兼容的 DeepSeek 端点，为 None 时只使用 deepseek_api_url
+            deepseek_max_attempts: DeepSeek 首 token 之前失败时最多尝试的端点数
+            deepseek_hedge: DeepSeek 阶段的对冲策略，为 None 时不对冲
+            reasoning_compactor: 交给 Gemini 前的推理内容压缩器，为 None 时原样传递
+            history_window: 按模型上下文预算裁剪历史消息，为 None 时两个阶段都发送完整历史
+            reasoning_router: 按请求决定跳过、截断或完整推理，为 None 时总是完整推理
+            request_timeout: 请求的默认截止时间（秒），0 表示不限制
+            max_request_timeout: 客户端可指定的最长截止时间（秒），0 表示不限制
+            reasoning_deadline_share: 推理阶段可用的截止时间比例，超出时以已收到的推理交接
+            deepseek_timeouts: DeepSeek 阶段的建连、首字节与空闲超时，为 None 时不限制
+            gemini_timeouts: Gemini 阶段的建连、首字节与空闲超时，为 None 时不限制
         """
-        self.deepseek_client = DeepSeekClient(deepseek_api_key, deepseek_api_url)
-        self.gemini_client = GeminiClient(gemini_api_key, gemini_api_url)
+        self.deepseek_client = DeepSeekClient(deepseek_api_key, deepseek_api_url, http_pool=http_pool,
+                                              endpoint_pool=deepseek_endpoints,
+                                              max_attempts=deepseek_max_attempts,
+                                              hedge=deepseek_hedge)
+        self.gemini_client = GeminiClient(gemini_api_key, gemini_api_url, http_pool=http_pool,
+                                          provider=gemini_provider, backend=gemini_backend)
         self.is_origin_reasoning = is_origin_reasoning
+        self.max_buffered_frames = max_buffered_frames
+        self.max_buffered_bytes = max_buffered_bytes
+        self.reasoning_cache = reasoning_cache
+        self.cache_replay_chunk_size = cache_replay_chunk_size
+        self.single_flight = single_flight
+        self.frame_batcher = frame_batcher
+        self.reasoning_compactor = reasoning_compactor
+        self.history_window = history_window
+        self.reasoning_router = reasoning_router
+        self.request_timeout = request_timeout
+        self.max_request_timeout = max_request_timeout
+        self.reasoning_deadline_share = reasoning_deadline_share
+        self.deepseek_timeouts = deepseek_timeouts or StageTimeouts()
+        self.gemini_timeouts = gemini_timeouts or StageTimeouts()
+        # 进行中请求的输出缓冲区，用于查询缓冲统计
+        self._active_buffers: dict[int, StreamBuffer] = {}
+        self._request_seq = itertools.count()
+
+    def new_deadline(self, timeout: Optional[float] = None) -> Deadline:
+        """创建请求的截止时间，应在请求到达时调用，使排队时间也计入预算
+
+        Args:
+            timeout: 客户端指定的预算（秒），为 None 时使用默认值，超过上限时取上限
+
+        Returns:
+            Deadline: 截止时间
+        """
+        if timeout is None:
+            timeout = self.request_timeout
+        if self.max_request_timeout > 0:
+            timeout = min(timeout, self.max_request_timeout) if timeout > 0 else self.max_request_timeout
+        return Deadline(timeout, self.reasoning_deadline_share)
+
+    def route(self, messages: list, reasoning_effort: Optional[str] = None) -> RoutingDecision:
+        """决定请求的推理路由，应在准入前调用，使跳过推理的请求不占用 DeepSeek 阶段名额
+
+        Args:
+            messages: 初始消息列表
+            reasoning_effort: 客户端的推理强度提示
+
+        Returns:
+            RoutingDecision: 推理路由，未启用推理路由器时总是完整推理
+        """
+        decision = _FULL_REASONING
+        if self.reasoning_router is not None:
+            decision = self.reasoning_router.route(messages, reasoning_effort)
+        metrics.REASONING_ROUTES.labels(decision.route, decision.reason).inc()
+        return decision
+
+    def stream_stats(self) -> list[dict]:
+        """获取所有进行中请求的缓冲统计
+        
+        Returns:
+            list[dict]: 每个请求当前缓冲的帧数/字节数、峰值及累计值
+        """
+        return [buffer.stats.to_dict() for buffer in self._active_buffers.values()]
 
     async def chat_completions_with_stream(
         self,
         messages: list,
         model_arg: tuple[float, float, float, float],
         deepseek_model: str = "deepseek-reasoner",
-        gemini_model: str = "gemini-3-5-sonnet-20241022"
+        gemini_model: str = "gemini-3-5-sonnet-20241022",
+        coalesce: bool = True,
+        permit: Optional[AdmissionPermit] = None,
+        reasoning_effort: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        span: Optional[Span] = None,
+        decision: Optional[RoutingDecision] = None
     ) -> AsyncGenerator[bytes, None]:
         """处理完整的流式输出过程
         
@@ -39,6 +170,12 @@ class DeepGenimi:
             model_arg: 模型参数
             deepseek_model: DeepSeek 模型名称
             gemini_model: Gemini 模型名称
+            coalesce: 是否合并连续的同类增量以减少写出次数，对延迟敏感的客户端可关闭
+            permit: 准入许可，由流水线在各阶段交接时释放
+            reasoning_effort: 客户端的推理强度提示，由推理路由器决定跳过、截断或完整推理
+            deadline: 请求的截止时间，为 None 时从现在起按默认预算计时
+            span: 请求的追踪 Span，各阶段在其下创建子 Span，并记录写出给客户端时的等待时间
+            decision: 准入前已决定的推理路由，为 None 时根据 reasoning_effort 决定
             
         Yields:
             字节流数据，格式如下：
@@ -61,116 +198,478 @@ class DeepGenimi:
         chat_id = f"chatcmpl-{hex(int(time.time() * 1000))[2:]}"
         created_time = int(time.time())
 
-        # 创建队列，用于收集输出数据
-        output_queue = asyncio.Queue()
-        # 队列，用于传递 DeepSeek 推理内容给 Gemini
-        gemini_queue = asyncio.Queue()
+        span = span or NOOP_SPAN
+        events = self._events(messages, model_arg, deepseek_model, gemini_model, chat_id, coalesce, permit,
+                              reasoning_effort, deadline, span, decision)
+
+        # 固定字段在请求开始时编码一次，每个 token 只转义增量文本
+        encoder = ChunkEncoder(chat_id, created_time, deepseek_model, gemini_model)
+        start = time.monotonic()
+        # 生成器挂起在 yield 处的时间即响应写出（含客户端读取慢造成的阻塞）的时间，只在采样时计量
+        write_wait = 0.0
+        _ACTIVE_STREAM.inc()
+        try:
+            async with aclosing(events) as stream:
+                async for content_type, content in stream:
+                    if span.recording:
+                        yielded_at = time.monotonic()
+                        yield encoder.encode(content_type, content)
+                        write_wait += time.monotonic() - yielded_at
+                    else:
+                        yield encoder.encode(content_type, content)
+
+            # 发送结束标记
+            yield b'data: [DONE]\n\n'
+        finally:
+            _ACTIVE_STREAM.dec()
+            _STREAM_DURATION.observe(time.monotonic() - start)
+            span.set_attribute("client.write_wait_ms", round(write_wait * 1000, 1))
+
+    async def chat_completions_without_stream(
+        self,
+        messages: list,
+        model_arg: tuple[float, float, float, float],
+        deepseek_model: str = "deepseek-reasoner",
+        gemini_model: str = "gemini-3-5-sonnet-20241022",
+        permit: Optional[AdmissionPermit] = None,
+        reasoning_effort: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        span: Optional[Span] = None,
+        decision: Optional[RoutingDecision] = None
+    ) -> dict:
+        """处理非流式请求，汇总推理与回答后一次性返回
+
+        直接从阶段事件累积文本片段，不经过 SSE 编码和解析。
+
+        Args:
+            messages: 初始消息列表
+            model_arg: 模型参数
+            deepseek_model: DeepSeek 模型名称
+            gemini_model: Gemini 模型名称
+            permit: 准入许可，由流水线在各阶段交接时释放
+            reasoning_effort: 客户端的推理强度提示
+            deadline: 请求的截止时间，为 None 时从现在起按默认预算计时
+            span: 请求的追踪 Span，各阶段在其下创建子 Span
+            decision: 准入前已决定的推理路由，为 None 时根据 reasoning_effort 决定
+
+        Returns:
+            dict: OpenAI 兼容的 chat.completion 响应，message 中包含 reasoning_content，并附带 usage
+        """
+        chat_id = f"chatcmpl-{hex(int(time.time() * 1000))[2:]}"
+        created_time = int(time.time())
+
+        # 非流式请求不需要帧合并，片段最后统一拼接
+        events = self._events(messages, model_arg, deepseek_model, gemini_model, chat_id, False, permit,
+                              reasoning_effort, deadline, span or NOOP_SPAN, decision)
+        parts = {"reasoning": [], "answer": []}
+        start = time.monotonic()
+        _ACTIVE_NON_STREAM.inc()
+        try:
+            async with aclosing(events) as stream:
+                async for content_type, content in stream:
+                    parts[content_type].append(content)
+        finally:
+            _ACTIVE_NON_STREAM.dec()
+            _NON_STREAM_DURATION.observe(time.monotonic() - start)
+
+        reasoning = "".join(parts["reasoning"])
+        answer = "".join(parts["answer"])
+        prompt_tokens = estimate_message_tokens(messages)
+        reasoning_tokens = estimate_tokens(reasoning)
+        completion_tokens = reasoning_tokens + estimate_tokens(answer)
+        return {
+            "id": chat_id,
+            "object": "chat.completion",
+            "created": created_time,
+            "model": gemini_model,
+            "choices": [{
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "reasoning_content": reasoning,
+                    "content": answer
+                },
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "completion_tokens_details": {"reasoning_tokens": reasoning_tokens}
+            }
+        }
+
+    def _events(
+        self,
+        messages: list,
+        model_arg: tuple[float, float, float, float],
+        deepseek_model: str,
+        gemini_model: str,
+        chat_id: str,
+        coalesce: bool,
+        permit: Optional[AdmissionPermit] = None,
+        reasoning_effort: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        span: Span = NOOP_SPAN,
+        decision: Optional[RoutingDecision] = None
+    ) -> AsyncGenerator[tuple[str, str], None]:
+        """获取请求的事件流，启用单飞合并时订阅相同请求的共享流水线
+
+        Args:
+            messages: 初始消息列表
+            model_arg: 模型参数
+            deepseek_model: DeepSeek 模型名称
+            gemini_model: Gemini 模型名称
+            chat_id: 当前请求ID
+            coalesce: 是否启用帧合并
+            permit: 准入许可，加入已有流水线时立即释放
+            reasoning_effort: 客户端的推理强度提示
+            deadline: 请求的截止时间，为 None 时从现在起按默认预算计时
+            span: 请求的追踪 Span
+            decision: 推理路由，为 None 时根据 reasoning_effort 决定
+
+        Returns:
+            AsyncGenerator[tuple[str, str], None]: ("reasoning" | "answer", 文本) 事件流
+        """
+        if decision is None:
+            decision = self.route(messages, reasoning_effort)
+        if deadline is None:
+            deadline = self.new_deadline()
+        span.set_attributes({"reasoning.route": decision.route, "reasoning.route_reason": decision.reason,
+                             "deadline.seconds": deadline.timeout})
+
+        def pipeline() -> AsyncGenerator[tuple[str, str], None]:
+            return self._stream_events(messages, model_arg, deepseek_model, gemini_model, chat_id, coalesce, permit,
+                                       decision, deadline, span)
+
+        def on_join() -> None:
+            # 加入者的 Span 没有阶段子 Span，各阶段记录在发起者的链路中
+            span.set_attribute("coalesced", True)
+            if permit is not None:
+                permit.release()
+
+        if self.single_flight is None:
+            return pipeline()
+        # 相同的并发请求共享同一条上游流水线，各自使用自己的 chat_id 编码输出；
+        # 加入已有流水线的请求不会调用上游，其准入名额立即归还；
+        # 预算不同的请求可能在不同位置降级，不合并，共享流水线按发起者的截止时间运行
+        key = make_request_key(messages, deepseek_model, gemini_model, model_arg, coalesce,
+                               decision.route, decision.max_reasoning_tokens, deadline.timeout)
+        return self.single_flight.subscribe(key, pipeline, on_join=on_join)
+
+    async def _stream_events(
+        self,
+        messages: list,
+        model_arg: tuple[float, float, float, float],
+        deepseek_model: str,
+        gemini_model: str,
+        chat_id: str,
+        coalesce: bool = True,
+        permit: Optional[AdmissionPermit] = None,
+        decision: RoutingDecision = _FULL_REASONING,
+        deadline: Optional[Deadline] = None,
+        span: Span = NOOP_SPAN
+    ) -> AsyncGenerator[tuple[str, str], None]:
+        """运行 DeepSeek -> Gemini 两阶段流水线
+
+        推理阶段到达截止时间（按比例分得的部分）或上游停滞超时时，以已收到的推理内容交接给 Gemini，
+        而不是让请求失败；Gemini 阶段最晚在请求截止时间结束，已输出的回答保留。
+        
+        Args:
+            messages: 初始消息列表
+            model_arg: 模型参数
+            deepseek_model: DeepSeek 模型名称
+            gemini_model: Gemini 模型名称
+            chat_id: 发起流水线的请求ID，仅用于统计和日志
+            coalesce: 是否启用帧合并
+            permit: 准入许可，流水线接管后负责释放
+            decision: 推理路由，skip 时不调用 DeepSeek，cap 时推理达到上限即交接
+            deadline: 请求的截止时间，为 None 时不限制
+            span: 发起请求的追踪 Span，两个阶段、交接与上游调用记录为其子 Span
+            
+        Yields:
+            tuple[str, str]: ("reasoning", 推理片段) 或 ("answer", 回答片段)
+        """
+        if permit is not None:
+            permit.claim()
+        if deadline is None:
+            deadline = Deadline()
+        # 创建有界缓冲区，用于收集输出数据；消费者过慢时阻塞阶段任务，进而限制上游读取
+        output_queue = StreamBuffer(chat_id, self.max_buffered_frames, self.max_buffered_bytes)
+        request_seq = next(self._request_seq)
+        self._active_buffers[request_seq] = output_queue
+        # 队列，用于传递 DeepSeek 推理内容给 Gemini，最多只有推理全文和结束标记两项
+        gemini_queue = asyncio.Queue(maxsize=2)
+
+        # 按 DeepSeek 模型的上下文预算裁剪历史；Gemini 阶段在拿到推理内容后再按其预算裁剪
+        deepseek_messages = messages
+        if self.history_window is not None:
+            deepseek_messages = self.history_window.window(messages, deepseek_model)
 
         # 用于存储 DeepSeek 的推理累积内容
         reasoning_content = []
+        # 按请求采样是否输出 token 级调试日志
+        trace = sample_token_trace()
 
         async def process_deepseek():
-            logger.info(f"开始处理 DeepSeek 流，使用模型：{deepseek_model}, 提供商: {self.deepseek_client.provider}")
+            token_trace.set(trace)
+            stage_budget.set(StageBudget(self.deepseek_timeouts, deadline.reasoning_at))
+            stage = span.child("deepseek", attributes={"model": deepseek_model})
+            current_span.set(stage)
             try:
-                async for content_type, content in self.deepseek_client.stream_chat(
-                    messages=messages,
+                if decision.route == "skip":
+                    stage.set_attribute("skipped", True)
+                    logger.info(f"跳过推理阶段（{decision.reason}），直接交给 Gemini")
+                    if permit is not None:
+                        permit.release_deepseek()
+                    self._record_saved("skip")
+                    await gemini_queue.put(_SKIPPED)
+                    return
+
+                logger.info(f"开始处理 DeepSeek 流，使用模型：{deepseek_model}, 提供商: {self.deepseek_client.provider}")
+                cache_key = None
+                if self.reasoning_cache is not None:
+                    cache_key = self.reasoning_cache.make_key(messages, deepseek_model, model_arg)
+                    cached = await self.reasoning_cache.get(cache_key)
+                    stage.set_attribute("cache.hit", cached is not None)
+                    if cached is not None:
+                        # 命中缓存：按块快速回放推理内容，直接进入 Gemini 阶段
+                        logger.info(f"命中推理缓存，回放推理内容，长度：{len(cached)}")
+                        if permit is not None:
+                            permit.release_deepseek()
+                        step = self.cache_replay_chunk_size
+                        for i in range(0, len(cached), step):
+                            chunk = cached[i:i + step]
+                            await output_queue.put(("reasoning", chunk), text_size(chunk))
+                        await gemini_queue.put(cached)
+                        return
+
+                completed_reasoning = None
+                capped = False
+                reasoning_tokens = 0
+                stage_start = time.monotonic()
+                first_token_at = None
+                # aclosing 保证 break 或任务取消时立即关闭上游连接，而不是等到垃圾回收
+                async with aclosing(self.deepseek_client.stream_chat(
+                    messages=deepseek_messages,
                     model=deepseek_model,
                     temperature=model_arg[0],
                     top_p=model_arg[1],
                     presence_penalty=model_arg[2],
                     frequency_penalty=model_arg[3]
-                ):
-                    if content_type == "reasoning":
-                        reasoning_content.append(content)
-                        response = {
-                            "id": chat_id,
-                            "object": "chat.completion.chunk",
-                            "created": created_time,
-                            "model": deepseek_model,
-                            "choices": [{
-                                "index": 0,
-                                "delta": {
-                                    "role": "assistant",
-                                    "reasoning_content": content,
-                                    "content": ""
-                                }
-                            }]
-                        }
-                        await output_queue.put(f"data: {json.dumps(response)}\n\n".encode('utf-8'))
-                    elif content_type == "content":
-                        # 当收到 content 类型时，将完整的推理内容发送到 gemini_queue，并结束 DeepSeek 流处理
-                        logger.info(f"DeepSeek 推理完成，收集到的推理内容长度：{len(''.join(reasoning_content))}")
-                        await gemini_queue.put("".join(reasoning_content))
-                        break
+                )) as stream:
+                    async for content_type, content in stream:
+                        if content_type == "reasoning":
+                            if first_token_at is None:
+                                first_token_at = time.monotonic()
+                                metrics.DEEPSEEK_TTFT.observe(first_token_at - stage_start)
+                                stage.add_event("first_token")
+                            reasoning_content.append(content)
+                            await output_queue.put(("reasoning", content), text_size(content))
+                            if decision.route == "cap":
+                                reasoning_tokens += estimate_tokens(content)
+                                capped = reasoning_tokens >= decision.max_reasoning_tokens
+                        if content_type == "content" or capped:
+                            # 当收到 content 类型（或推理达到 cap 上限）时，将推理内容发送到 gemini_queue，并结束 DeepSeek 流处理
+                            completed_reasoning = "".join(reasoning_content)
+                            now = time.monotonic()
+                            if capped:
+                                logger.info(f"推理达到上限 {decision.max_reasoning_tokens} tokens，提前交接，"
+                                            f"推理内容长度：{len(completed_reasoning)}")
+                                self._record_saved("cap", now - stage_start)
+                            else:
+                                logger.info(f"DeepSeek 推理完成，收集到的推理内容长度：{len(completed_reasoning)}")
+                                if self.reasoning_router is not None:
+                                    self.reasoning_router.observe_reasoning(now - stage_start)
+                            metrics.REASONING_DURATION.observe(now - (first_token_at or stage_start))
+                            metrics.REASONING_TOKENS.observe(estimate_tokens(completed_reasoning))
+                            stage.add_event("handoff", {"capped": capped, "reasoning.chars": len(completed_reasoning)})
+                            await gemini_queue.put(completed_reasoning)
+                            if permit is not None:
+                                permit.release_deepseek()
+                            # 推理已交接，退出 async with 时即释放 DeepSeek 连接
+                            break
+
+                # 只缓存完整结束的推理，出错、被中断或被截断的部分推理不写入
+                if cache_key is not None and completed_reasoning and not capped:
+                    await self.reasoning_cache.set(cache_key, completed_reasoning)
+            except UpstreamTimeout as e:
+                # 推理超出预算或上游停滞：以已收到的推理交接，没有收到推理时直接交给 Gemini 回答
+                partial = "".join(reasoning_content)
+                logger.warning(f"DeepSeek 阶段超时（{e.phase}），以已收到的推理内容交接，长度：{len(partial)}")
+                metrics.REASONING_DEGRADED.labels(e.phase).inc()
+                stage.set_attribute("degraded", e.phase)
+                stage.add_event("handoff", {"capped": False, "reasoning.chars": len(partial)})
+                if permit is not None:
+                    permit.release_deepseek()
+                await gemini_queue.put(partial or _SKIPPED)
             except Exception as e:
                 logger.error(f"处理 DeepSeek 流时发生错误: {e}")
+                stage.record_error(e)
             finally:
-                # 确保释放队列资源
-                await gemini_queue.put(None)
-                await output_queue.put(None)
+                # 确保释放队列资源，并用 None 标记 DeepSeek 任务结束
+                gemini_queue.put_nowait(None)
+                output_queue.put_nowait(None)
+                if permit is not None:
+                    permit.release_deepseek()
+                stage.end()
                 logger.info("DeepSeek处理流程资源已释放")
-            # 用 None 标记 DeepSeek 任务结束
-            logger.info("DeepSeek 任务处理完成，标记结束")
-            await output_queue.put(None)
 
         async def process_gemini():
+            stage_budget.set(StageBudget(self.gemini_timeouts, deadline.at))
+            stage = NOOP_SPAN
             try:
                 logger.info("等待获取 DeepSeek 的推理内容...")
                 while True:
-                    reasoning = await gemini_queue.get()
+                    try:
+                        async with asyncio.timeout(deadline.remaining()):
+                            reasoning = await gemini_queue.get()
+                    except TimeoutError:
+                        logger.warning("等待推理内容时到达请求截止时间，停止处理")
+                        break
                     if reasoning is None:
                         logger.info("收到队列结束标记，停止处理")
                         break
-                    logger.debug(f"获取到推理内容，内容长度：{len(reasoning) if reasoning else 0}")
-                    if not reasoning:
-                        logger.warning("未能获取到有效的推理内容，将使用默认提示继续")
-                        reasoning = "获取推理内容失败"
-                    # 构造 Gemini 的输入消息
-                    gemini_messages = messages.copy()
-                    gemini_messages.append({
-                        "role": "assistant",
-                        "content": f"Here's my reasoning process:\n{reasoning}\n\nBased on this reasoning, I will now provide my response:"
-                    })
-                    # 处理可能 messages 内存在 role = system 的情况，如果有，则去掉当前这一条的消息对象
-                    gemini_messages = [message for message in gemini_messages if message.get("role", "") != "system"]
+                    # 交接：推理压缩、历史裁剪与等待 Gemini 阶段名额
+                    with span.child("handoff", attributes={"reasoning.skipped": reasoning is _SKIPPED}) as handoff:
+                        if reasoning is _SKIPPED:
+                            reasoning_message = None
+                        else:
+                            reasoning_message = self._reasoning_message(reasoning)
+                        if self.history_window is not None:
+                            reserve = self.gemini_client.max_output_tokens
+                            if reasoning_message is not None:
+                                reserve += self.history_window.count(reasoning_message)
+                            gemini_messages = self.history_window.window(messages, gemini_model, reserve=reserve)
+                        else:
+                            gemini_messages = messages.copy()
+                        if reasoning_message is not None:
+                            gemini_messages.append(reasoning_message)
+                        # 处理可能 messages 内存在 role = system 的情况，如果有，则去掉当前这一条的消息对象
+                        gemini_messages = [message for message in gemini_messages if message.get("role", "") != "system"]
+                        input_tokens = estimate_message_tokens(gemini_messages)
+                        metrics.GEMINI_INPUT_TOKENS.observe(input_tokens)
+                        handoff.set_attribute("gemini.input_tokens", input_tokens)
 
+                        if permit is not None:
+                            # Gemini 阶段名额不足时在此等待，响应已开始，不再拒绝，但最多等到请求截止时间
+                            try:
+                                await permit.acquire_gemini(deadline.remaining())
+                            except TimeoutError:
+                                logger.warning("等待 Gemini 阶段名额时到达请求截止时间，停止处理")
+                                handoff.set_attribute("deadline_exceeded", True)
+                                break
                     logger.info(f"开始处理 Gemini 流，使用模型: {gemini_model}, 提供商: {self.gemini_client.provider}")
 
-                    async for content_type, content in self.gemini_client.stream_chat(
+                    stage_start = time.monotonic()
+                    first_token_at = None
+                    answer_chars = answer_bytes = 0
+                    stage = span.child("gemini", attributes={"model": gemini_model})
+                    current_span.set(stage)
+                    async with aclosing(self.gemini_client.stream_chat(
                         messages=gemini_messages,
                         model_arg=model_arg,
                         model=gemini_model,
-                    ):
-                        if content_type == "answer":
-                            response = {
-                                "id": chat_id,
-                                "object": "chat.completion.chunk",
-                                "created": created_time,
-                                "model": gemini_model,
-                                "choices": [{
-                                    "index": 0,
-                                    "delta": {
-                                        "role": "assistant",
-                                        "content": content
-                                    }
-                                }]
-                            }
-                            await output_queue.put(f"data: {json.dumps(response)}\n\n".encode('utf-8'))
+                    )) as stream:
+                        async for content_type, content in stream:
+                            if content_type != "answer":
+                                continue
+                            size = text_size(content)
+                            if first_token_at is None:
+                                first_token_at = time.monotonic()
+                                metrics.GEMINI_TTFT.observe(first_token_at - stage_start)
+                                stage.add_event("first_token")
+                            answer_chars += len(content)
+                            answer_bytes += size
+                            await output_queue.put(("answer", content), size)
+                        stage.set_attribute("answer.chars", answer_chars)
+                    if first_token_at is not None:
+                        elapsed = time.monotonic() - first_token_at
+                        if elapsed > 0:
+                            tokens = estimate_tokens_from_size(answer_chars, answer_bytes)
+                            metrics.GEMINI_TOKENS_PER_SECOND.observe(tokens / elapsed)
+            except Exception as e:
+                logger.error(f"处理 Gemini 流时发生错误: {e}")
+                stage.record_error(e)
             finally:
-                await output_queue.put(None)
+                # 客户端断开导致任务被取消时 Span 同样在此结束
+                stage.end()
+                output_queue.put_nowait(None)
         
         # 创建并发任务
         deepseek_task = asyncio.create_task(process_deepseek())
         gemini_task = asyncio.create_task(process_gemini())
         
-        # 等待两个任务完成，通过计数判断
-        finished_tasks = 0
-        while finished_tasks < 2:
-            item = await output_queue.get()
-            if item is None:
-                finished_tasks += 1
+        try:
+            # 读取输出直到两个任务都写入结束标记，启用合并时连续的同类增量会合并为一帧
+            if coalesce and self.frame_batcher is not None:
+                source = self.frame_batcher.drain(output_queue, producers=2)
             else:
-                yield item
+                source = drain(output_queue, producers=2)
+            async with aclosing(source) as items:
+                async for item in items:
+                    yield item
+        finally:
+            # 同步清理放在第一个 await 之前：客户端断开时 Starlette 的取消作用域会再次取消这里的等待，
+            # 之后的语句不一定有机会执行
+            if permit is not None:
+                permit.release()
+            self._active_buffers.pop(request_seq, None)
+            stats = output_queue.stats
+            span.set_attributes({"buffer.peak_frames": stats.peak_frames, "buffer.producer_waits": stats.producer_waits})
+            logger.info(
+                f"请求 {chat_id} 输出缓冲统计 | 峰值: {stats.peak_frames} 帧/{stats.peak_bytes} 字节 | "
+                f"累计: {stats.total_frames} 帧/{stats.total_bytes} 字节 | 背压等待: {stats.producer_waits} 次"
+            )
+            # 客户端断开或生成器被关闭时，取消仍在运行的阶段任务并关闭其上游连接
+            await self._cancel_tasks(deepseek_task, gemini_task)
+
+    def _reasoning_message(self, reasoning: str) -> dict:
+        """构造交给 Gemini 的推理消息，配置了压缩器时先压缩
+
+        Args:
+            reasoning: DeepSeek 的推理内容，为空表示推理阶段失败
+
+        Returns:
+            dict: assistant 消息
+        """
+        logger.debug(f"获取到推理内容，内容长度：{len(reasoning) if reasoning else 0}")
+        if not reasoning:
+            logger.warning("未能获取到有效的推理内容，将使用默认提示继续")
+            reasoning = "获取推理内容失败"
+        elif self.reasoning_compactor is not None:
+            # 只压缩交给 Gemini 的副本，客户端收到的与缓存的推理内容保持完整
+            compaction = self.reasoning_compactor.compact(reasoning)
+            metrics.REASONING_COMPACTION_RATIO.observe(compaction.ratio)
+            if compaction.applied:
+                logger.info(
+                    "推理内容已压缩: %d -> %d tokens (%.0f%%)，策略: %s",
+                    compaction.original_tokens, compaction.tokens, compaction.ratio * 100,
+                    ",".join(compaction.applied),
+                )
+            reasoning = compaction.text
+        return {
+            "role": "assistant",
+            "content": f"Here's my reasoning process:\n{reasoning}\n\nBased on this reasoning, I will now provide my response:"
+        }
+
+    def _record_saved(self, route: str, elapsed: float = 0.0) -> None:
+        """记录跳过或截断推理估算节省的延迟"""
+        if self.reasoning_router is not None:
+            saved = self.reasoning_router.record_saved(route, elapsed)
+            metrics.REASONING_LATENCY_SAVED.labels(route).inc(saved)
+
+    @staticmethod
+    async def _cancel_tasks(*tasks: asyncio.Task) -> None:
+        """取消并等待任务结束，确保任务内部的 finally 与上游连接清理得以执行
         
-        # 发送结束标记
-        yield b'data: [DONE]\n\n'
\ No newline at end of file
+        Args:
+            tasks: 需要清理的任务
+        """
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.info(f"请求提前结束，取消 {len(pending)} 个未完成的阶段任务")
+        # 调用方在等待期间再次被取消时，任务已收到取消请求，会自行完成清理，不能因此被二次取消
+        await asyncio.shield(asyncio.gather(*tasks, return_exceptions=True))
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""输出帧合并：将连续的同类增量合并为一帧，减少写出次数"""
+import asyncio
+from typing import AsyncGenerator
+from .stream_buffer import StreamBuffer, text_size
+
+
+async def drain(buffer: StreamBuffer, producers: int) -> AsyncGenerator[tuple[str, str], None]:
+    """逐个取出缓冲区中的事件，直到收到所有生产者的结束标记
+
+    Args:
+        buffer: 输出缓冲区
+        producers: 生产者数量，每个生产者结束时写入一个 None
+
+    Yields:
+        tuple[str, str]: (内容类型, 文本)
+    """
+    finished = 0
+    while finished < producers:
+        item = await buffer.get()
+        if item is None:
+            finished += 1
+        else:
+            yield item
+
+
+class FrameBatcher:
+    """自适应帧合并器
+
+    取出一个事件后，继续收集紧随其后的同类事件，直到累计字节数达到 `max_bytes`、
+    类型发生变化，或距第一个事件超过 `max_delay` 秒。缓冲区里已经积压的事件总是
+    被立即合并，因此上游越快、客户端越慢，单帧越大；空闲时最多只增加 `max_delay` 的延迟。
+    """
+
+    def __init__(self, max_bytes: int = 4096, max_delay: float = 0.005):
+        """初始化合并器
+
+        Args:
+            max_bytes: 单帧最多合并的文本字节数
+            max_delay: 等待后续事件的最长时间（秒），0 表示只合并已积压的事件
+        """
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.events_in = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+
+    def stats(self) -> dict:
+        """获取合并统计
+
+        Returns:
+            dict: 输入事件数、输出帧数、平均每帧字节数及合并比
+        """
+        return {
+            "events_in": self.events_in,
+            "frames_out": self.frames_out,
+            "bytes_out": self.bytes_out,
+            "avg_bytes_per_frame": round(self.bytes_out / self.frames_out, 1) if self.frames_out else 0.0,
+            "events_per_frame": round(self.events_in / self.frames_out, 2) if self.frames_out else 0.0,
+        }
+
+    async def drain(self, buffer: StreamBuffer, producers: int) -> AsyncGenerator[tuple[str, str], None]:
+        """从缓冲区取出事件并合并，直到收到所有生产者的结束标记
+
+        Args:
+            buffer: 输出缓冲区
+            producers: 生产者数量，每个生产者结束时写入一个 None
+
+        Yields:
+            tuple[str, str]: 合并后的 (内容类型, 文本)
+        """
+        loop = asyncio.get_running_loop()
+        finished = 0
+        kind = None
+        parts: list[str] = []
+        size = 0
+        deadline = 0.0
+        while finished < producers:
+            if not parts:
+                item = await buffer.get()
+            elif not buffer.empty():
+                item = buffer.get_nowait()
+            else:
+                remaining = deadline - loop.time()
+                if remaining <= 0 or not await buffer.wait(remaining):
+                    # 计时到期，输出已收集的内容
+                    yield self._flush(kind, parts, size)
+                    parts, size = [], 0
+                    continue
+                item = buffer.get_nowait()
+
+            if item is None:
+                finished += 1
+                continue
+
+            self.events_in += 1
+            content_type, text = item
+            if parts and content_type != kind:
+                yield self._flush(kind, parts, size)
+                parts, size = [], 0
+            if not parts:
+                kind = content_type
+                deadline = loop.time() + self.max_delay
+            parts.append(text)
+            size += text_size(text)
+            if size >= self.max_bytes:
+                yield self._flush(kind, parts, size)
+                parts, size = [], 0
+
+        if parts:
+            yield self._flush(kind, parts, size)
+
+    def _flush(self, kind: str, parts: list[str], size: int) -> tuple[str, str]:
+        self.frames_out += 1
+        self.bytes_out += size
+        return kind, parts[0] if len(parts) == 1 else "".join(parts)
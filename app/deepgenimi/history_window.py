@@ -0,0 +1,137 @@
+"""对话历史窗口：按模型的上下文预算裁剪历史消息"""
+from typing import Optional
+from app.utils.tokens import estimate_tokens
+
+# 每条消息的格式开销，与 estimate_message_tokens 保持一致
+_MESSAGE_OVERHEAD = 4
+
+
+class HistoryWindow:
+    """对话历史窗口
+
+    - 去掉历史 assistant 消息中的 `reasoning_content`：上一轮的推理对下一轮没有帮助，
+      DeepSeek 也不接受带该字段的输入
+    - 固定保留开头的 system 消息和第一条 user 消息
+    - 其余消息从最新往前保留，直到用完预算；最新一条消息总是保留
+
+    裁剪起点按固定的消息数步长对齐：对话每轮只在末尾追加消息，因此起点只在越过
+    下一个对齐点时才整体前移，相邻几轮的窗口前缀保持不变，下游的前缀缓存可以持续命中。
+    """
+
+    def __init__(self, budgets: Optional[dict[str, int]] = None, default_budget: int = 0, stride: int = 8):
+        """初始化窗口
+
+        Args:
+            budgets: 模型名称（或名称前缀）到上下文 token 预算的映射
+            default_budget: 未配置的模型使用的预算，0 表示不限制
+            stride: 裁剪起点对齐的消息数步长
+        """
+        self.budgets = dict(budgets or {})
+        self.default_budget = default_budget
+        self.stride = max(1, stride)
+        self.windowed = 0
+        self.trimmed = 0
+        self.dropped_messages = 0
+        self.stripped_reasoning = 0
+
+    def budget_for(self, model: str) -> int:
+        """获取模型的上下文预算，精确匹配优先，其次取最长的前缀匹配
+
+        Args:
+            model: 模型名称
+
+        Returns:
+            int: token 预算，0 表示不限制
+        """
+        budget = self.budgets.get(model)
+        if budget is not None:
+            return budget
+        prefixes = [name for name in self.budgets if model.startswith(name)]
+        if prefixes:
+            return self.budgets[max(prefixes, key=len)]
+        return self.default_budget
+
+    def count(self, message: dict) -> int:
+        """估算单条消息的 token 数（含格式开销）
+
+        Args:
+            message: 消息
+
+        Returns:
+            int: 估算的 token 数
+        """
+        content = message.get("content")
+        if not isinstance(content, str):
+            return _MESSAGE_OVERHEAD
+        return _MESSAGE_OVERHEAD + estimate_tokens(content)
+
+    def window(self, messages: list, model: str, reserve: int = 0) -> list:
+        """按模型预算裁剪消息
+
+        只估算窗口内的消息，每轮的耗时取决于预算而不是对话总长度。
+
+        Args:
+            messages: 完整的消息列表
+            model: 目标模型名称
+            reserve: 为本次请求额外预留的 token 数（如推理内容、输出长度）
+
+        Returns:
+            list: 裁剪后的新列表，不修改传入的消息
+        """
+        self.windowed += 1
+        budget = self.budget_for(model)
+        if not budget or len(messages) <= 1:
+            return [self._strip_reasoning(message) for message in messages]
+
+        # 固定保留：开头的 system 消息和第一条 user 消息
+        pinned = 0
+        while pinned < len(messages) and messages[pinned].get("role") == "system":
+            pinned += 1
+        if pinned < len(messages) - 1 and messages[pinned].get("role") == "user":
+            pinned += 1
+
+        # 从最新往前累计，找到满足预算的最早起点（最新一条消息总是保留）
+        available = budget - reserve - sum(self.count(message) for message in messages[:pinned])
+        start = len(messages) - 1
+        kept = self.count(messages[start])
+        while start > pinned:
+            cost = self.count(messages[start - 1])
+            if kept + cost > available:
+                break
+            start -= 1
+            kept += cost
+
+        if start > pinned:
+            # 起点后移到下一个对齐点：对齐点按消息序号划分，不随新消息的追加而变化
+            offset = (start - pinned) % self.stride
+            if offset:
+                start = min(start + self.stride - offset, len(messages) - 1)
+            # 保持 user/assistant 交替：固定部分以 user 结尾时，窗口从 assistant 开始
+            if pinned and start < len(messages) - 1 and messages[start].get("role") == messages[pinned - 1].get("role"):
+                start += 1
+            self.trimmed += 1
+            self.dropped_messages += start - pinned
+
+        return [self._strip_reasoning(message) for message in messages[:pinned]] + \
+            [self._strip_reasoning(message) for message in messages[start:]]
+
+    def _strip_reasoning(self, message: dict) -> dict:
+        if "reasoning_content" not in message:
+            return message
+        self.stripped_reasoning += 1
+        return {key: value for key, value in message.items() if key != "reasoning_content"}
+
+    def stats(self) -> dict:
+        """获取窗口统计
+
+        Returns:
+            dict: 预算配置、处理与裁剪的请求数、丢弃的消息数及去掉推理内容的消息数
+        """
+        return {
+            "budgets": self.budgets,
+            "default_budget": self.default_budget,
+            "windowed": self.windowed,
+            "trimmed": self.trimmed,
+            "dropped_messages": self.dropped_messages,
+            "stripped_reasoning": self.stripped_reasoning,
+        }
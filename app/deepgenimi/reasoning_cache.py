@@ -0,0 +1,232 @@
+"""DeepSeek 推理内容缓存，支持 LRU + TTL 淘汰以及可插拔的持久化后端"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+from app.utils.logger import logger
+
+
+def make_request_key(messages: list, *parts) -> str:
+    """根据规范化后的消息及附加字段（模型、采样参数等）生成请求键
+
+    Args:
+        messages: 消息列表，只取 role 和去除首尾空白的 content
+        parts: 其他参与区分请求的字段，需可 JSON 序列化
+
+    Returns:
+        str: sha256 十六进制摘要
+    """
+    normalized = [
+        [message.get("role", ""),
+         message["content"].strip() if isinstance(message.get("content"), str) else message.get("content")]
+        for message in messages
+    ]
+    payload = json.dumps([normalized, *parts], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CacheBackend(ABC):
+    """推理缓存的持久化后端接口，方法均为同步调用，由 ReasoningCache 放到线程中执行"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[tuple[str, float]]:
+        """读取缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            Optional[tuple[str, float]]: (推理内容, 过期时间戳)，不存在或已过期时返回 None
+        """
+
+    @abstractmethod
+    def set(self, key: str, reasoning: str, expires_at: float) -> None:
+        """写入缓存
+
+        Args:
+            key: 缓存键
+            reasoning: 推理内容
+            expires_at: 过期时间戳
+        """
+
+    def close(self) -> None:
+        """释放后端资源"""
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """基于 SQLite 的持久化后端，重启或多个 worker 之间共享缓存"""
+
+    def __init__(self, path: str, max_entries: int = 100000, prune_interval: int = 256):
+        """初始化 SQLite 后端
+
+        Args:
+            path: 数据库文件路径
+            max_entries: 最多保留的条目数，超出时淘汰最早过期的条目
+            prune_interval: 每写入多少次执行一次过期与容量清理
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.prune_interval = prune_interval
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        # WAL 模式允许多个进程并发读写
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reasoning_cache ("
+            "key TEXT PRIMARY KEY, reasoning TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT reasoning, expires_at FROM reasoning_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, reasoning: str, expires_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reasoning_cache (key, reasoning, expires_at) VALUES (?, ?, ?)",
+                (key, reasoning, expires_at),
+            )
+            self._writes += 1
+            if self._writes % self.prune_interval == 0:
+                self._prune()
+
+    def _prune(self) -> None:
+        """删除过期条目，并将条目数控制在上限内"""
+        self._conn.execute("DELETE FROM reasoning_cache WHERE expires_at <= ?", (time.time(),))
+        self._conn.execute(
+            "DELETE FROM reasoning_cache WHERE key IN ("
+            "SELECT key FROM reasoning_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ReasoningCache:
+    """推理内容缓存
+
+    内存中维护一个按条目数限制的 LRU，条目带 TTL；未命中时再查询持久化后端，
+    后端命中的结果会回填到内存中。
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600, backend: Optional[CacheBackend] = None):
+        """初始化缓存
+
+        Args:
+            max_entries: 内存中最多缓存的条目数
+            ttl: 条目有效期（秒）
+            backend: 可选的持久化后端
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(messages: list, model: str, model_arg: tuple) -> str:
+        """根据规范化后的消息、DeepSeek 模型和采样参数生成缓存键
+
+        Args:
+            messages: 消息列表
+            model: DeepSeek 模型名称
+            model_arg: (temperature, top_p, presence_penalty, frequency_penalty)
+
+        Returns:
+            str: sha256 十六进制摘要
+        """
+        return make_request_key(messages, model, model_arg)
+
+    async def get(self, key: str) -> Optional[str]:
+        """查询缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            Optional[str]: 命中时返回推理内容
+        """
+        entry = self._entries.get(key)
+        now = time.time()
+        if entry is not None:
+            if entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            del self._entries[key]
+
+        if self.backend is not None:
+            try:
+                entry = await asyncio.to_thread(self.backend.get, key)
+            except Exception as e:
+                logger.error(f"读取推理缓存后端失败: {e}")
+                entry = None
+            if entry is not None:
+                self._store(key, entry[0], entry[1])
+                self.hits += 1
+                self.backend_hits += 1
+                return entry[0]
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, reasoning: str) -> None:
+        """写入缓存
+
+        Args:
+            key: 缓存键
+            reasoning: 完整的推理内容
+        """
+        expires_at = time.time() + self.ttl
+        self._store(key, reasoning, expires_at)
+        if self.backend is not None:
+            try:
+                await asyncio.to_thread(self.backend.set, key, reasoning, expires_at)
+            except Exception as e:
+                logger.error(f"写入推理缓存后端失败: {e}")
+
+    def _store(self, key: str, reasoning: str, expires_at: float) -> None:
+        self._entries[key] = (reasoning, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """获取缓存统计
+
+        Returns:
+            dict: 命中、未命中、淘汰次数及当前内存条目数
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "backend_hits": self.backend_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        """关闭持久化后端"""
+        if self.backend is not None:
+            self.backend.close()
@@ -0,0 +1,174 @@
+"""推理内容压缩：在交给 Gemini 之前按 token 预算精简 DeepSeek 的推理过程"""
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+from app.utils.tokens import estimate_tokens
+
+_THINK_TAG = re.compile(r"</?think>", re.IGNORECASE)
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+_WHITESPACE = re.compile(r"\s+")
+# 自我验证段落的常见开头，R1 会在得出结论前反复出现这类段落
+_VERIFICATION = re.compile(
+    r"^\W*(wait|hmm|but wait|let me (double[- ]?check|verify|re-?check|check (that|this|again)|confirm|make sure)"
+    r"|double[- ]?check|to verify|let's (verify|check|double[- ]?check)|actually,? let me"
+    r"|等等|等一下|不对|让我(再)?(检查|验证|确认|核对|想想)|再(检查|验证|确认|核对)|验证一下|检查一下|确认一下)",
+    re.IGNORECASE,
+)
+
+STRATEGIES = ("strip_think", "dedupe", "conclusion", "head_tail")
+
+
+def _omitted(count: int, unit: str) -> str:
+    """省略标记，count 为确切的省略数量（段落数或字符数），不使用估算的 token 数"""
+    return f"[... {count} {unit}{'' if count == 1 else 's'} of reasoning omitted ...]"
+
+
+@dataclass
+class CompactionResult:
+    """一次压缩的结果"""
+    text: str
+    original_tokens: int
+    tokens: int
+    applied: list[str] = field(default_factory=list)
+
+    @property
+    def ratio(self) -> float:
+        """压缩后与压缩前的 token 数之比，1 表示未压缩"""
+        return self.tokens / self.original_tokens if self.original_tokens else 1.0
+
+
+def _paragraphs(text: str) -> list[str]:
+    return [p.strip() for p in _PARAGRAPH_SPLIT.split(text) if p.strip()]
+
+
+class ReasoningCompactor:
+    """推理内容压缩器
+
+    按配置顺序依次应用策略，每一步之后重新估算 token 数，已在预算内时停止：
+        strip_think: 去掉 `<think>` / `</think>` 标签
+        dedupe: 去掉重复段落；连续的自我验证段落（"Wait," "让我再检查" 等）只保留最后一段
+        conclusion: 只保留末尾能放进预算的若干段（结论通常在最后）
+        head_tail: 保留开头与结尾，中间以省略标记代替，保证结果不超过预算
+    预算为 0 时不限制长度，只应用不依赖预算的 strip_think 与 dedupe。
+    """
+
+    def __init__(self, budget_tokens: int = 0, strategies: tuple = STRATEGIES, head_ratio: float = 0.3):
+        """初始化压缩器
+
+        Args:
+            budget_tokens: 推理内容的 token 预算，0 表示不限制
+            strategies: 依次应用的策略名称
+            head_ratio: head_tail 策略中开头部分占预算的比例
+        """
+        unknown = set(strategies) - set(STRATEGIES)
+        if unknown:
+            raise ValueError(f"未知的推理压缩策略: {', '.join(sorted(unknown))}")
+        self.budget_tokens = budget_tokens
+        self.strategies = tuple(strategies)
+        self.head_ratio = head_ratio
+        self._apply: dict[str, Callable[[str], str]] = {
+            "strip_think": self._strip_think,
+            "dedupe": self._dedupe,
+            "conclusion": self._conclusion,
+            "head_tail": self._head_tail,
+        }
+
+    def compact(self, reasoning: str) -> CompactionResult:
+        """压缩推理内容
+
+        Args:
+            reasoning: 完整的推理内容
+
+        Returns:
+            CompactionResult: 压缩后的文本、前后 token 数及实际生效的策略
+        """
+        original = tokens = estimate_tokens(reasoning)
+        result = CompactionResult(reasoning, original, tokens)
+        for name in self.strategies:
+            if self.budget_tokens and tokens <= self.budget_tokens:
+                break
+            text = self._apply[name](result.text)
+            if text != result.text:
+                result.text = text
+                tokens = estimate_tokens(text)
+                result.applied.append(name)
+        result.tokens = tokens
+        return result
+
+    @staticmethod
+    def _strip_think(text: str) -> str:
+        return _THINK_TAG.sub("", text).strip()
+
+    @staticmethod
+    def _dedupe(text: str) -> str:
+        kept: list[str] = []
+        seen: set[str] = set()
+        for paragraph in _paragraphs(text):
+            key = _WHITESPACE.sub(" ", paragraph).lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            if kept and _VERIFICATION.match(paragraph) and _VERIFICATION.match(kept[-1]):
+                # 连续的验证段落：后一段通常是对前一段的再次确认，只保留最新的一段
+                kept[-1] = paragraph
+            else:
+                kept.append(paragraph)
+        return "\n\n".join(kept)
+
+    def _conclusion(self, text: str) -> str:
+        if not self.budget_tokens:
+            return text
+        paragraphs = _paragraphs(text)
+        kept: list[str] = []
+        # 按省略全部段落时的标记长度预留，实际省略的段落数不会更多
+        used = estimate_tokens(_omitted(len(paragraphs), "earlier paragraph"))
+        for paragraph in reversed(paragraphs):
+            cost = estimate_tokens(paragraph)
+            if used + cost > self.budget_tokens:
+                break
+            kept.append(paragraph)
+            used += cost
+        if not kept or len(kept) == len(paragraphs):
+            # 最后一段本身就超出预算时交给 head_tail 截断
+            return text
+        return "\n\n".join([_omitted(len(paragraphs) - len(kept), "earlier paragraph")] + kept[::-1])
+
+    def _head_tail(self, text: str) -> str:
+        total = estimate_tokens(text)
+        if not self.budget_tokens or total <= self.budget_tokens:
+            return text
+        # 按本文的平均字符/token 比换算成字符数切片，避免逐段估算；
+        # 开头与结尾的字符密度可能不同于平均值，超出预算时按超出量缩小后重新切片
+        chars_per_token = len(text) / total
+        available = max(self.budget_tokens - estimate_tokens(_omitted(len(text), "character")), 2)
+        while True:
+            head_chars = int(available * self.head_ratio * chars_per_token)
+            tail_chars = int(available * (1 - self.head_ratio) * chars_per_token)
+
+            head = text[:head_chars]
+            cut = head.rfind("\n")
+            if cut > head_chars // 2:
+                head = head[:cut]
+            tail = text[len(text) - tail_chars:] if tail_chars else ""
+            cut = tail.find("\n")
+            if 0 <= cut < tail_chars // 2:
+                tail = tail[cut + 1:]
+            head, tail = head.rstrip(), tail.lstrip()
+            result = f"{head}\n\n{_omitted(len(text) - len(head) - len(tail), 'character')}\n\n{tail}"
+            over = estimate_tokens(result) - self.budget_tokens
+            if over <= 0 or available <= 2:
+                return result
+            available = max(available - over, 2)
+
+def parse_strategies(value: Optional[str]) -> tuple:
+    """解析逗号分隔的策略列表，例如 "strip_think,dedupe,head_tail"
+
+    Args:
+        value: 策略列表字符串，为空时使用全部策略
+
+    Returns:
+        tuple: 策略名称
+    """
+    if not value:
+        return STRATEGIES
+    return tuple(name.strip() for name in value.split(",") if name.strip())
@@ -0,0 +1,141 @@
+"""推理路由：按请求决定跳过、截断或完整运行 DeepSeek 推理阶段"""
+import re
+from dataclasses import dataclass
+from typing import Optional
+from app.utils.logger import logger
+from app.utils.tokens import estimate_tokens
+
+# 客户端 reasoning_effort 取值到路由的映射，与 OpenAI 的取值保持一致
+EFFORT_ROUTES = {"none": "skip", "minimal": "skip", "low": "cap", "medium": "full", "high": "full"}
+
+
+@dataclass
+class RoutingDecision:
+    """单个请求的路由结果"""
+
+    route: str  # "skip"（直接交给 Gemini）、"cap"（推理达到上限后提前交接）或 "full"
+    reason: str  # "hint"、"pattern"、"length" 或 "default"
+    max_reasoning_tokens: int = 0  # 仅 cap 路由有效
+
+
+_FULL = RoutingDecision("full", "default")
+
+
+class ReasoningRouter:
+    """推理路由器
+
+    依次检查：客户端的 `reasoning_effort`、需要完整推理的正则、可以跳过推理的正则、
+    最后一条 user 消息的长度，都不满足时走完整的两阶段流程。正则与长度规则默认关闭。
+
+    节省的延迟按估算计：记录完整推理（DeepSeek 阶段开始到交接）耗时的指数移动平均，
+    跳过推理的请求记为节省该平均值，截断的请求记为平均值与实际耗时之差。
+    """
+
+    def __init__(self, short_prompt_tokens: int = 0, skip_pattern: str = "", full_pattern: str = "",
+                 cap_tokens: int = 1024, honor_hint: bool = True, ewma_alpha: float = 0.2):
+        """初始化路由器
+
+        Args:
+            short_prompt_tokens: 最后一条 user 消息不超过该 token 数时跳过推理，0 表示不按长度判断
+            skip_pattern: 匹配最后一条 user 消息时跳过推理的正则（不区分大小写），为空时不启用
+            full_pattern: 匹配时总是完整推理的正则，优先于跳过规则，为空时不启用
+            cap_tokens: cap 路由的推理 token 上限
+            honor_hint: 是否采用客户端的 reasoning_effort
+            ewma_alpha: 完整推理耗时移动平均的平滑系数
+        """
+        self.short_prompt_tokens = short_prompt_tokens
+        self.skip_pattern = re.compile(skip_pattern, re.IGNORECASE) if skip_pattern else None
+        self.full_pattern = re.compile(full_pattern, re.IGNORECASE) if full_pattern else None
+        self.cap_tokens = cap_tokens
+        self.honor_hint = honor_hint
+        self.ewma_alpha = ewma_alpha
+        self.reasoning_latency: Optional[float] = None
+        self.routes = {"skip": 0, "cap": 0, "full": 0}
+        self.saved_seconds = {"skip": 0.0, "cap": 0.0}
+
+    def route(self, messages: list, reasoning_effort: Optional[str] = None) -> RoutingDecision:
+        """决定请求的路由
+
+        Args:
+            messages: 请求的消息列表
+            reasoning_effort: 客户端提示，取值见 EFFORT_ROUTES，无法识别时忽略
+
+        Returns:
+            RoutingDecision: 路由结果
+        """
+        decision = self._decide(messages, reasoning_effort)
+        self.routes[decision.route] += 1
+        return decision
+
+    def _decide(self, messages: list, reasoning_effort: Optional[str]) -> RoutingDecision:
+        if self.honor_hint and reasoning_effort is not None:
+            route = EFFORT_ROUTES.get(str(reasoning_effort).lower())
+            if route is not None:
+                return self._decision(route, "hint")
+            logger.debug(f"忽略无法识别的 reasoning_effort: {reasoning_effort}")
+
+        prompt = _last_user_content(messages)
+        if prompt is None:
+            # 多模态等非文本内容不做判断
+            return _FULL
+        if self.full_pattern is not None and self.full_pattern.search(prompt):
+            return self._decision("full", "pattern")
+        if self.skip_pattern is not None and self.skip_pattern.search(prompt):
+            return self._decision("skip", "pattern")
+        if self.short_prompt_tokens and estimate_tokens(prompt) <= self.short_prompt_tokens:
+            return self._decision("skip", "length")
+        return _FULL
+
+    def _decision(self, route: str, reason: str) -> RoutingDecision:
+        if route == "full":
+            return RoutingDecision("full", reason)
+        return RoutingDecision(route, reason, self.cap_tokens if route == "cap" else 0)
+
+    def observe_reasoning(self, seconds: float) -> None:
+        """记录一次完整推理的耗时
+
+        Args:
+            seconds: DeepSeek 阶段开始到推理交接的时间
+        """
+        if self.reasoning_latency is None:
+            self.reasoning_latency = seconds
+        else:
+            self.reasoning_latency += self.ewma_alpha * (seconds - self.reasoning_latency)
+
+    def record_saved(self, route: str, elapsed: float = 0.0) -> float:
+        """按完整推理的平均耗时估算本次节省的延迟
+
+        Args:
+            route: "skip" 或 "cap"
+            elapsed: 本次推理阶段实际耗时
+
+        Returns:
+            float: 节省的秒数，尚无完整推理的耗时记录时为 0
+        """
+        if self.reasoning_latency is None:
+            return 0.0
+        saved = max(0.0, self.reasoning_latency - elapsed)
+        self.saved_seconds[route] += saved
+        return saved
+
+    def stats(self) -> dict:
+        """获取路由统计
+
+        Returns:
+            dict: 各路由的请求数、估算节省的延迟及完整推理的平均耗时
+        """
+        return {
+            "routes": dict(self.routes),
+            "saved_seconds": {route: round(seconds, 3) for route, seconds in self.saved_seconds.items()},
+            "reasoning_latency_ewma": round(self.reasoning_latency, 3) if self.reasoning_latency is not None else None,
+            "short_prompt_tokens": self.short_prompt_tokens,
+            "cap_tokens": self.cap_tokens,
+        }
+
+
+def _last_user_content(messages: list) -> Optional[str]:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content")
+            return content if isinstance(content, str) else None
+    return None
@@ -0,0 +1,179 @@
+"""相同请求的单飞合并：并发的相同请求共享一条上游流水线"""
+import asyncio
+import itertools
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncGenerator, Callable, Optional
+from app.utils.logger import logger
+
+
+class _Flight:
+    """一条进行中的共享流水线
+
+    订阅者的读取位置为绝对位置；所有订阅者都读过的事件会被丢弃，只有仍可加入时才保留
+    完整前缀供迟到的订阅者回放。
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.history: deque = deque()  # 尚未被所有订阅者读取（或仍需回放）的事件
+        self.start = 0  # history[0] 的绝对位置
+        self.produced = 0  # 已产出的事件总数
+        self.positions: dict[int, int] = {}  # 订阅者 -> 已读取的位置
+        self.slack: dict[int, int] = {}  # 订阅者 -> 加入时已产出的事件数，回放这段前缀时不拖慢流水线
+        self.joinable = True
+        self.done = False
+        self.cond = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+    def events_from(self, position: int) -> list:
+        """读取从绝对位置开始的所有事件"""
+        return list(itertools.islice(self.history, position - self.start, None))
+
+    def lag(self) -> int:
+        """流水线领先最慢订阅者的事件数，回放中的订阅者按加入时的位置计"""
+        return max((self.produced - position - self.slack[subscriber]
+                    for subscriber, position in self.positions.items()), default=0)
+
+    def trim(self) -> None:
+        """丢弃所有订阅者都已读取的事件，仍可加入时保留完整前缀"""
+        if self.joinable:
+            return
+        low = min(self.positions.values(), default=self.produced)
+        while self.start < low:
+            self.history.popleft()
+            self.start += 1
+
+
+class SingleFlight:
+    """单飞合并器
+
+    第一个请求（leader）启动真正的流水线，之后相同键的并发请求只订阅它的输出。
+    流水线产出前 `join_window` 个事件期间，新请求可以加入并从头回放；之后不再接受加入，
+    相同的新请求启动自己的流水线，已被所有订阅者读取的事件随即丢弃，每条流水线最多
+    保留 `join_window + max_lag` 个事件。
+
+    流水线最多领先最慢的订阅者 `max_lag` 个事件，从而保留背压；迟到的订阅者回放前缀时
+    不计入领先量，不会拖慢其他订阅者。所有订阅者离开后流水线会被取消。
+    """
+
+    def __init__(self, max_lag: int = 1024, join_window: int = 1024):
+        """初始化合并器
+
+        Args:
+            max_lag: 流水线领先最慢订阅者的最大事件数，0 表示不限制
+            join_window: 流水线产出超过该事件数后不再接受加入，0 表示只在产出第一个事件前接受
+        """
+        self.max_lag = max_lag
+        self.join_window = join_window
+        self._flights: dict[str, _Flight] = {}
+        self._subscriber_ids = itertools.count()
+        self.flights_started = 0
+        self.coalesced = 0  # 加入已有流水线、节省了一次上游调用的请求数
+        self.too_late = 0  # 相同流水线已过加入窗口、另起流水线的请求数
+
+    def stats(self) -> dict:
+        """获取合并统计
+
+        Returns:
+            dict: 进行中的流水线数、订阅者数、保留的事件数及累计合并次数
+        """
+        return {
+            "in_flight": len(self._flights),
+            "subscribers": sum(len(flight.positions) for flight in self._flights.values()),
+            "buffered_events": sum(len(flight.history) for flight in self._flights.values()),
+            "flights_started": self.flights_started,
+            "coalesced": self.coalesced,
+            "too_late": self.too_late,
+        }
+
+    async def subscribe(self, key: str, factory: Callable[[], AsyncGenerator],
+                        on_join: Optional[Callable[[], None]] = None) -> AsyncGenerator:
+        """订阅键对应的流水线，不存在或已过加入窗口时用 factory 创建
+
+        Args:
+            key: 规范化后的请求键
+            factory: 创建流水线事件生成器的函数
+            on_join: 加入已有流水线（不调用 factory）时的回调，用于释放为上游预留的资源
+
+        Yields:
+            流水线产出的事件，迟到的订阅者会先收到已产出的前缀
+        """
+        flight = self._flights.get(key)
+        subscriber = next(self._subscriber_ids)
+        if flight is None or not flight.joinable:
+            if flight is not None:
+                self.too_late += 1
+                logger.info(f"相同请求的流水线已产出 {flight.produced} 个事件，超过加入窗口，启动新的流水线")
+            flight = _Flight(key)
+            flight.positions[subscriber] = 0
+            flight.slack[subscriber] = 0
+            flight.task = asyncio.create_task(self._pump(flight, factory))
+            self._flights[key] = flight
+            self.flights_started += 1
+        else:
+            flight.positions[subscriber] = 0
+            flight.slack[subscriber] = flight.produced
+            self.coalesced += 1
+            if on_join is not None:
+                on_join()
+            logger.info(f"合并相同请求，共享进行中的流水线 | 已产出事件: {flight.produced} | 订阅者: {len(flight.positions)}")
+
+        position = 0
+        try:
+            while True:
+                async with flight.cond:
+                    await flight.cond.wait_for(lambda: position < flight.produced or flight.done)
+                    events = flight.events_from(position)
+                if not events:
+                    break
+                for event in events:
+                    yield event
+                position += len(events)
+                flight.positions[subscriber] = position
+                async with flight.cond:
+                    flight.trim()
+                    flight.cond.notify_all()
+        finally:
+            # 同步移除订阅者：客户端断开时之后的 await 可能被再次取消
+            flight.positions.pop(subscriber, None)
+            flight.slack.pop(subscriber, None)
+            last = not flight.positions and not flight.done and flight.task is not None
+            if last:
+                # 最后一个订阅者离开，取消共享流水线及其上游连接
+                flight.task.cancel()
+            await asyncio.shield(self._leave(flight, last))
+
+    @staticmethod
+    async def _leave(flight: _Flight, last: bool) -> None:
+        """订阅者离开后唤醒可能在等待它的流水线，最后一个订阅者离开时等待流水线结束"""
+        async with flight.cond:
+            flight.trim()
+            flight.cond.notify_all()
+        if last:
+            await asyncio.gather(flight.task, return_exceptions=True)
+
+    async def _pump(self, flight: _Flight, factory: Callable[[], AsyncGenerator]) -> None:
+        """运行流水线，将事件追加到共享历史"""
+        try:
+            async with aclosing(factory()) as events:
+                async for event in events:
+                    async with flight.cond:
+                        flight.history.append(event)
+                        flight.produced += 1
+                        if flight.joinable and flight.produced > self.join_window:
+                            # 关闭加入窗口，此后只保留尚未被所有订阅者读取的事件
+                            flight.joinable = False
+                            flight.trim()
+                        flight.cond.notify_all()
+                        if self.max_lag:
+                            await flight.cond.wait_for(lambda: flight.lag() <= self.max_lag)
+        except Exception as e:
+            logger.error(f"共享流水线发生错误: {e}")
+        finally:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            flight.joinable = False
+            flight.done = True
+            async with flight.cond:
+                flight.cond.notify_all()
@@ -0,0 +1,183 @@
+"""有界流缓冲区，在阶段任务与响应生成器之间提供背压"""
+import asyncio
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Any, Optional
+
+
+def text_size(text: str) -> int:
+    """计算文本的 UTF-8 字节数，纯 ASCII 文本无需编码
+
+    Args:
+        text: 文本
+
+    Returns:
+        int: 字节数
+    """
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+@dataclass
+class StreamBufferStats:
+    """单个请求的缓冲区统计"""
+    chat_id: str
+    buffered_frames: int = 0
+    buffered_bytes: int = 0
+    peak_frames: int = 0
+    peak_bytes: int = 0
+    total_frames: int = 0
+    total_bytes: int = 0
+    producer_waits: int = 0  # 生产者因达到水位线而被阻塞的次数
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class StreamBuffer:
+    """按帧数和字节数双重限制的异步缓冲区
+
+    当缓冲的帧数或字节数达到水位线时 `put` 会挂起，直到消费者取走数据，
+    从而让慢客户端反向限制上游读取速度，避免内存无限增长。
+    结束标记通过 `put_nowait` 写入，不受水位线限制，保证清理路径永不阻塞。
+    支持多个生产者，但只允许一个消费者。
+    """
+
+    def __init__(self, chat_id: str, max_frames: int = 0, max_bytes: int = 0):
+        """初始化缓冲区
+
+        Args:
+            chat_id: 所属请求的会话ID，仅用于统计
+            max_frames: 最多缓冲的帧数，0 表示不限制
+            max_bytes: 最多缓冲的字节数，0 表示不限制
+        """
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.stats = StreamBufferStats(chat_id=chat_id)
+        self._items: deque = deque()
+        self._getter: Optional[asyncio.Future] = None
+        self._putters: deque[asyncio.Future] = deque()
+
+    def full(self) -> bool:
+        """是否已达到任一水位线"""
+        return bool(
+            (self.max_frames and self.stats.buffered_frames >= self.max_frames)
+            or (self.max_bytes and self.stats.buffered_bytes >= self.max_bytes)
+        )
+
+    async def put(self, item: Any, size: int = 0) -> None:
+        """写入一帧，达到水位线时等待消费者取走数据
+
+        Args:
+            item: 帧数据
+            size: 帧的字节数，计入字节水位线
+        """
+        if self.full():
+            self.stats.producer_waits += 1
+            loop = asyncio.get_running_loop()
+            while self.full():
+                putter = loop.create_future()
+                self._putters.append(putter)
+                try:
+                    await putter
+                except BaseException:
+                    if putter.done() and not putter.cancelled():
+                        # 已被唤醒但在恢复前被取消或超时，把这次唤醒转交给下一个生产者，否则它可能一直挂起
+                        self._wake_putter()
+                    else:
+                        putter.cancel()
+                        if putter in self._putters:
+                            self._putters.remove(putter)
+                    raise
+        self.put_nowait(item, size)
+
+    def put_nowait(self, item: Any, size: int = 0) -> None:
+        """不检查水位线直接写入，用于结束标记等不允许阻塞的场景
+
+        Args:
+            item: 帧数据
+            size: 帧的字节数
+        """
+        stats = self.stats
+        self._items.append((item, size))
+        stats.buffered_frames += 1
+        stats.buffered_bytes += size
+        stats.total_frames += 1
+        stats.total_bytes += size
+        if stats.buffered_frames > stats.peak_frames:
+            stats.peak_frames = stats.buffered_frames
+        if stats.buffered_bytes > stats.peak_bytes:
+            stats.peak_bytes = stats.buffered_bytes
+        getter = self._getter
+        if getter is not None and not getter.done():
+            getter.set_result(None)
+
+    def empty(self) -> bool:
+        """缓冲区是否为空"""
+        return not self._items
+
+    async def wait(self, timeout: float) -> bool:
+        """等待缓冲区出现数据，最多等待 timeout 秒
+
+        使用定时回调而不是 asyncio.wait_for，避免每次等待都创建任务。
+
+        Args:
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            bool: 缓冲区是否有数据
+        """
+        if self._items:
+            return True
+        loop = asyncio.get_running_loop()
+        getter = self._getter = loop.create_future()
+        handle = loop.call_later(timeout, _wake, getter)
+        try:
+            await getter
+        finally:
+            handle.cancel()
+            self._getter = None
+        return bool(self._items)
+
+    async def get(self) -> Any:
+        """取出一帧，缓冲区为空时等待
+
+        Returns:
+            Any: 帧数据
+        """
+        while not self._items:
+            self._getter = asyncio.get_running_loop().create_future()
+            try:
+                await self._getter
+            finally:
+                self._getter = None
+        return self.get_nowait()
+
+    def get_nowait(self) -> Any:
+        """立即取出一帧
+
+        Returns:
+            Any: 帧数据
+
+        Raises:
+            asyncio.QueueEmpty: 缓冲区为空
+        """
+        if not self._items:
+            raise asyncio.QueueEmpty
+        item, size = self._items.popleft()
+        self.stats.buffered_frames -= 1
+        self.stats.buffered_bytes -= size
+        # 唤醒一个等待中的生产者，若仍超过水位线它会再次挂起
+        self._wake_putter()
+        return item
+
+    def _wake_putter(self) -> None:
+        while self._putters:
+            putter = self._putters.popleft()
+            if not putter.done():
+                putter.set_result(None)
+                break
@@ -1,27 +1,78 @@
+import asyncio
 import os
-import sys
+import json
+import math
+import re
+import tempfile
 import time
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from app.utils.settings import get_settings
 from app.utils.logger import logger
-from app.utils.auth import verify_api_key
-from app.deepgenimi.deepgenimi import DeepGenimi
+from app.utils.auth import verify_api_key, Tenant, TENANTS
+from app.utils.streaming import ClosingStreamingResponse
+from app.utils import metrics
+from app.utils.server import install_drain_handler, on_drain
+from app.utils.shared_state import SharedState
+from app.utils.tracing import Tracer, OTLPHttpExporter, FileSpanExporter
+from app.clients import HttpPool, Endpoint, EndpointPool, HedgePolicy, StageTimeouts
+from app.deepgenimi import (DeepGenimi, ReasoningCache, SQLiteCacheBackend, SingleFlight, FrameBatcher,
+                            AdmissionController, OverloadedError, ReasoningCompactor, HistoryWindow, ReasoningRouter)
+from app.deepgenimi.reasoning_compactor import parse_strategies
+from app.deepgenimi.batch import BatchRunner, BatchProgress, iter_jsonl
+
+# 配置在进程内只加载一次，各项说明见 app.utils.settings.Settings
+settings = get_settings()
 
-app = FastAPI(title="DeepGenimi API")
+# 上游客户端与各组件在应用启动时由 create_services() 创建，导入本模块不会连接上游或打开缓存文件
+http_pool: HttpPool = None
+deepseek_endpoints: EndpointPool = None
+deepseek_hedge: HedgePolicy = None
+reasoning_cache: ReasoningCache = None
+single_flight: SingleFlight = None
+frame_batcher: FrameBatcher = None
+history_window: HistoryWindow = None
+reasoning_router: ReasoningRouter = None
+admission: AdmissionController = None
+deep_genimi: DeepGenimi = None
+shared_state: SharedState = None
+tracer: Tracer = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时创建上游客户端并预热共享连接池，关闭时释放"""
+    create_services()
+    await http_pool.start()
+    await http_pool.warmup([endpoint.url for endpoint in deepseek_endpoints.endpoints] + [settings.gemini_api_url],
+                           settings.http_pool_warmup_connections)
+    install_drain_handler()
+    tracer.start()
+    publisher = asyncio.create_task(publish_shared_state()) if shared_state is not None else None
+    try:
+        yield
+    finally:
+        if publisher is not None:
+            publisher.cancel()
+            shared_state.remove("metrics")
+            shared_state.remove("worker")
+        await http_pool.close()
+        if reasoning_cache is not None:
+            reasoning_cache.close()
+        tracer.shutdown()
+
+app = FastAPI(title="DeepGenimi API", lifespan=lifespan)
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
+    # 流式响应在返回响应对象时尚未输出任何内容，完整耗时见 /metrics 中的 deepgenimi_request_duration_seconds
     start_time = time.time()
     
     # Log request details
-    logger.debug(f"[REQUEST_START] {request.method} {request.url}")
-    logger.debug(f"[REQUEST_HEADERS] {dict(request.headers)}")
+    logger.debug("[REQUEST_START] %s %s", request.method, request.url)
+    logger.debug("[REQUEST_HEADERS] %s", request.headers)
     
     try:
         response = await call_next(request)
@@ -29,9 +80,8 @@ async def log_requests(request: Request, call_next):
         
         # Log response details
         logger.debug(
-            f"[REQUEST_COMPLETE] {request.method} {request.url} | "
-            f"Processing Time: {process_time:.2f}ms | "
-            f"Status Code: {response.status_code}"
+            "[REQUEST_COMPLETE] %s %s | Processing Time: %.2fms | Status Code: %s",
+            request.method, request.url, process_time, response.status_code
         )
         return response
     except Exception as e:
@@ -39,22 +89,8 @@ async def log_requests(request: Request, call_next):
         logger.error("Request error details:", exc_info=True)
         raise
 
-# Get CORS configuration, API keys, URLs and model names from environment variables
-ALLOW_ORIGINS = os.getenv("ALLOW_ORIGINS", "*")
-
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_MODEL = os.getenv("GEMINI_MODEL")
-GEMINI_PROVIDER = os.getenv("GEMINI_PROVIDER", "google") # Gemini模型提供商, 默认为google
-GEMINI_API_URL = os.getenv("GEMINI_API_URL", "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:streamGenerateContent")
-
-DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-DEEPSEEK_API_URL = os.getenv("DEEPSEEK_API_URL")
-DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL")
-
-IS_ORIGIN_REASONING = os.getenv("IS_ORIGIN_REASONING", "True").lower() == "true"
-
 # CORS设置
-allow_origins_list = ALLOW_ORIGINS.split(",") if ALLOW_ORIGINS else [] # 将逗号分隔的字符串转换为列表
+allow_origins_list = settings.allow_origins.split(",") if settings.allow_origins else [] # 将逗号分隔的字符串转换为列表
 
 app.add_middleware(
     CORSMiddleware,
@@ -64,69 +100,487 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 创建 DeepGenimi 实例, 提出为Global变量
-if not DEEPSEEK_API_KEY or not GEMINI_API_KEY:
-    logger.critical("请设置环境变量 GEMINI_API_KEY 和 DEEPSEEK_API_KEY")
-    sys.exit(1)
-
-deep_genimi = DeepGenimi(
-    DEEPSEEK_API_KEY,
-    GEMINI_API_KEY,
-    DEEPSEEK_API_URL,
-    GEMINI_API_URL,
-    GEMINI_PROVIDER,
-    IS_ORIGIN_REASONING
-)
+
+def per_worker(limit: int) -> int:
+    """把全局上限分摊到单个工作进程，0（不限制）保持不变"""
+    return math.ceil(limit / settings.workers) if limit > 0 else limit
+
+
+def create_services() -> None:
+    """按配置创建上游客户端与各组件（提出为Global变量），重复调用时保留已创建的实例
+
+    Raises:
+        RuntimeError: 未配置上游 API 密钥
+    """
+    global http_pool, deepseek_endpoints, deepseek_hedge, reasoning_cache, single_flight, frame_batcher, \
+        history_window, reasoning_router, admission, deep_genimi, shared_state, tracer
+    if deep_genimi is not None:
+        return
+
+    if not (settings.deepseek_api_key or settings.deepseek_endpoints) or not settings.gemini_api_key:
+        logger.critical("请设置环境变量 GEMINI_API_KEY 和 DEEPSEEK_API_KEY（或 DEEPSEEK_ENDPOINTS）")
+        raise RuntimeError("GEMINI_API_KEY and DEEPSEEK_API_KEY (or DEEPSEEK_ENDPOINTS) must be set")
+
+    if settings.deepseek_endpoints:
+        deepseek_endpoints = EndpointPool([Endpoint(**item) for item in json.loads(settings.deepseek_endpoints)],
+                                          cooldown=settings.deepseek_eject_cooldown)
+    else:
+        deepseek_endpoints = EndpointPool([Endpoint(settings.deepseek_api_url, settings.deepseek_api_key, name="deepseek")],
+                                          cooldown=settings.deepseek_eject_cooldown)
+
+    http_pool = HttpPool(
+        limit=settings.http_pool_limit,
+        limit_per_host=settings.http_pool_limit_per_host,
+        dns_cache_ttl=settings.http_dns_cache_ttl,
+        keepalive_timeout=settings.http_keepalive_timeout,
+        connect_timeout=settings.http_connect_timeout,
+    )
+
+    if settings.workers > 1 and settings.shared_state_dir:
+        shared_state = SharedState(settings.shared_state_dir)
+
+    reasoning_cache_path = settings.reasoning_cache_path
+    if shared_state is not None and not reasoning_cache_path:
+        # 多进程时推理缓存落到共享的 SQLite 文件，一个进程算出的推理其他进程也能命中
+        reasoning_cache_path = os.path.join(settings.shared_state_dir, "reasoning_cache.sqlite3")
+
+    if settings.reasoning_cache_size > 0:
+        reasoning_cache = ReasoningCache(
+            max_entries=settings.reasoning_cache_size,
+            ttl=settings.reasoning_cache_ttl,
+            backend=SQLiteCacheBackend(reasoning_cache_path) if reasoning_cache_path else None,
+        )
+
+    if settings.request_coalescing:
+        single_flight = SingleFlight(max_lag=settings.stream_max_buffered_frames,
+                                     join_window=settings.request_coalescing_join_window)
+
+    if settings.frame_coalescing:
+        frame_batcher = FrameBatcher(
+            max_bytes=settings.frame_coalescing_max_bytes,
+            max_delay=settings.frame_coalescing_max_delay_ms / 1000,
+        )
+
+    if settings.deepseek_hedge:
+        deepseek_hedge = HedgePolicy(
+            delay=settings.deepseek_hedge_delay_ms / 1000,
+            percentile=settings.deepseek_hedge_percentile,
+            budget=settings.deepseek_hedge_budget,
+        )
+
+    reasoning_compactor = None
+    if settings.reasoning_compaction:
+        reasoning_compactor = ReasoningCompactor(
+            budget_tokens=settings.reasoning_budget_tokens,
+            strategies=parse_strategies(settings.reasoning_compaction_strategies),
+        )
+
+    if settings.history_window:
+        history_window = HistoryWindow(
+            budgets=json.loads(settings.model_context_budgets) if settings.model_context_budgets else None,
+            default_budget=settings.history_default_budget,
+        )
+
+    if settings.reasoning_router:
+        reasoning_router = ReasoningRouter(
+            short_prompt_tokens=settings.reasoning_router_short_tokens,
+            skip_pattern=settings.reasoning_router_skip_pattern,
+            full_pattern=settings.reasoning_router_full_pattern,
+            cap_tokens=settings.reasoning_router_cap_tokens,
+        )
+
+    tracer = Tracer(
+        sample_ratio=settings.tracing_sample_ratio,
+        exporter=create_span_exporter(),
+        service_name=settings.tracing_service_name,
+        batch_size=settings.tracing_batch_size,
+        flush_interval=settings.tracing_flush_interval,
+        max_queue=settings.tracing_max_queue,
+        propagate=settings.tracing_propagate,
+    )
+
+    admission = AdmissionController(
+        deepseek_concurrency=per_worker(settings.deepseek_max_concurrency),
+        gemini_concurrency=per_worker(settings.gemini_max_concurrency),
+        max_queue=per_worker(settings.admission_max_queue),
+        max_queue_time=settings.admission_max_queue_time,
+        retry_after=settings.admission_retry_after,
+    )
+
+    deep_genimi = DeepGenimi(
+        settings.deepseek_api_key,
+        settings.gemini_api_key,
+        settings.deepseek_api_url,
+        settings.gemini_api_url,
+        settings.gemini_provider,
+        settings.is_origin_reasoning,
+        gemini_backend=settings.gemini_backend,
+        http_pool=http_pool,
+        max_buffered_frames=settings.stream_max_buffered_frames,
+        max_buffered_bytes=settings.stream_max_buffered_bytes,
+        reasoning_cache=reasoning_cache,
+        single_flight=single_flight,
+        frame_batcher=frame_batcher,
+        deepseek_endpoints=deepseek_endpoints,
+        deepseek_max_attempts=settings.deepseek_max_attempts,
+        deepseek_hedge=deepseek_hedge,
+        reasoning_compactor=reasoning_compactor,
+        history_window=history_window,
+        reasoning_router=reasoning_router,
+        request_timeout=settings.request_timeout,
+        max_request_timeout=settings.request_max_timeout,
+        reasoning_deadline_share=settings.reasoning_deadline_share,
+        deepseek_timeouts=StageTimeouts(
+            connect=settings.deepseek_connect_timeout,
+            first_byte=settings.deepseek_first_byte_timeout,
+            idle=settings.deepseek_idle_timeout,
+        ),
+        gemini_timeouts=StageTimeouts(
+            connect=settings.gemini_connect_timeout,
+            first_byte=settings.gemini_first_byte_timeout,
+            idle=settings.gemini_idle_timeout,
+        ),
+    )
+
+    # 抓取时取值的队列与并发指标
+    for stage, limiter in (("deepseek", admission.deepseek), ("gemini", admission.gemini)):
+        metrics.registry.gauge(
+            f"deepgenimi_{stage}_in_flight", f"{stage} 阶段进行中的请求数", callback=lambda limiter=limiter: limiter.in_flight)
+        metrics.registry.gauge(
+            f"deepgenimi_{stage}_queued", f"{stage} 阶段排队中的请求数", callback=lambda limiter=limiter: limiter.waiting)
+    metrics.registry.gauge(
+        "deepgenimi_active_pipelines", "运行中的上游流水线数", callback=lambda: len(deep_genimi.stream_stats()))
+    metrics.registry.gauge(
+        "deepgenimi_buffered_frames", "所有流水线输出缓冲中的帧数",
+        callback=lambda: sum(stats["buffered_frames"] for stats in deep_genimi.stream_stats()))
+
+    on_drain(admission.begin_drain)
+
+def create_span_exporter():
+    """按 TRACING_EXPORTER 创建 Span 导出器，none 时返回 None（不追踪）"""
+    kind = settings.tracing_exporter.lower()
+    if kind == "otlp":
+        return OTLPHttpExporter(settings.tracing_otlp_endpoint)
+    if kind == "file":
+        path = settings.tracing_file
+        if settings.workers > 1:
+            # 各工作进程写各自的文件，轮转时互不干扰
+            root, ext = os.path.splitext(path)
+            path = f"{root}.{os.getpid()}{ext}"
+        return FileSpanExporter(path, settings.tracing_file_max_bytes, settings.tracing_file_backups)
+    if kind != "none":
+        logger.warning(f"未知的 TRACING_EXPORTER: {settings.tracing_exporter}，链路追踪已关闭")
+    return None
 
 # 验证日志级别
 logger.debug("当前日志级别为 DEBUG")
 logger.info("开始请求")
 
+
+def worker_stats() -> dict:
+    """当前工作进程的准入、租户与进行中流的统计"""
+    return {
+        "pid": os.getpid(),
+        "admission": admission.stats(),
+        "tenants": [tenant.stats() for tenant in TENANTS.values()],
+        "active_streams": len(deep_genimi.stream_stats()),
+    }
+
+
+async def publish_shared_state():
+    """定期发布本进程的指标快照与统计，供其他工作进程汇总"""
+    while True:
+        try:
+            # 快照在事件循环中生成，序列化与写文件放到线程中，不阻塞请求处理
+            snapshot, stats = metrics.registry.snapshot(), worker_stats()
+            await asyncio.to_thread(shared_state.publish, "metrics", snapshot)
+            await asyncio.to_thread(shared_state.publish, "worker", stats)
+        except OSError as e:
+            logger.warning(f"发布共享状态失败: {e}")
+        await asyncio.sleep(settings.shared_state_interval)
+
+
 @app.get("/", dependencies=[Depends(verify_api_key)])
 async def root():
     logger.info("访问了根路径")
     return {"message": "Welcome to DeepGenimi API"}
 
-@app.post("/v1/chat/completions", dependencies=[Depends(verify_api_key)])
-async def chat_completions(request: Request):
-    """Handle chat completion request and return streaming response
+@app.get("/metrics", dependencies=[Depends(verify_api_key)])
+async def prometheus_metrics():
+    """Prometheus 文本格式的指标，多进程时汇总所有工作进程"""
+    others = None
+    if shared_state is not None:
+        others = [snapshot["data"] for snapshot in await asyncio.to_thread(shared_state.collect, "metrics")]
+    return PlainTextResponse(metrics.registry.render(others), media_type="text/plain; version=0.0.4")
+
+@app.get("/v1/streams", dependencies=[Depends(verify_api_key)])
+async def streams():
+    """查询进行中请求的输出缓冲统计及请求合并统计"""
+    return {
+        "streams": deep_genimi.stream_stats(),
+        "coalescing": single_flight.stats() if single_flight is not None else None,
+        "frame_batching": frame_batcher.stats() if frame_batcher is not None else None,
+    }
+
+@app.get("/v1/cache", dependencies=[Depends(verify_api_key)])
+async def cache_stats():
+    """查询推理缓存统计"""
+    if reasoning_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **reasoning_cache.stats()}
+
+@app.get("/v1/history", dependencies=[Depends(verify_api_key)])
+async def history_stats():
+    """查询历史窗口统计：各模型预算、裁剪次数、丢弃的消息数与去掉推理内容的消息数"""
+    if history_window is None:
+        return {"enabled": False}
+    return {"enabled": True, **history_window.stats()}
+
+@app.get("/v1/routing", dependencies=[Depends(verify_api_key)])
+async def routing_stats():
+    """查询推理路由统计：各路由（skip/cap/full）的请求数与估算节省的延迟"""
+    if reasoning_router is None:
+        return {"enabled": False}
+    return {"enabled": True, **reasoning_router.stats()}
+
+@app.get("/v1/tracing", dependencies=[Depends(verify_api_key)])
+async def tracing_stats():
+    """查询链路追踪统计：采样比例、导出目标及已导出/丢弃的 Span 数"""
+    return tracer.stats()
+
+@app.get("/v1/admission", dependencies=[Depends(verify_api_key)])
+async def admission_stats():
+    """查询准入控制统计：各阶段进行中与排队中的请求数"""
+    return admission.stats()
+
+@app.get("/v1/upstreams", dependencies=[Depends(verify_api_key)])
+async def upstream_stats():
+    """查询 DeepSeek 各端点的首 token 延迟、错误率与摘除状态，以及对冲统计"""
+    return {
+        "deepseek": deepseek_endpoints.stats(),
+        "hedging": deepseek_hedge.stats() if deepseek_hedge is not None else None,
+    }
+
+@app.get("/v1/tenants", dependencies=[Depends(verify_api_key)])
+async def tenant_stats():
+    """查询各租户的限额、进行中的请求数与限流次数"""
+    return [tenant.stats() for tenant in TENANTS.values()]
+
+@app.get("/v1/workers", dependencies=[Depends(verify_api_key)])
+async def workers_stats():
+    """查询各工作进程的准入、租户与进行中流的统计，其他进程的数据最多滞后 SHARED_STATE_INTERVAL 秒"""
+    workers = [worker_stats()]
+    if shared_state is not None:
+        workers += [snapshot["data"] for snapshot in await asyncio.to_thread(shared_state.collect, "worker")]
+    return {"workers": settings.workers, "stats": workers}
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request, tenant: Tenant = Depends(verify_api_key)):
+    """Handle chat completion request and return streaming or non-streaming response
     
     Request body should be compatible with OpenAI API format, including:
     - messages: List of messages
     - model: Model name (optional)
-    - stream: Whether to use streaming output (must be True)
+    - stream: Whether to use streaming output (optional, default False returns a single chat.completion)
     - temperature: Randomness (optional)
     - top_p: Top-p sampling (optional)
     - presence_penalty: Topic freshness (optional)
     - frequency_penalty: Frequency penalty (optional)
+    - stream_options.coalesce: Merge consecutive deltas into fewer frames (optional, default True)
+    - reasoning_effort: "none"/"minimal" skips DeepSeek reasoning, "low" caps it, "medium"/"high" run it fully (optional)
+    - timeout: End-to-end deadline in seconds, also accepted as the X-Request-Timeout header (optional).
+      Reasoning that overruns its share of the deadline is handed to Gemini as is.
+
+    A W3C traceparent header is continued when tracing is enabled; sampled requests get an X-Trace-Id response header.
+    Upstream calls carry a traceparent header only when TRACING_PROPAGATE is enabled.
     """
+    span = tracer.start_trace("POST /v1/chat/completions", request.headers.get("traceparent"),
+                              attributes={"tenant": tenant.name})
+    trace_headers = {"X-Trace-Id": span.trace_id} if span.recording else None
 
     try:
         # 1. Get basic information
         body = await request.json()
         messages = body.get("messages")
+        # The deadline starts now, so time spent queueing for admission counts against it
+        deadline = deep_genimi.new_deadline(get_request_timeout(request, body))
 
         # 2. Get and validate parameters
         model_arg = (
             get_and_validate_params(body)
         )
 
-        # 3. Return streaming response
-        return StreamingResponse(
+        # 3. Per-tenant limits: request rate and concurrent requests
+        retry_after = tenant.try_acquire_request()
+        if retry_after:
+            raise OverloadedError(f"Rate limit exceeded for tenant {tenant.name}", math.ceil(retry_after))
+        if not tenant.try_open_stream():
+            raise OverloadedError(f"Too many concurrent requests for tenant {tenant.name}", settings.admission_retry_after)
+
+        # 4. Admission control: wait for a DeepSeek slot (fair-shared across tenants) or fail fast with 429.
+        # Routing happens first so prompts that skip reasoning queue for Gemini only and never take a DeepSeek slot
+        try:
+            decision = deep_genimi.route(messages, body.get("reasoning_effort"))
+            with span.child("admission"):
+                permit = await admission.admit(tenant=tenant.name, weight=tenant.weight,
+                                               skip_reasoning=decision.route == "skip")
+        except BaseException:
+            tenant.close_stream()
+            raise
+
+        def on_close():
+            tenant.close_stream()
+            permit.release_unclaimed()
+            span.end()
+
+        # 5. Non-streaming: aggregate the stage outputs and return one chat.completion
+        span.set_attribute("stream", bool(body.get("stream", False)))
+        if not body.get("stream", False):
+            try:
+                result = await deep_genimi.chat_completions_without_stream(
+                    messages=messages,
+                    model_arg=model_arg,
+                    deepseek_model=settings.deepseek_model,
+                    gemini_model=settings.gemini_model,
+                    permit=permit,
+                    reasoning_effort=body.get("reasoning_effort"),
+                    deadline=deadline,
+                    span=span,
+                    decision=decision
+                )
+                return JSONResponse(result, headers=trace_headers)
+            finally:
+                on_close()
+
+        # Latency-critical clients can opt out of frame coalescing
+        coalesce = (body.get("stream_options") or {}).get("coalesce", True) is not False
+
+        # 6. Return streaming response
+        return ClosingStreamingResponse(
             deep_genimi.chat_completions_with_stream(
                 messages=messages,
                 model_arg=model_arg,
-                deepseek_model=DEEPSEEK_MODEL,
-                gemini_model=GEMINI_MODEL
+                deepseek_model=settings.deepseek_model,
+                gemini_model=settings.gemini_model,
+                coalesce=coalesce,
+                permit=permit,
+                reasoning_effort=body.get("reasoning_effort"),
+                deadline=deadline,
+                span=span,
+                decision=decision
             ),
-            media_type="text/event-stream"
+            media_type="text/event-stream",
+            headers=trace_headers,
+            on_close=on_close
         )
 
+    except OverloadedError as e:
+        span.set_attribute("http.status_code", e.status)
+        span.record_error(e)
+        span.end()
+        return JSONResponse(
+            status_code=e.status,
+            content={"error": str(e)},
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         logger.error(f"Error processing request: {e}")
+        span.record_error(e)
+        span.end()
         return {"error": str(e)}
 
 
+# 正在运行的批次，同一批次同时只允许一个请求写入进度文件
+_active_batches: set[str] = set()
+_BATCH_ID = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+
+@app.post("/v1/batch")
+async def batch(request: Request, concurrency: int = settings.batch_concurrency, batch_id: str = "",
+                tenant: Tenant = Depends(verify_api_key)):
+    """Run a JSONL batch of chat requests and stream JSONL results in completion order
+
+    Each input line is either {"custom_id": ..., "body": {chat request}} or a bare chat request.
+    Each output line is {"custom_id": ..., "response": chat.completion | null, "error": {...} | null}.
+    With batch_id, results are also saved on the server; resubmitting the same batch_id replays the
+    finished results and only runs the remaining (or failed) items.
+    """
+    if batch_id and not _BATCH_ID.match(batch_id):
+        return JSONResponse(status_code=400, content={"error": "Invalid batch_id"})
+    state_key = f"{tenant.name}/{batch_id}" if batch_id else ""
+    if state_key in _active_batches:
+        return JSONResponse(status_code=409, content={"error": f"Batch {batch_id} is already running"})
+
+    # The whole batch counts as one request against the tenant's limits
+    retry_after = tenant.try_acquire_request()
+    if retry_after:
+        return JSONResponse(status_code=429, content={"error": f"Rate limit exceeded for tenant {tenant.name}"},
+                            headers={"Retry-After": str(math.ceil(retry_after))})
+    if not tenant.try_open_stream():
+        return JSONResponse(status_code=429, content={"error": f"Too many concurrent requests for tenant {tenant.name}"},
+                            headers={"Retry-After": str(settings.admission_retry_after)})
+
+    # Spool the request body to disk first: it may be large, and the response starts streaming before it is consumed
+    spool = tempfile.TemporaryFile()
+    progress = None
+    try:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        if state_key:
+            progress = await asyncio.to_thread(
+                BatchProgress, os.path.join(settings.batch_state_dir, tenant.name, f"{batch_id}.jsonl"))
+            _active_batches.add(state_key)
+    except BlockingIOError:
+        # Another worker process holds the progress file
+        spool.close()
+        tenant.close_stream()
+        return JSONResponse(status_code=409, content={"error": f"Batch {batch_id} is already running"})
+    except BaseException:
+        spool.close()
+        tenant.close_stream()
+        raise
+
+    async def read_spool():
+        while chunk := spool.read(1 << 16):
+            yield chunk
+
+    runner = BatchRunner(
+        deep_genimi, settings.deepseek_model, settings.gemini_model,
+        parse_params=get_and_validate_params,
+        concurrency=max(1, min(concurrency, settings.batch_max_concurrency)),
+        admit=lambda skip_reasoning: admission.admit(tenant=tenant.name, weight=tenant.weight,
+                                                     skip_reasoning=skip_reasoning),
+    )
+
+    async def results():
+        async for line in runner.run(iter_jsonl(read_spool()), progress):
+            yield line.encode("utf-8") + b"\n"
+        logger.info(f"批处理完成 | 租户: {tenant.name} | 批次: {batch_id or '-'} | {runner.stats()}")
+
+    def on_close():
+        spool.close()
+        if progress is not None:
+            progress.close()
+            _active_batches.discard(state_key)
+        tenant.close_stream()
+
+    return ClosingStreamingResponse(results(), media_type="application/x-ndjson", on_close=on_close)
+
+
+def get_request_timeout(request: Request, body: dict):
+    """Client-requested deadline in seconds from the X-Request-Timeout header or the timeout body field, None if unset"""
+    value = request.headers.get("x-request-timeout", body.get("timeout"))
+    if value is None:
+        return None
+    try:
+        timeout = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("timeout must be a number of seconds") from None
+    if not math.isfinite(timeout) or timeout <= 0:
+        raise ValueError("timeout must be a positive number of seconds")
+    return timeout
+
+
 def get_and_validate_params(body):
     """Function to extract and validate request parameters"""
     # TODO: Allow customization of default values
@@ -135,9 +589,6 @@ def get_and_validate_params(body):
     presence_penalty: float = body.get("presence_penalty", 0.0)
     frequency_penalty: float = body.get("frequency_penalty", 0.0)
 
-    if not body.get("stream", False):
-        raise ValueError("Currently only supports streaming output, stream must be True")
-
     if "sonnet" in body.get("model", ""): # For Sonnet models, temperature must be between 0 and 1
         if not isinstance(temperature, (float)) or temperature < 0.0 or temperature > 1.0:
             raise ValueError("For Sonnet models, temperature must be between 0 and 1")
@@ -1,31 +1,184 @@
 from fastapi import HTTPException, Header
 from typing import Optional
-import os
-from dotenv import load_dotenv
+import hashlib
+import json
+import math
+import time
 from app.utils.logger import logger
+from app.utils.settings import Settings, get_settings
 
-# 加载 .env 文件
-logger.info(f"当前工作目录: {os.getcwd()}")
-logger.info("尝试加载.env文件...")
-load_dotenv(override=True)  # 添加override=True强制覆盖已存在的环境变量
 
-# 获取环境变量
-ALLOW_API_KEY = os.getenv("ALLOW_API_KEY")
-logger.info(f"ALLOW_API_KEY环境变量状态: {'已设置' if ALLOW_API_KEY else '未设置'}")
+class TokenBucket:
+    """令牌桶：按 rate 每秒补充令牌，最多积累 burst 个"""
 
-if not ALLOW_API_KEY:
-    raise ValueError("ALLOW_API_KEY environment variable is not set")
+    def __init__(self, rate: float, burst: float):
+        """初始化令牌桶
 
-# 打印API密钥的前4位用于调试
-logger.info(f"Loaded API key starting with: {ALLOW_API_KEY[:4] if len(ALLOW_API_KEY) >= 4 else ALLOW_API_KEY}")
+        Args:
+            rate: 每秒补充的令牌数，0 表示不限制
+            burst: 桶容量
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self._updated = time.monotonic()
 
+    def try_take(self) -> float:
+        """尝试取出一个令牌
 
-async def verify_api_key(authorization: Optional[str] = Header(None)) -> None:
+        Returns:
+            float: 0 表示成功，否则为需要等待的秒数
+        """
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Tenant:
+    """一个 API 密钥对应的租户及其限额"""
+
+    def __init__(self, name: str, rate: float = 0, burst: float = 0, max_streams: int = 0, weight: float = 1.0):
+        """初始化租户
+
+        Args:
+            name: 租户名称
+            rate: 每秒允许的请求数，0 表示不限制
+            burst: 请求令牌桶容量，默认与 rate 相同
+            max_streams: 同时进行中的请求数上限，0 表示不限制
+            weight: 上游阶段公平调度的权重，越大分到的并发越多
+        """
+        self.name = name
+        self.requests = TokenBucket(rate, burst or rate)
+        self.max_streams = max_streams
+        self.weight = weight
+        self.active_streams = 0
+        self.accepted = 0
+        self.rate_limited = 0
+        self.stream_limited = 0
+
+    def try_acquire_request(self) -> float:
+        """占用一个请求令牌
+
+        Returns:
+            float: 0 表示成功，否则为建议客户端等待的秒数
+        """
+        retry_after = self.requests.try_take()
+        if retry_after:
+            self.rate_limited += 1
+        return retry_after
+
+    def try_open_stream(self) -> bool:
+        """占用一个并发请求名额
+
+        Returns:
+            bool: 是否成功
+        """
+        if self.max_streams and self.active_streams >= self.max_streams:
+            self.stream_limited += 1
+            return False
+        self.active_streams += 1
+        self.accepted += 1
+        return True
+
+    def close_stream(self) -> None:
+        """归还并发请求名额"""
+        self.active_streams -= 1
+
+    def stats(self) -> dict:
+        """获取租户统计
+
+        Returns:
+            dict: 限额、进行中的请求数及累计接纳与限流次数
+        """
+        return {
+            "tenant": self.name,
+            "rate": self.requests.rate,
+            "burst": self.requests.burst,
+            "max_streams": self.max_streams,
+            "weight": self.weight,
+            "active_streams": self.active_streams,
+            "accepted": self.accepted,
+            "rate_limited": self.rate_limited,
+            "stream_limited": self.stream_limited,
+        }
+
+
+def _digest(api_key: str) -> bytes:
+    return hashlib.sha256(api_key.encode("utf-8")).digest()
+
+
+def _load_key_table(settings: Settings) -> dict[bytes, Tenant]:
+    """从配置加载密钥表
+
+    API_KEYS（或 API_KEYS_FILE 指向的文件）为 JSON 对象，键为 API 密钥，值为租户配置，例如:
+        {"sk-team-a": {"tenant": "team-a", "rate": 5, "burst": 10, "max_streams": 8, "weight": 2}}
+    ALLOW_API_KEY 仍然有效，对应名为 default 的租户，限额取 TENANT_DEFAULT_* 环境变量。
+
+    Args:
+        settings: 服务配置
+
+    Returns:
+        dict[bytes, Tenant]: 密钥 sha256 摘要到租户的映射
+    """
+    entries = {}
+    if settings.api_keys_file:
+        with open(settings.api_keys_file, encoding="utf-8") as f:
+            entries.update(json.load(f))
+    if settings.api_keys:
+        entries.update(json.loads(settings.api_keys))
+    if settings.allow_api_key:
+        entries.setdefault(settings.allow_api_key, {
+            "tenant": "default",
+            "rate": settings.tenant_default_rate,
+            "burst": settings.tenant_default_burst,
+            "max_streams": settings.tenant_default_max_streams,
+        })
+
+    # 多进程部署时每个工作进程只持有 1/WORKERS 的限额，请求在进程间大致均匀分布，合计接近配置值
+    workers = max(1, settings.workers)
+
+    # 同名租户共享同一组限额
+    tenants: dict[str, Tenant] = {}
+    table = {}
+    for api_key, config in entries.items():
+        name = config.get("tenant", "default")
+        if name not in tenants:
+            max_streams = int(config.get("max_streams", 0))
+            tenants[name] = Tenant(
+                name,
+                rate=float(config.get("rate", 0)) / workers,
+                burst=float(config.get("burst", 0)) / workers,
+                max_streams=math.ceil(max_streams / workers) if max_streams > 0 else max_streams,
+                weight=float(config.get("weight", 1.0)),
+            )
+        table[_digest(api_key)] = tenants[name]
+    return table
+
+
+# 以密钥摘要为键：查找耗时与密钥内容无关，不会按前缀泄露比较进度，且内存中不保留明文密钥
+KEY_TABLE = _load_key_table(get_settings())
+TENANTS: dict[str, Tenant] = {tenant.name: tenant for tenant in KEY_TABLE.values()}
+logger.info(f"已加载 {len(KEY_TABLE)} 个 API 密钥，{len(TENANTS)} 个租户")
+
+if not KEY_TABLE:
+    raise ValueError("ALLOW_API_KEY or API_KEYS environment variable is not set")
+
+
+async def verify_api_key(authorization: Optional[str] = Header(None)) -> Tenant:
     """验证API密钥
 
     Args:
         authorization (Optional[str], optional): Authorization header中的API密钥. Defaults to Header(None).
 
+    Returns:
+        Tenant: 密钥对应的租户
+
     Raises:
         HTTPException: 当Authorization header缺失或API密钥无效时抛出401错误
     """
@@ -35,13 +188,17 @@ async def verify_api_key(authorization: Optional[str] = Header(None)) -> None:
             status_code=401,
             detail="Missing Authorization header"
         )
-    
+
     api_key = authorization.replace("Bearer ", "").strip()
-    if api_key != ALLOW_API_KEY:
-        logger.warning(f"无效的API密钥: {api_key}")
+    digest = _digest(api_key)
+    tenant = KEY_TABLE.get(digest)
+    if tenant is None:
+        # 只记录摘要前缀，不记录密钥本身
+        logger.warning(f"无效的API密钥，摘要前缀: {digest.hex()[:8]}")
         raise HTTPException(
             status_code=401,
             detail="Invalid API key"
         )
-    
-    logger.info("API密钥验证通过")
+
+    logger.debug("API密钥验证通过，租户: %s", tenant.name)
+    return tenant
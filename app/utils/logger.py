@@ -1,15 +1,25 @@
+import atexit
+import copy
+import json
 import logging
+import queue
+import random
 import colorlog
 import sys
-import os
-from dotenv import load_dotenv
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, TextIO
+from app.utils.settings import get_settings
 
-# 确保环境变量被加载
-load_dotenv()
+# 当前请求是否输出 token 级调试日志，由 sample_token_trace() 按请求采样后在阶段任务中设置
+token_trace: ContextVar[bool] = ContextVar("token_trace", default=False)
+
+# 后台写日志的监听器，进程退出时停止并写完剩余日志
+_listeners: list[QueueListener] = []
 
 def get_log_level() -> int:
     """从环境变量获取日志级别
-    
+
     Returns:
         int: logging 模块定义的日志级别
     """
@@ -20,51 +30,129 @@ def get_log_level() -> int:
         'ERROR': logging.ERROR,
         'CRITICAL': logging.CRITICAL
     }
-    
-    level = os.getenv('LOG_LEVEL', 'INFO').upper()
+
+    level = get_settings().log_level.upper()
     return level_map.get(level, logging.INFO)
 
-def setup_logger(name: str = "DeepGenimi") -> logging.Logger:
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON，便于日志系统采集"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+# 入队前把异常转为文本时使用，与各格式化器的 formatException 输出一致
+_exception_formatter = logging.Formatter()
+
+class _LazyQueueHandler(QueueHandler):
+    """把日志记录放入队列，套用格式与写出在后台线程完成"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """在调用线程中合并 msg % args 并把异常转为文本
+
+        参数可能在后台线程取出记录前被事件循环修改，traceback 也会让整条调用栈的帧一直存活到出队，
+        因此入队前先求值；与默认实现不同，不在此套用格式，格式化仍由后台线程的处理器完成。
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def _make_formatter(log_format: str) -> logging.Formatter:
+    if log_format == "json":
+        return JsonFormatter()
+    # 设置彩色日志格式
+    return colorlog.ColoredFormatter(
+        "%(log_color)s%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        log_colors={
+            'DEBUG':    'cyan',
+            'INFO':     'green',
+            'WARNING':  'yellow',
+            'ERROR':    'red',
+            'CRITICAL': 'red,bg_white',
+        }
+    )
+
+def setup_logger(name: str = "DeepGenimi", stream: Optional[TextIO] = None,
+                 log_format: Optional[str] = None, async_output: Optional[bool] = None) -> logging.Logger:
     """设置一个彩色的logger
 
+    默认通过队列交给后台线程写出，事件循环上只有一次入队操作。
+
     Args:
         name (str, optional): logger的名称. Defaults to "DeepGenimi".
+        stream (TextIO, optional): 输出流. Defaults to sys.stdout.
+        log_format (str, optional): "text"（彩色文本）或 "json". Defaults to 环境变量 LOG_FORMAT.
+        async_output (bool, optional): 是否由后台线程写出. Defaults to 环境变量 LOG_ASYNC.
 
     Returns:
         logging.Logger: 配置好的logger实例
     """
     logger = colorlog.getLogger(name)
-    
+
     if logger.handlers:
         return logger
-    
+
     # 从环境变量获取日志级别
     log_level = get_log_level()
-    
+    if log_format is None:
+        log_format = get_settings().log_format.lower()
+    if async_output is None:
+        async_output = get_settings().log_async
+
     # 设置日志级别
     logger.setLevel(log_level)
-    
+    logger.propagate = False
+
     # 创建控制台处理器
-    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler = logging.StreamHandler(stream or sys.stdout)
     console_handler.setLevel(log_level)
-    
-    # 设置彩色日志格式
-    formatter = colorlog.ColoredFormatter(
-        "%(log_color)s%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-        log_colors={
-            'DEBUG':    'cyan',
-            'INFO':     'green',
-            'WARNING':  'yellow',
-            'ERROR':    'red',
-            'CRITICAL': 'red,bg_white',
-        }
-    )
-    
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
+    console_handler.setFormatter(_make_formatter(log_format))
+
+    if async_output:
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, console_handler, respect_handler_level=True)
+        listener.start()
+        _listeners.append(listener)
+        logger.addHandler(_LazyQueueHandler(log_queue))
+    else:
+        logger.addHandler(console_handler)
+
     return logger
 
+def shutdown_logging() -> None:
+    """停止后台写日志线程，写完队列中剩余的日志，重复调用无副作用"""
+    while _listeners:
+        _listeners.pop().stop()
+
+def sample_token_trace() -> bool:
+    """按请求采样是否输出 token 级调试日志
+
+    只有 DEBUG 级别开启时才会采样，采样率由环境变量 LOG_TOKEN_SAMPLE_RATE 控制。
+
+    Returns:
+        bool: 当前请求是否输出 token 级日志
+    """
+    return logger.isEnabledFor(logging.DEBUG) and random.random() < TOKEN_SAMPLE_RATE
+
+atexit.register(shutdown_logging)
+
+# token 级调试日志的请求采样率，0~1
+TOKEN_SAMPLE_RATE = get_settings().log_token_sample_rate
+
 # 创建一个默认的logger实例
 logger = setup_logger()
@@ -0,0 +1,292 @@
+"""进程内指标：计数器、仪表与直方图，按 Prometheus 文本格式导出
+
+记录操作只做加法与一次二分查找，不加锁（所有记录都在事件循环线程内完成），
+可以在每个 token 上调用；格式化只在抓取 /metrics 时进行。
+"""
+from bisect import bisect_left
+from typing import Callable, Optional
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """指标基类
+
+    声明了 labelnames 的指标本身不记录数据，通过 labels() 获取对应标签值的子指标后记录。
+    """
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, "_Metric"] = {}
+
+    def labels(self, *values) -> "_Metric":
+        """获取标签值对应的子指标，首次访问时创建
+
+        Args:
+            values: 与 labelnames 一一对应的标签值
+
+        Returns:
+            _Metric: 子指标，调用方可以缓存以避免重复查找
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}")
+            child = self._new_child()
+            self._children[values] = child
+        return child
+
+    def _new_child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def _data(self):
+        """当前值，可 JSON 序列化，用于跨进程汇总"""
+        raise NotImplementedError
+
+    def _merge(self, a, b):
+        """合并两个进程的值"""
+        return a + b
+
+    def _samples(self, labelnames: tuple, values: tuple, data) -> list[str]:
+        raise NotImplementedError
+
+    def snapshot(self) -> list:
+        """获取所有标签组合的当前值
+
+        Returns:
+            list: [[标签值列表, 值], ...]
+        """
+        if self.labelnames:
+            return [[list(values), child._data()] for values, child in list(self._children.items())]
+        return [[[], self._data()]]
+
+    def render(self, others: Optional[list] = None) -> list[str]:
+        """生成 Prometheus 文本格式的行
+
+        Args:
+            others: 其他进程的 snapshot()，提供时与本进程的值合并后输出
+        """
+        merged = {tuple(values): data for values, data in self.snapshot()}
+        for snapshot in others or ():
+            for values, data in snapshot:
+                key = tuple(values)
+                merged[key] = self._merge(merged[key], data) if key in merged else data
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for values, data in merged.items():
+            lines.extend(self._samples(self.labelnames, values, data))
+        return lines
+
+
+class Counter(_Metric):
+    """单调递增的计数器"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount: float = 1) -> None:
+        """增加计数"""
+        self.value += amount
+
+    def _data(self):
+        return self.value
+
+    def _samples(self, labelnames: tuple, values: tuple, data) -> list[str]:
+        return [f"{self.name}_total{_format_labels(labelnames, values)} {_format_value(data)}"]
+
+
+class Gauge(_Metric):
+    """可增可减的仪表，设置 callback 时在抓取时取值"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0
+        self.callback = callback
+
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation)
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def _data(self):
+        return self.callback() if self.callback is not None else self.value
+
+    def _samples(self, labelnames: tuple, values: tuple, data) -> list[str]:
+        return [f"{self.name}{_format_labels(labelnames, values)} {_format_value(data)}"]
+
+
+class Histogram(_Metric):
+    """固定分桶的直方图"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: tuple, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每个桶只记录落在该区间的次数，最后一个槽位对应 +Inf，导出时再累加
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, self.buckets)
+
+    def observe(self, value: float) -> None:
+        """记录一个观测值"""
+        self._counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def _data(self):
+        return {"counts": list(self._counts), "sum": self.sum, "count": self.count}
+
+    def _merge(self, a, b):
+        return {
+            "counts": [x + y for x, y in zip(a["counts"], b["counts"])],
+            "sum": a["sum"] + b["sum"],
+            "count": a["count"] + b["count"],
+        }
+
+    def _samples(self, labelnames: tuple, values: tuple, data) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), data["counts"]):
+            cumulative += count
+            le = f'le="{_format_value(float(bound))}"'
+            lines.append(f"{self.name}_bucket{_format_labels(labelnames, values, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labelnames, values)} {_format_value(data['sum'])}")
+        lines.append(f"{self.name}_count{_format_labels(labelnames, values)} {data['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = (),
+              callback: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, buckets: tuple, labelnames: tuple = ()) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets, labelnames))
+
+    def _register(self, metric: _Metric):
+        self._metrics.append(metric)
+        return metric
+
+    def snapshot(self) -> dict:
+        """获取所有指标的当前值，供其他工作进程汇总
+
+        Returns:
+            dict: 指标名称 -> _Metric.snapshot()
+        """
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def render(self, others: Optional[list[dict]] = None) -> str:
+        """导出所有指标
+
+        Args:
+            others: 其他工作进程的 snapshot()，提供时计数器与直方图求和，仪表值相加
+
+        Returns:
+            str: Prometheus 文本格式（0.0.4）
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render([snapshot[metric.name] for snapshot in others or () if metric.name in snapshot]))
+        return "\n".join(lines) + "\n"
+
+
+def error_type(error: BaseException) -> str:
+    """将异常归类为指标标签值：超时阶段、HTTP 状态码或底层异常类名
+
+    Args:
+        error: 异常
+
+    Returns:
+        str: 例如 "http_429"、"timeout_idle"、"ClientConnectorError"
+    """
+    phase = getattr(error, "phase", None)
+    if phase:
+        return f"timeout_{phase}"
+    status = getattr(error, "status", None)
+    if status:
+        return f"http_{status}"
+    cause = error.__cause__ or error
+    return type(cause).__name__
+
+
+registry = MetricsRegistry()
+
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+_DURATION_BUCKETS = (0.5, 1, 2, 5, 10, 20, 40, 80, 160, 320, 640)
+
+DEEPSEEK_TTFT = registry.histogram(
+    "deepgenimi_deepseek_ttft_seconds", "DeepSeek 阶段开始到首个推理 token 的时间", _LATENCY_BUCKETS)
+REASONING_DURATION = registry.histogram(
+    "deepgenimi_reasoning_duration_seconds", "首个推理 token 到推理交接的时间", _DURATION_BUCKETS)
+REASONING_TOKENS = registry.histogram(
+    "deepgenimi_reasoning_tokens", "交接给 Gemini 的推理内容估算 token 数",
+    (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768))
+REASONING_COMPACTION_RATIO = registry.histogram(
+    "deepgenimi_reasoning_compaction_ratio", "推理内容压缩后与压缩前的估算 token 数之比",
+    (0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9, 1))
+REASONING_ROUTES = registry.counter(
+    "deepgenimi_reasoning_routes", "推理路由决策次数", ("route", "reason"))
+REASONING_LATENCY_SAVED = registry.counter(
+    "deepgenimi_reasoning_latency_saved_seconds", "跳过或截断推理估算节省的延迟", ("route",))
+REASONING_DEGRADED = registry.counter(
+    "deepgenimi_reasoning_degraded", "推理阶段超时后以已收到的部分推理交接的次数", ("phase",))
+GEMINI_INPUT_TOKENS = registry.histogram(
+    "deepgenimi_gemini_input_tokens", "发送给 Gemini 的消息估算 token 数",
+    (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072))
+GEMINI_TTFT = registry.histogram(
+    "deepgenimi_gemini_ttft_seconds", "Gemini 阶段开始到首个回答 token 的时间", _LATENCY_BUCKETS)
+GEMINI_TOKENS_PER_SECOND = registry.histogram(
+    "deepgenimi_gemini_tokens_per_second", "Gemini 首 token 之后的估算输出速率",
+    (5, 10, 20, 40, 80, 160, 320, 640))
+STREAM_DURATION = registry.histogram(
+    "deepgenimi_request_duration_seconds", "请求从开始到最后一个字节的时间", _DURATION_BUCKETS, ("mode",))
+ACTIVE_REQUESTS = registry.gauge(
+    "deepgenimi_active_requests", "正在输出的请求数", ("mode",))
+UPSTREAM_ERRORS = registry.counter(
+    "deepgenimi_upstream_errors", "上游错误次数", ("stage", "type"))
@@ -0,0 +1,83 @@
+"""服务启动：选择事件循环与 HTTP 解析实现，多进程部署，以及收到退出信号时的排空回调"""
+import importlib.util
+import os
+import signal
+import tempfile
+from typing import Callable
+from app.utils.logger import logger
+
+_drain_callbacks: list[Callable[[], None]] = []
+_draining = False
+
+
+def on_drain(callback: Callable[[], None]) -> None:
+    """注册排空回调：进程收到 SIGTERM/SIGINT 时调用一次，此后不再接纳新请求
+
+    Args:
+        callback: 无参数的同步函数
+    """
+    _drain_callbacks.append(callback)
+
+
+def begin_drain() -> None:
+    """进入排空状态并依次调用已注册的回调，重复调用无效"""
+    global _draining
+    if _draining:
+        return
+    _draining = True
+    logger.info("收到退出信号，停止接纳新请求，等待进行中的流结束")
+    for callback in _drain_callbacks:
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"排空回调执行失败: {e}")
+
+
+def install_drain_handler() -> None:
+    """在 uvicorn 的退出信号处理函数之前插入 begin_drain
+
+    uvicorn 在启动应用（lifespan）前安装自己的信号处理函数，单进程和多进程的工作进程都是如此，
+    因此在 lifespan 启动阶段调用即可。uvicorn 随后停止监听并等待已有连接结束
+    （最长 timeout_graceful_shutdown 秒），进行中的流式响应在此期间正常输出完毕。
+    """
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def handler(signum, frame, previous=previous):
+            begin_drain()
+            previous(signum, frame)
+
+        signal.signal(sig, handler)
+
+
+def serve(app: str = "app.main:app", host: str = "0.0.0.0", port: int = 8004, workers: int = 1,
+          graceful_timeout: float = 30, state_dir: str = "") -> None:
+    """启动服务
+
+    安装了 uvloop / httptools 时分别用作事件循环与 HTTP 解析，否则退回 asyncio / h11。
+    workers 大于 1 时由 uvicorn 预先创建监听套接字并启动多个工作进程共享该端口；
+    各工作进程通过 SHARED_STATE_DIR 目录交换指标与统计，WORKERS 环境变量用于按进程数分摊限额。
+
+    Args:
+        app: 应用的导入路径
+        host: 监听地址
+        port: 监听端口
+        workers: 工作进程数
+        graceful_timeout: 退出时等待进行中请求的最长时间（秒）
+        state_dir: 共享状态目录，为空时在临时目录下按端口创建
+    """
+    import uvicorn
+
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    workers = max(1, workers)
+    # 工作进程继承启动时的环境变量
+    os.environ["WORKERS"] = str(workers)
+    if workers > 1:
+        os.environ.setdefault("SHARED_STATE_DIR",
+                              state_dir or os.path.join(tempfile.gettempdir(), f"deepgenimi-{port}"))
+    logger.info(f"启动服务: {host}:{port} | 工作进程: {workers} | 事件循环: {loop} | HTTP: {http}")
+    uvicorn.run(app, host=host, port=port, workers=workers, loop=loop, http=http,
+                timeout_graceful_shutdown=graceful_timeout)
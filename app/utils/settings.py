@@ -0,0 +1,195 @@
+"""服务配置：所有环境变量集中在一个类型化的配置对象中，进程内只加载一次"""
+import os
+import tempfile
+from dataclasses import dataclass, field, fields
+from functools import lru_cache
+from typing import Mapping
+from dotenv import load_dotenv
+
+
+@dataclass(frozen=True)
+class Settings:
+    """服务配置
+
+    每个字段对应同名的大写环境变量（如 deepseek_model 对应 DEEPSEEK_MODEL），按字段类型解析，
+    布尔值以 "true"（不区分大小写）为真。
+    """
+
+    # 日志：级别、输出格式（text/json）、是否由后台线程写出，以及 token 级调试日志的请求采样率
+    log_level: str = "INFO"
+    log_format: str = "text"
+    log_async: bool = True
+    log_token_sample_rate: float = 0.1
+
+    # API 密钥与租户，详见 app.utils.auth；TENANT_DEFAULT_* 为 ALLOW_API_KEY 对应的 default 租户的限额
+    allow_api_key: str = ""
+    api_keys: str = ""
+    api_keys_file: str = ""
+    tenant_default_rate: float = 0
+    tenant_default_burst: float = 0
+    tenant_default_max_streams: int = 0
+
+    allow_origins: str = "*"
+
+    gemini_api_key: str = ""
+    gemini_model: str = ""
+    gemini_provider: str = "google"  # Gemini模型提供商, 默认为google
+    gemini_api_url: str = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:streamGenerateContent"
+    gemini_backend: str = "http"  # http: 原生异步 HTTP 流, sdk: google.generativeai 异步接口
+
+    deepseek_api_key: str = ""
+    deepseek_api_url: str = ""
+    deepseek_model: str = ""
+    # 多个兼容的 DeepSeek 端点（JSON 数组），设置后替代 DEEPSEEK_API_URL/DEEPSEEK_API_KEY，例如：
+    # [{"name": "official", "url": "https://api.deepseek.com/v1/chat/completions", "api_key": "sk-...", "model": "deepseek-reasoner"}]
+    deepseek_endpoints: str = ""
+    deepseek_max_attempts: int = 3  # 首 token 之前失败时最多尝试的端点数
+    deepseek_eject_cooldown: float = 30  # 不健康端点的摘除时长（秒）
+
+    # DeepSeek 对冲请求：首 token 超过阈值（或最近首 token 延迟的分位数）未到达时再发一个相同请求
+    deepseek_hedge: bool = False
+    deepseek_hedge_delay_ms: float = 2000
+    deepseek_hedge_percentile: float = 95  # 0 表示只用固定阈值
+    deepseek_hedge_budget: float = 0.1  # 对冲请求占比上限
+
+    is_origin_reasoning: bool = True
+
+    # 上游连接池配置
+    http_pool_limit: int = 100
+    http_pool_limit_per_host: int = 32
+    http_dns_cache_ttl: int = 300
+    http_keepalive_timeout: float = 60
+    http_connect_timeout: float = 10
+    http_pool_warmup_connections: int = 2  # 0 表示不预热
+
+    # 每个请求输出缓冲的水位线，0 表示不限制
+    stream_max_buffered_frames: int = 512
+    stream_max_buffered_bytes: int = 256 * 1024
+
+    # 推理缓存，默认关闭：REASONING_CACHE_SIZE 大于 0 时开启，相同请求（消息、模型与采样参数均相同）在 TTL 内
+    # 直接复用缓存的推理内容，temperature > 0 的请求也不再重新采样推理；设置 REASONING_CACHE_PATH 时启用 SQLite 持久化
+    reasoning_cache_size: int = 0
+    reasoning_cache_ttl: float = 3600
+    reasoning_cache_path: str = ""
+
+    # 相同并发请求合并，共享同一条上游流水线；流水线产出超过 REQUEST_COALESCING_JOIN_WINDOW 个事件后不再接受加入
+    request_coalescing: bool = True
+    request_coalescing_join_window: int = 1024
+
+    # 输出帧合并：连续的同类增量在字节阈值或计时到期前合并为一帧
+    frame_coalescing: bool = True
+    frame_coalescing_max_bytes: int = 4096
+    frame_coalescing_max_delay_ms: float = 5
+
+    # 批处理：/v1/batch 每个批次的默认并发与上限；指定 batch_id 时结果保存在 BATCH_STATE_DIR 下，中断后可续跑
+    batch_concurrency: int = 8
+    batch_max_concurrency: int = 64
+    batch_state_dir: str = field(default_factory=lambda: os.path.join(tempfile.gettempdir(), "deepgenimi-batches"))
+
+    # 推理压缩：交给 Gemini 前按 token 预算精简推理内容，策略按逗号分隔的顺序依次应用
+    reasoning_compaction: bool = False
+    reasoning_budget_tokens: int = 4096  # 0 表示不限制长度
+    reasoning_compaction_strategies: str = "strip_think,dedupe,conclusion,head_tail"
+
+    # 推理路由：按请求跳过推理（直接交给 Gemini）、截断推理（达到 REASONING_ROUTER_CAP_TOKENS 即交接）或完整推理。
+    # 客户端可通过 reasoning_effort（none/minimal 跳过，low 截断，medium/high 完整）指定；
+    # 以下长度与正则规则默认关闭，例如 REASONING_ROUTER_SKIP_PATTERN="^(hi|hello|你好|谢谢|thanks)\W*$|^(翻译|translate)"
+    reasoning_router: bool = True
+    reasoning_router_short_tokens: int = 0  # 最后一条 user 消息不超过该 token 数时跳过推理，0 表示不按长度判断
+    reasoning_router_skip_pattern: str = ""
+    reasoning_router_full_pattern: str = ""  # 匹配时总是完整推理，优先于跳过规则
+    reasoning_router_cap_tokens: int = 1024
+
+    # 历史窗口：去掉历史消息中的 reasoning_content，并按模型的输入 token 预算裁剪历史（固定保留 system 与第一条 user）
+    # MODEL_CONTEXT_BUDGETS 为 JSON 对象，键为模型名称或前缀，例如 {"deepseek-reasoner": 48000, "gemini-1.5": 200000}
+    history_window: bool = True
+    model_context_budgets: str = ""
+    history_default_budget: int = 0  # 未配置的模型的预算，0 表示不限制
+
+    # 请求截止时间：REQUEST_TIMEOUT 为默认预算（秒，0 表示不限制），客户端可通过请求头 X-Request-Timeout
+    # 或请求体的 timeout 字段另行指定，最长为 REQUEST_MAX_TIMEOUT。推理阶段最多使用其中 REASONING_DEADLINE_SHARE 的比例，
+    # 超出或上游停滞时以已收到的推理交给 Gemini 继续回答
+    request_timeout: float = 600
+    request_max_timeout: float = 1800
+    reasoning_deadline_share: float = 0.6
+
+    # 各阶段的上游超时（秒，0 表示不限制）：建连、发出请求到第一个分块、相邻分块之间
+    deepseek_connect_timeout: float = 10
+    deepseek_first_byte_timeout: float = 60
+    deepseek_idle_timeout: float = 60
+    gemini_connect_timeout: float = 10
+    gemini_first_byte_timeout: float = 30
+    gemini_idle_timeout: float = 30
+
+    # 链路追踪：请求头带有已采样的 traceparent 时总是追踪，其余请求按 TRACING_SAMPLE_RATIO 采样。
+    # TRACING_EXPORTER 为 none（关闭）、otlp（以 OTLP/HTTP JSON 发送到 TRACING_OTLP_ENDPOINT）
+    # 或 file（写入 TRACING_FILE，按大小轮转；WORKERS 大于 1 时文件名附加进程号）。
+    # TRACING_PROPAGATE 开启后才向上游请求附加 traceparent 请求头，默认关闭，不向第三方泄露链路信息
+    tracing_exporter: str = "none"
+    tracing_propagate: bool = False
+    tracing_sample_ratio: float = 0.01
+    tracing_otlp_endpoint: str = "http://127.0.0.1:4318/v1/traces"
+    tracing_file: str = field(default_factory=lambda: os.path.join(tempfile.gettempdir(), "deepgenimi-traces.jsonl"))
+    tracing_file_max_bytes: int = 64 * 1024 * 1024
+    tracing_file_backups: int = 3
+    tracing_batch_size: int = 512
+    tracing_flush_interval: float = 2
+    tracing_max_queue: int = 8192
+    tracing_service_name: str = "deepgenimi"
+
+    # 服务进程：监听地址、端口、工作进程数与退出时等待进行中请求的最长时间（秒）。
+    # WORKERS 大于 1 时各项并发与排队上限按进程数平均分摊，
+    # 各工作进程每 SHARED_STATE_INTERVAL 秒把指标与统计写入 SHARED_STATE_DIR，/metrics 与 /v1/workers 汇总所有进程
+    host: str = "0.0.0.0"
+    port: int = 8004
+    workers: int = 1
+    graceful_shutdown_timeout: float = 30
+    shared_state_dir: str = ""
+    shared_state_interval: float = 1
+
+    # 准入控制：各阶段最大并发数（0 表示不限制）、每阶段最多排队数及最长排队时间，超出时返回 429
+    deepseek_max_concurrency: int = 64
+    gemini_max_concurrency: int = 64
+    admission_max_queue: int = 128
+    admission_max_queue_time: float = 10
+    admission_retry_after: int = 1
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str]) -> "Settings":
+        """从环境变量构造配置，未设置的字段取默认值
+
+        Args:
+            environ: 环境变量映射
+
+        Returns:
+            Settings: 配置对象
+
+        Raises:
+            ValueError: 数值型环境变量无法解析
+        """
+        values = {}
+        for item in fields(cls):
+            raw = environ.get(item.name.upper())
+            if raw is None:
+                continue
+            if item.type is bool:
+                values[item.name] = raw.lower() == "true"
+            else:
+                try:
+                    values[item.name] = item.type(raw)
+                except ValueError:
+                    raise ValueError(f"Invalid value for {item.name.upper()}: {raw!r}") from None
+        return cls(**values)
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """加载 .env 并读取配置，进程内只执行一次
+
+    .env 中的值覆盖已存在的环境变量。
+
+    Returns:
+        Settings: 配置对象
+    """
+    load_dotenv(override=True)
+    return Settings.from_env(os.environ)
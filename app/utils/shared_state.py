@@ -0,0 +1,98 @@
+"""多进程部署时的共享状态目录：各工作进程定期发布自己的状态快照，读取时汇总所有存活进程"""
+import json
+import os
+import time
+from typing import Any
+
+
+class SharedState:
+    """基于目录的进程间状态共享
+
+    每个工作进程把快照写到 `{directory}/{name}.{pid}.json`（先写临时文件再原子替换），
+    读取时跳过已退出进程留下的文件并将其删除。只用于统计类数据，写入频率为秒级。
+    """
+
+    def __init__(self, directory: str, pid: int = 0):
+        """初始化共享目录
+
+        Args:
+            directory: 所有工作进程共用的目录，不存在时创建
+            pid: 当前进程号，默认 os.getpid()
+        """
+        self.directory = directory
+        self.pid = pid or os.getpid()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name: str, pid: int) -> str:
+        return os.path.join(self.directory, f"{name}.{pid}.json")
+
+    def publish(self, name: str, data: Any) -> None:
+        """发布当前进程的快照
+
+        Args:
+            name: 快照名称
+            data: 可 JSON 序列化的数据
+        """
+        path = self._path(name, self.pid)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"pid": self.pid, "time": time.time(), "data": data}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def collect(self, name: str, include_self: bool = False) -> list[dict]:
+        """读取所有存活工作进程的快照
+
+        Args:
+            name: 快照名称
+            include_self: 是否包含当前进程发布的快照
+
+        Returns:
+            list[dict]: 每项为 {"pid", "time", "data"}
+        """
+        snapshots = []
+        prefix, suffix = f"{name}.", ".json"
+        for filename in os.listdir(self.directory):
+            if not (filename.startswith(prefix) and filename.endswith(suffix)):
+                continue
+            try:
+                pid = int(filename[len(prefix):-len(suffix)])
+            except ValueError:
+                continue
+            if pid == self.pid and not include_self:
+                continue
+            path = os.path.join(self.directory, filename)
+            if not _alive(pid):
+                _remove(path)
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # 文件在读取期间被替换或删除
+                continue
+        return snapshots
+
+    def remove(self, name: str) -> None:
+        """删除当前进程发布的快照，进程退出前调用
+
+        Args:
+            name: 快照名称
+        """
+        _remove(self._path(name, self.pid))
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,32 @@
+"""流式响应工具"""
+from typing import Callable, Optional
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """响应结束后必定关闭 body 迭代器的 StreamingResponse
+
+    Starlette 在客户端断开时只会停止迭代，异步生成器会停在 yield 处直到被
+    垃圾回收。这里在响应结束（正常完成、断开或异常）时显式调用 aclose()，
+    让生成器内的 finally 立即执行，从而取消阶段任务并释放上游连接。
+
+    生成器在开始迭代前就被关闭时其 finally 不会执行，需要在响应结束时释放的资源
+    （如准入名额）可以通过 `on_close` 传入。
+    """
+
+    def __init__(self, *args, on_close: Optional[Callable[[], None]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                aclose = getattr(self.body_iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            finally:
+                if self.on_close is not None:
+                    self.on_close()
@@ -0,0 +1,50 @@
+"""token 数估算工具，用于在上游未返回用量时填充 usage 字段"""
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的 token 数
+
+    ASCII 文本按约 4 个字符一个 token 计算，非 ASCII 字符（中文等）按每字符一个 token 计算。
+    只做一次 UTF-8 编码，不逐字符遍历。
+
+    Args:
+        text: 文本
+
+    Returns:
+        int: 估算的 token 数
+    """
+    if not text:
+        return 0
+    return estimate_tokens_from_size(len(text), len(text.encode("utf-8")))
+
+
+def estimate_tokens_from_size(chars: int, size: int) -> int:
+    """根据字符数与 UTF-8 字节数估算 token 数，适合对流式片段累计后一次性估算
+
+    Args:
+        chars: 字符数
+        size: UTF-8 字节数
+
+    Returns:
+        int: 估算的 token 数
+    """
+    # 非 ASCII 字符在 UTF-8 中占 2~4 字节，按多出的字节数近似其个数
+    non_ascii = (size - chars + 1) // 2
+    ascii_chars = chars - non_ascii
+    return (ascii_chars + 3) // 4 + non_ascii
+
+
+def estimate_message_tokens(messages: list) -> int:
+    """估算消息列表的 token 数，每条消息额外计入少量格式开销
+
+    Args:
+        messages: 消息列表
+
+    Returns:
+        int: 估算的 token 数
+    """
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        total += 4 + (estimate_tokens(content) if isinstance(content, str) else 0)
+    return total
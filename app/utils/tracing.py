@@ -0,0 +1,429 @@
+"""轻量的请求链路追踪：W3C traceparent 传播、按比例采样，以及后台批量导出 OTLP JSON
+
+只实现本服务用到的部分：每个 Span 记录名称、起止时间、属性、事件与错误状态；
+上下文通过 `current_span` 传递，未采样的请求使用 `NOOP_SPAN`，各处调用只是空操作。
+结束的 Span 放入有界队列，由后台线程按批编码为 OTLP/JSON，发送到本地 collector
+（OTLP/HTTP，默认 http://127.0.0.1:4318/v1/traces）或写入按大小轮转的文件（每行一个批次），
+事件循环上只有一次入队操作，队列满时丢弃并计数。
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.request
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Optional
+from app.utils.logger import logger
+
+# OTLP 的 Span 类型与状态码
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[tuple[str, str, bool]]:
+    """解析 W3C traceparent 请求头
+
+    Args:
+        value: 请求头的值
+
+    Returns:
+        Optional[tuple[str, str, bool]]: (trace_id, 父 span_id, 是否已采样)，格式无效时返回 None
+    """
+    if not value:
+        return None
+    match = _TRACEPARENT.match(value.strip().lower())
+    if match is None:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & 1)
+
+
+class Span:
+    """一个已采样的 Span"""
+
+    __slots__ = ("tracer", "name", "kind", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "events", "error")
+
+    recording = True
+
+    def __init__(self, tracer: "Tracer", name: str, trace_id: str, parent_id: Optional[str] = None,
+                 kind: int = KIND_INTERNAL, attributes: Optional[dict] = None):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.events: list[tuple[int, str, dict]] = []
+        self.error: Optional[str] = None
+
+    def child(self, name: str, kind: int = KIND_INTERNAL, attributes: Optional[dict] = None) -> "Span":
+        """创建子 Span
+
+        Args:
+            name: 名称
+            kind: Span 类型
+            attributes: 初始属性
+
+        Returns:
+            Span: 子 Span
+        """
+        return Span(self.tracer, name, self.trace_id, self.span_id, kind, attributes)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: dict) -> None:
+        self.attributes.update(attributes)
+
+    def add_event(self, name: str, attributes: Optional[dict] = None) -> None:
+        """记录一个时间点，如首 token 到达"""
+        self.events.append((time.time_ns(), name, attributes or {}))
+
+    def record_error(self, error: BaseException) -> None:
+        """标记 Span 失败并记录异常"""
+        self.error = f"{type(error).__name__}: {error}"
+
+    def traceparent(self) -> Optional[str]:
+        """以当前 Span 为父节点的 traceparent，用于向上游传播
+
+        Returns:
+            Optional[str]: 追踪器未开启向上游传播时为 None
+        """
+        if not self.tracer.propagate:
+            return None
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def end(self) -> None:
+        """结束 Span 并交给导出队列，重复调用无效"""
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.tracer.on_end(self)
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if isinstance(exc, (GeneratorExit, asyncio.CancelledError)):
+            # 调用方提前关闭（推理交接、对冲落败、客户端断开）不算失败
+            self.attributes["cancelled"] = True
+        elif exc is not None:
+            self.record_error(exc)
+        self.end()
+
+
+class _NoopSpan:
+    """未采样请求的 Span，所有操作都是空操作"""
+
+    recording = False
+    trace_id = None
+
+    def child(self, name: str, kind: int = KIND_INTERNAL, attributes: Optional[dict] = None) -> "_NoopSpan":
+        return self
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: dict) -> None:
+        pass
+
+    def add_event(self, name: str, attributes: Optional[dict] = None) -> None:
+        pass
+
+    def record_error(self, error: BaseException) -> None:
+        pass
+
+    def traceparent(self) -> None:
+        return None
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+# 当前阶段的 Span，由流水线的阶段任务设置，上游客户端在其下创建子 Span
+current_span: ContextVar[Span | _NoopSpan] = ContextVar("current_span", default=NOOP_SPAN)
+
+
+def start_span(name: str, kind: int = KIND_INTERNAL, attributes: Optional[dict] = None) -> Span | _NoopSpan:
+    """在 `current_span` 下创建子 Span，当前请求未采样时返回 NOOP_SPAN"""
+    return current_span.get().child(name, kind, attributes)
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> list[dict]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def encode_otlp(spans: list[Span], service_name: str) -> dict:
+    """将一批 Span 编码为 OTLP/JSON 的 ExportTraceServiceRequest
+
+    Args:
+        spans: 已结束的 Span
+        service_name: resource 的 service.name
+
+    Returns:
+        dict: 可直接 JSON 序列化的请求体
+    """
+    encoded = []
+    for span in spans:
+        item = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": _otlp_attributes(span.attributes),
+            "events": [{"timeUnixNano": str(ts), "name": name, "attributes": _otlp_attributes(attributes)}
+                       for ts, name, attributes in span.events],
+            "status": {"code": _STATUS_ERROR, "message": span.error} if span.error else {"code": _STATUS_OK},
+        }
+        if span.parent_id:
+            item["parentSpanId"] = span.parent_id
+        encoded.append(item)
+    return {"resourceSpans": [{
+        "resource": {"attributes": _otlp_attributes({"service.name": service_name, "process.pid": os.getpid()})},
+        "scopeSpans": [{"scope": {"name": "deepgenimi"}, "spans": encoded}],
+    }]}
+
+
+class OTLPHttpExporter:
+    """通过 OTLP/HTTP（JSON 编码）发送到 collector"""
+
+    def __init__(self, endpoint: str = "http://127.0.0.1:4318/v1/traces", timeout: float = 5):
+        """初始化导出器
+
+        Args:
+            endpoint: collector 的 /v1/traces 地址
+            timeout: 单次发送的超时时间（秒）
+        """
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, body: bytes) -> None:
+        request = urllib.request.Request(self.endpoint, data=body, method="POST",
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def __repr__(self) -> str:
+        return f"otlp:{self.endpoint}"
+
+
+class FileSpanExporter:
+    """写入本地文件，每行一个 OTLP/JSON 批次，超过大小上限时轮转
+
+    行格式与 OpenTelemetry Collector 的 file exporter 相同，可由其 otlpjsonfile receiver 重新导入。
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024, backups: int = 3):
+        """初始化导出器
+
+        Args:
+            path: 文件路径，已存在时追加
+            max_bytes: 单个文件的大小上限，0 表示不轮转
+            backups: 保留的历史文件数（path.1 ... path.N）
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "ab")
+
+    def export(self, body: bytes) -> None:
+        if self.max_bytes and self._file.tell() + len(body) > self.max_bytes and self._file.tell() > 0:
+            self._rotate()
+        self._file.write(body + b"\n")
+        self._file.flush()
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "wb")
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __repr__(self) -> str:
+        return f"file:{self.path}"
+
+
+class Tracer:
+    """采样请求并批量导出 Span
+
+    请求的根 Span 遵循上游 traceparent 的采样标记；没有 traceparent 时按 `sample_ratio` 随机采样。
+    结束的 Span 进入最多 `max_queue` 个的队列，后台线程每 `flush_interval` 秒或攒满 `batch_size`
+    个时导出一批，导出失败的批次直接丢弃，不重试。
+    """
+
+    def __init__(self, sample_ratio: float = 0.0, exporter: Any = None, service_name: str = "deepgenimi",
+                 batch_size: int = 512, flush_interval: float = 2.0, max_queue: int = 8192,
+                 propagate: bool = False):
+        """初始化追踪器
+
+        Args:
+            sample_ratio: 没有上游采样决定时的采样比例，0~1，0 表示只追踪上游要求采样的请求
+            exporter: 导出器，提供 export(body: bytes) 方法；为 None 时不采样
+            service_name: 导出时的 service.name
+            batch_size: 每批最多导出的 Span 数
+            flush_interval: 导出间隔（秒）
+            max_queue: 等待导出的 Span 数上限，超出时丢弃
+            propagate: 是否向上游请求附加 traceparent 请求头
+        """
+        self.sample_ratio = sample_ratio if exporter is not None else 0.0
+        self.exporter = exporter
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.propagate = propagate
+        self._queue: deque[Span] = deque()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.sampled = 0
+        self.exported = 0
+        self.dropped = 0
+        self.failed_batches = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, kind: int = KIND_SERVER,
+                    attributes: Optional[dict] = None) -> Span | _NoopSpan:
+        """为一个请求创建根 Span
+
+        Args:
+            name: 名称
+            traceparent: 请求携带的 traceparent，有效时沿用其 trace_id 与采样决定
+            kind: Span 类型
+            attributes: 初始属性
+
+        Returns:
+            Span | _NoopSpan: 未采样时为 NOOP_SPAN
+        """
+        if self.exporter is None:
+            return NOOP_SPAN
+        parent = parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = None, None
+            sampled = self.sample_ratio > 0 and random.random() < self.sample_ratio
+        if not sampled:
+            return NOOP_SPAN
+        self.sampled += 1
+        return Span(self, name, trace_id or f"{random.getrandbits(128):032x}", parent_id, kind, attributes)
+
+    def on_end(self, span: Span) -> None:
+        """Span 结束时调用，只做一次入队"""
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue.append(span)
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        """启动后台导出线程，未配置导出器或重复调用时无效"""
+        if self.exporter is None or self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+        logger.info(f"链路追踪已启用 | 采样比例: {self.sample_ratio} | 导出: {self.exporter!r}")
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """导出剩余的 Span 并停止后台线程
+
+        Args:
+            timeout: 等待导出完成的最长时间（秒）
+        """
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+        close = getattr(self.exporter, "close", None)
+        if close is not None:
+            close()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            while self._queue:
+                self._export_batch()
+            if self._stopping:
+                return
+
+    def _export_batch(self) -> None:
+        batch = []
+        while self._queue and len(batch) < self.batch_size:
+            batch.append(self._queue.popleft())
+        body = json.dumps(encode_otlp(batch, self.service_name), ensure_ascii=False, separators=(",", ":"))
+        try:
+            self.exporter.export(body.encode("utf-8"))
+            self.exported += len(batch)
+        except Exception as e:
+            self.failed_batches += 1
+            self.dropped += len(batch)
+            logger.warning(f"导出 {len(batch)} 个 Span 失败: {e}")
+
+    def stats(self) -> dict:
+        """获取追踪统计
+
+        Returns:
+            dict: 采样比例、是否向上游传播、导出目标、已采样请求数、已导出/丢弃的 Span 数、失败批次数及队列长度
+        """
+        return {
+            "enabled": self.enabled,
+            "sample_ratio": self.sample_ratio,
+            "propagate": self.propagate,
+            "exporter": repr(self.exporter) if self.exporter is not None else None,
+            "sampled_traces": self.sampled,
+            "exported_spans": self.exported,
+            "dropped_spans": self.dropped,
+            "failed_batches": self.failed_batches,
+            "queued_spans": len(self._queue),
+        }
@@ -0,0 +1,55 @@
+"""批处理命令行入口：读取 JSONL 请求文件，结果以 JSONL 追加写入输出文件，中断后以相同参数重新运行即可续跑
+
+运行方式:
+    python batch.py requests.jsonl results.jsonl [--concurrency 16]
+    cat requests.jsonl | python batch.py - results.jsonl
+"""
+import argparse
+import asyncio
+import sys
+
+from app import main as server
+from app.deepgenimi.batch import BatchRunner, BatchProgress, iter_jsonl
+from app.utils.logger import logger
+
+
+async def read_chunks(path: str):
+    """在线程中分块读取输入，不阻塞事件循环"""
+    f = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        while chunk := await asyncio.to_thread(f.read, 1 << 16):
+            yield chunk
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="JSONL 请求文件，- 表示标准输入")
+    parser.add_argument("output", help="JSONL 结果文件，同时作为续跑的进度记录")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时进行的请求数")
+    args = parser.parse_args()
+
+    progress = BatchProgress(args.output)
+    if progress.completed:
+        logger.info(f"已完成 {len(progress.completed)} 项，本次跳过")
+    runner = None
+    try:
+        # 流水线与上游客户端在应用启动时创建
+        async with server.lifespan(server.app):
+            runner = BatchRunner(server.deep_genimi, server.settings.deepseek_model, server.settings.gemini_model,
+                                 parse_params=server.get_and_validate_params,
+                                 concurrency=args.concurrency,
+                                 admit=server.admission.admit)
+            async for _ in runner.run(iter_jsonl(read_chunks(args.input)), progress):
+                pass
+    finally:
+        await progress.flush()
+        progress.close()
+        if runner is not None:
+            logger.info(f"批处理结束: {runner.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
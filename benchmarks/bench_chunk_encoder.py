@@ -0,0 +1,92 @@
+"""输出帧编码微基准：对比逐 token 构造字典 + json.dumps 与 ChunkEncoder
+
+运行方式（仓库根目录）:
+    python -m benchmarks.bench_chunk_encoder [--tokens 200000]
+"""
+import argparse
+import json
+import time
+
+from app.deepgenimi.chunk_encoder import ChunkEncoder
+
+CHAT_ID = "chatcmpl-18d2f3a4b5c"
+CREATED = 1738000000
+DEEPSEEK_MODEL = "deepseek-reasoner"
+GEMINI_MODEL = "gemini-pro"
+
+
+def legacy_reasoning(content: str) -> bytes:
+    """旧实现：每个 token 构造完整字典再序列化"""
+    response = {
+        "id": CHAT_ID,
+        "object": "chat.completion.chunk",
+        "created": CREATED,
+        "model": DEEPSEEK_MODEL,
+        "choices": [{
+            "index": 0,
+            "delta": {
+                "role": "assistant",
+                "reasoning_content": content,
+                "content": ""
+            }
+        }]
+    }
+    return f"data: {json.dumps(response)}\n\n".encode('utf-8')
+
+
+def legacy_answer(content: str) -> bytes:
+    response = {
+        "id": CHAT_ID,
+        "object": "chat.completion.chunk",
+        "created": CREATED,
+        "model": GEMINI_MODEL,
+        "choices": [{
+            "index": 0,
+            "delta": {
+                "role": "assistant",
+                "content": content
+            }
+        }]
+    }
+    return f"data: {json.dumps(response)}\n\n".encode('utf-8')
+
+
+def bench(name: str, fn, tokens: list[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for token in tokens:
+            fn(token)
+        best = min(best, time.perf_counter() - start)
+    per_token = best / len(tokens) * 1e9
+    print(f"  {name:<24} {per_token:>8.0f} ns/token   {len(tokens) / best:>12,.0f} tokens/s")
+    return per_token
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = ["The", " answer", " is", " 42", "。", "我们", "需要", " \"quoted\"", "\n", "x²"]
+    tokens = [samples[i % len(samples)] for i in range(args.tokens)]
+    encoder = ChunkEncoder(CHAT_ID, CREATED, DEEPSEEK_MODEL, GEMINI_MODEL)
+
+    for token in samples:
+        assert encoder.reasoning(token) == legacy_reasoning(token)
+        assert encoder.answer(token) == legacy_answer(token)
+    print(f"输出逐字节一致 | token 数: {args.tokens}")
+
+    for label, legacy, fast in (
+        ("reasoning", legacy_reasoning, encoder.reasoning),
+        ("answer", legacy_answer, encoder.answer),
+    ):
+        print(f"\n[{label}]")
+        before = bench("dict + json.dumps", legacy, tokens, args.repeat)
+        after = bench("ChunkEncoder", fast, tokens, args.repeat)
+        print(f"  单 token CPU 开销降低 {(1 - after / before) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""推理压缩基准：各策略的压缩比与耗时，以及开启压缩前后 Gemini 阶段首 token 延迟的变化
+
+离线部分在构造的 R1 风格推理上运行（含 <think> 标签、重复的自我验证段落），不依赖网络；
+--e2e 时分别以关闭、开启压缩启动服务与模拟上游（Gemini 首 token 延迟随输入长度增加），
+对比「交接」延迟。运行方式（仓库根目录）:
+    python -m benchmarks.bench_compaction [--reasoning-tokens 20000] [--budget 4096] [--e2e]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from app.deepgenimi.reasoning_compactor import ReasoningCompactor, STRATEGIES
+from benchmarks.load_test import ProcessSampler, Stack, run_level
+
+
+def build_trace(tokens: int, seed: int = 7) -> str:
+    """构造一段 R1 风格的推理：逐步推导，穿插重复的自我验证，最后给出结论"""
+    rng = random.Random(seed)
+    paragraphs = ["<think>", "好的，用户的问题是如何在有限预算下规划一条最短路线。我先梳理已知条件。"]
+    step = 0
+    while sum(len(p) for p in paragraphs) < tokens:
+        step += 1
+        paragraphs.append(
+            f"第 {step} 步：考虑节点 {rng.randint(1, 500)} 到节点 {rng.randint(1, 500)} 的距离为 {rng.randint(1, 99)}，"
+            f"与当前最优解 {rng.randint(100, 999)} 比较后更新候选集合。" * 2
+        )
+        if step % 4 == 0:
+            paragraphs += [
+                "等等，让我再检查一下刚才的计算是否正确。",
+                "让我验证一下：代入之前的结果，距离之和与预期一致。",
+                "Wait, let me double-check the constraint on the budget once more.",
+            ]
+        if step % 9 == 0:
+            paragraphs.append("目前为止推导没有问题。")
+    paragraphs += ["综上，最短路线为 1 → 17 → 42 → 500，总距离 213，满足预算约束。", "</think>"]
+    return "\n\n".join(paragraphs)
+
+
+def offline(args) -> None:
+    trace = build_trace(args.reasoning_tokens)
+    configs = [("strip_think,dedupe", ("strip_think", "dedupe"))]
+    configs += [(name, ("strip_think", name)) for name in ("conclusion", "head_tail")]
+    configs.append((",".join(STRATEGIES), STRATEGIES))
+    print(f"推理内容: {len(trace)} 字符 | 预算: {args.budget} tokens")
+    for label, strategies in configs:
+        compactor = ReasoningCompactor(args.budget, strategies)
+        result = compactor.compact(trace)
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            compactor.compact(trace)
+        elapsed = (time.perf_counter() - start) / args.rounds
+        print(f"  {label:<40} {result.original_tokens:>7} -> {result.tokens:>6} tokens  "
+              f"压缩比 {result.ratio:>5.2f}  耗时 {elapsed * 1000:>6.2f} ms  生效: {','.join(result.applied) or '-'}")
+
+
+async def e2e(args) -> None:
+    mock_args = (f"--reasoning-tokens {args.reasoning_tokens} --token-rate 0 --deepseek-ttft 0 "
+                 f"--answer-tokens 50 --gemini-prefill-ms-per-1k {args.prefill_ms_per_1k}")
+    for enabled in (False, True):
+        stack_args = argparse.Namespace(
+            mock_args=mock_args,
+            server_env=[f"REASONING_COMPACTION={enabled}", f"REASONING_BUDGET_TOKENS={args.budget}"],
+            requests=args.requests, prompt_words=20, timeout=300,
+        )
+        stack = Stack(stack_args)
+        pid = stack.start().pid
+        try:
+            await stack.wait_ready()
+            row = await run_level(f"http://127.0.0.1:{stack.app_port}/v1/chat/completions", stack.key,
+                                  args.concurrency, stack_args, ProcessSampler(pid), 0)
+        finally:
+            stack.stop()
+        print(f"  压缩{'开启' if enabled else '关闭'}: 交接 p50 {row['handoff_p50_ms']:>8.1f} ms | "
+              f"完成 {row['ok']}/{row['requests']} | 服务端 CPU {row['server_cpu_ms_per_stream'] or 0:.1f} ms/流")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reasoning-tokens", type=int, default=20000)
+    parser.add_argument("--budget", type=int, default=4096)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--e2e", action="store_true", help="启动服务对比开启压缩前后的 Gemini 首 token 延迟")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=40, help="模拟 Gemini 每 1k 输入 token 的首 token 延迟")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=3)
+    args = parser.parse_args()
+
+    offline(args)
+    if args.e2e:
+        asyncio.run(e2e(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""输出帧合并基准：对比逐 token 成帧与 FrameBatcher 合并后的写出次数与每次写出字节数
+
+生产者按突发方式写入 token（模拟一个 TCP 包里带着多个 SSE 事件），消费者把每一帧
+编码后通过 socketpair 发送，每帧对应一次真实的 send 系统调用。运行方式（仓库根目录）:
+    python -m benchmarks.bench_frame_batching [--tokens 20000] [--burst 4] [--interval-ms 1]
+"""
+import argparse
+import asyncio
+import socket
+import threading
+import time
+
+from app.deepgenimi.chunk_encoder import ChunkEncoder
+from app.deepgenimi.frame_batcher import FrameBatcher, drain
+from app.deepgenimi.stream_buffer import StreamBuffer, text_size
+
+
+async def produce(buffer: StreamBuffer, tokens: int, burst: int, interval: float) -> None:
+    for i in range(tokens):
+        text = f" tok{i % 100}"
+        kind = "reasoning" if i < tokens // 2 else "answer"
+        await buffer.put((kind, text), text_size(text))
+        if (i + 1) % burst == 0:
+            await asyncio.sleep(interval)
+    buffer.put_nowait(None)
+
+
+def _discard(sock: socket.socket) -> None:
+    """读取并丢弃对端写入的数据"""
+    while sock.recv(65536):
+        pass
+    sock.close()
+
+
+async def run(label: str, args, batcher: FrameBatcher = None) -> None:
+    buffer = StreamBuffer("bench", max_frames=512)
+    encoder = ChunkEncoder("chatcmpl-bench", 0, "deepseek-reasoner", "gemini-pro")
+    source = batcher.drain(buffer, producers=1) if batcher else drain(buffer, producers=1)
+    producer = asyncio.create_task(produce(buffer, args.tokens, args.burst, args.interval_ms / 1000))
+
+    sender, receiver = socket.socketpair()
+    reader = threading.Thread(target=_discard, args=(receiver,), daemon=True)
+    reader.start()
+
+    writes = written = 0
+    wall, cpu = time.perf_counter(), time.process_time()
+    async for kind, text in source:
+        frame = encoder.encode(kind, text)
+        sender.sendall(frame)
+        writes += 1
+        written += len(frame)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    await producer
+    sender.close()
+    reader.join()
+
+    print(
+        f"  {label:<22} 写出次数 {writes:>7}   {writes / wall:>10,.0f} frames/s   "
+        f"{written / writes:>7.0f} B/write   CPU {cpu * 1000:>7.1f} ms   耗时 {wall:.2f}s"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument("--burst", type=int, default=4, help="每次突发写入的 token 数")
+    parser.add_argument("--interval-ms", type=float, default=1.0, help="突发之间的间隔")
+    parser.add_argument("--max-bytes", type=int, default=4096)
+    parser.add_argument("--max-delay-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"token 数: {args.tokens} | 突发: {args.burst} 个/{args.interval_ms}ms")
+    await run("逐 token 成帧", args)
+    await run("合并 (仅积压)", args, FrameBatcher(args.max_bytes, 0))
+    await run(f"合并 ({args.max_delay_ms}ms)", args, FrameBatcher(args.max_bytes, args.max_delay_ms / 1000))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+"""历史窗口基准：长对话中每轮构造 Gemini 输入的耗时与输入大小
+
+对比完整历史与历史窗口。运行方式（仓库根目录）:
+    python -m benchmarks.bench_history [--turns 200] [--turn-chars 2000] [--budget 32000]
+"""
+import argparse
+import time
+
+from app.clients.gemini_client import GeminiClient
+from app.deepgenimi.history_window import HistoryWindow
+from app.utils.tokens import estimate_message_tokens
+
+
+def conversation(turns: int, turn_chars: int) -> list[list]:
+    """生成逐轮增长的对话，返回每一轮请求时的消息列表"""
+    messages = [{"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": "项目背景：" + "需求说明 " * (turn_chars // 5)}]
+    requests = []
+    for turn in range(turns):
+        requests.append(list(messages))
+        messages.append({"role": "assistant", "content": f"第 {turn} 轮回答 " + "answer text " * (turn_chars // 12),
+                         "reasoning_content": "推理过程 " * (turn_chars // 5)})
+        messages.append({"role": "user", "content": f"第 {turn} 轮追问 " + "follow-up " * (turn_chars // 40)})
+    return requests
+
+
+def run(label: str, requests: list[list], build) -> None:
+    per_turn, sizes = [], []
+    for messages in requests:
+        start = time.perf_counter()
+        prompt = build(messages)
+        per_turn.append(time.perf_counter() - start)
+        sizes.append(len(prompt))
+    last = requests[-10:]
+    late = sum(per_turn[-len(last):]) / len(last)
+    print(f"  {label:<22} 总耗时 {sum(per_turn) * 1000:>8.1f} ms | 末 10 轮每轮 {late * 1000:>6.3f} ms | "
+          f"末轮输入 {sizes[-1] / 1024:>8.1f} KB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--turn-chars", type=int, default=2000)
+    parser.add_argument("--budget", type=int, default=32000, help="Gemini 输入 token 预算")
+    args = parser.parse_args()
+
+    requests = conversation(args.turns, args.turn_chars)
+    reasoning = {"role": "assistant", "content": "Here's my reasoning process:\n" + "思考 " * 500}
+    print(f"对话轮数: {args.turns} | 末轮历史: {estimate_message_tokens(requests[-1])} tokens | 预算: {args.budget}")
+
+    client = GeminiClient("bench")
+    run("完整历史", requests, lambda messages: client._format_messages(
+        [m for m in messages + [reasoning] if m.get("role") != "system"]))
+
+    window = HistoryWindow({"gemini": args.budget})
+    run("历史窗口", requests, lambda messages: client._format_messages(
+        [m for m in window.window(messages, "gemini-pro", reserve=window.count(reasoning)) + [reasoning]
+         if m.get("role") != "system"]))
+    print(f"  窗口: 裁剪 {window.trimmed} 次，丢弃 {window.dropped_messages} 条")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""热路径日志基准：对比同步 StreamHandler + 立即格式化 与 队列后台写出 + 惰性格式化
+
+模拟多路并发流，每个 token 经过与 DeepSeekClient 相同的日志调用，每个请求输出与流水线
+相近数量的 INFO 日志，并在开启 DEBUG 前序列化一次较大的请求体。日志写入一个管道，
+由读取线程按指定速度消费（模拟终端或容器日志驱动）。运行方式（仓库根目录）:
+    python -m benchmarks.bench_logging [--streams 200] [--tokens 400] [--reader-delay-us 20]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from app.utils.logger import setup_logger, shutdown_logging, token_trace
+
+INFO_LINES_PER_REQUEST = 10
+
+
+def _drain(fd: int, delay: float) -> None:
+    """读取并丢弃管道中的日志，每次读取后等待 delay 秒"""
+    with os.fdopen(fd, "rb", buffering=0) as reader:
+        while reader.read(65536):
+            if delay:
+                time.sleep(delay)
+
+
+async def legacy_stream(logger: logging.Logger, body: dict, tokens: int) -> None:
+    """旧写法：f-string 在调用前就被格式化，请求体被序列化两次"""
+    logger.debug(f"[准备请求] 请求数据: {json.dumps(body, ensure_ascii=False)}")
+    logger.debug(f"[Debug] Request data: {json.dumps(body, ensure_ascii=False)}")
+    for i in range(INFO_LINES_PER_REQUEST):
+        logger.info(f"处理阶段 {i} | 模型: deepseek-reasoner | 消息数: {len(body['messages'])}")
+    for i in range(tokens):
+        content = f"思考{i} "
+        logger.debug(f"提取推理内容：{content}")
+        await asyncio.sleep(0)
+
+
+async def lazy_stream(logger: logging.Logger, body: dict, tokens: int) -> None:
+    """新写法：DEBUG 关闭时不序列化，token 级日志按请求采样"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[准备请求] 请求数据: %s", json.dumps(body, ensure_ascii=False))
+    for i in range(INFO_LINES_PER_REQUEST):
+        logger.info("处理阶段 %d | 模型: %s | 消息数: %d", i, "deepseek-reasoner", len(body["messages"]))
+    trace = token_trace.get()
+    for i in range(tokens):
+        content = f"思考{i} "
+        if trace:
+            logger.debug("提取推理内容：%s", content)
+        await asyncio.sleep(0)
+
+
+async def measure_lag(stop: asyncio.Event, samples: list[float]) -> None:
+    """每 1ms 唤醒一次，记录实际唤醒相对预期的延迟"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + 0.001
+        await asyncio.sleep(0.001)
+        samples.append(loop.time() - expected)
+
+
+async def run(label: str, stream_fn, async_output: bool, args, body: dict) -> None:
+    read_fd, write_fd = os.pipe()
+    reader = threading.Thread(target=_drain, args=(read_fd, args.reader_delay_us / 1e6), daemon=True)
+    reader.start()
+    output = os.fdopen(write_fd, "w", encoding="utf-8")
+    logger = setup_logger(f"bench-{label}", stream=output, log_format="text", async_output=async_output)
+    logger.setLevel(logging.INFO)
+
+    stop = asyncio.Event()
+    lags: list[float] = []
+    lag_task = asyncio.create_task(measure_lag(stop, lags))
+    wall, cpu = time.perf_counter(), time.thread_time()
+    await asyncio.gather(*(stream_fn(logger, body, args.tokens) for _ in range(args.streams)))
+    wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+    stop.set()
+    await lag_task
+
+    shutdown_logging()
+    output.close()
+    reader.join()
+
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99)] if lags else 0.0
+    total = args.streams * args.tokens
+    print(
+        f"  {label:<26} {total / wall:>10,.0f} tokens/s   事件循环 CPU {cpu * 1000:>7.1f} ms   "
+        f"循环延迟 p99 {p99 * 1000:>6.2f} ms / max {lags[-1] * 1000 if lags else 0:>6.2f} ms"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=400)
+    parser.add_argument("--history-kb", type=int, default=32, help="每个请求体中对话历史的大小")
+    parser.add_argument("--reader-delay-us", type=float, default=20, help="日志读取端每次读取后的等待时间")
+    args = parser.parse_args()
+
+    body = {
+        "model": "deepseek-reasoner",
+        "messages": [{"role": "user", "content": "历史消息 " * 160} for _ in range(max(1, args.history_kb // 2))],
+        "stream": True,
+    }
+    print(f"并发流: {args.streams} | 每流 token: {args.tokens} | 请求体: {len(json.dumps(body, ensure_ascii=False).encode()) // 1024} KB")
+    await run("同步写出 + 立即格式化", legacy_stream, False, args, body)
+    await run("队列写出 + 惰性格式化", lazy_stream, True, args, body)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+"""SSE 解码微基准：对比旧的 decode + splitlines 循环与增量 SSEDecoder
+
+运行方式（仓库根目录）:
+    python -m benchmarks.bench_sse_decoder [--frames 20000] [--fragment 37]
+"""
+import argparse
+import json
+import random
+import time
+
+from app.clients.sse_decoder import SSEDecoder, SSE_DONE, JSON_BACKEND
+
+
+def build_stream(frames: int) -> bytes:
+    """构造一段与 DeepSeek 推理流格式一致的 SSE 字节流"""
+    parts = []
+    for i in range(frames):
+        frame = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "choices": [{"index": 0, "delta": {"reasoning_content": f"推理 token {i} ", "content": None}}],
+        }
+        parts.append(f"data: {json.dumps(frame, ensure_ascii=False)}\n\n".encode("utf-8"))
+    parts.append(b"data: [DONE]\n\n")
+    return b"".join(parts)
+
+
+def split_lines(stream: bytes) -> list[bytes]:
+    """每个 chunk 恰好包含完整的 data 行（旧实现假设的理想情况）"""
+    return [line + b"\n\n" for line in stream.split(b"\n\n") if line]
+
+
+def split_random(stream: bytes, mean: int, seed: int = 7) -> list[bytes]:
+    """按随机长度切分字节流，模拟真实网络分片"""
+    rng = random.Random(seed)
+    chunks, pos = [], 0
+    while pos < len(stream):
+        size = max(1, int(rng.expovariate(1 / mean)))
+        chunks.append(stream[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def legacy_loop(chunks: list[bytes]) -> tuple[int, int]:
+    """旧实现：每个 chunk 单独 decode 再 splitlines"""
+    ok = dropped = 0
+    for chunk in chunks:
+        try:
+            chunk_str = chunk.decode("utf-8")
+        except UnicodeDecodeError:
+            dropped += 1
+            continue
+        for line in chunk_str.splitlines():
+            if line.startswith("data: "):
+                json_str = line[len("data: "):]
+                if json_str == "[DONE]":
+                    return ok, dropped
+                try:
+                    json.loads(json_str)
+                    ok += 1
+                except json.JSONDecodeError:
+                    dropped += 1
+    return ok, dropped
+
+
+def decoder_loop(chunks: list[bytes], loads=None) -> tuple[int, int]:
+    """新实现：增量 SSEDecoder"""
+    decoder = SSEDecoder(loads=loads)
+    ok = 0
+    for chunk in chunks:
+        for event in decoder.feed(chunk):
+            if event is SSE_DONE:
+                return ok, 0
+            ok += 1
+    return ok, 0
+
+
+def run(name: str, fn, chunks: list[bytes], repeat: int) -> None:
+    best = float("inf")
+    ok = dropped = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ok, dropped = fn(chunks)
+        best = min(best, time.perf_counter() - start)
+    print(f"  {name:<28} {ok / best:>12,.0f} frames/s   解析成功 {ok:>7}   丢弃 {dropped:>6}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--fragment", type=int, default=37, help="随机分片的平均字节数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    stream = build_stream(args.frames)
+    scenarios = {
+        "整行 chunk": split_lines(stream),
+        f"随机分片 (均值 {args.fragment}B)": split_random(stream, args.fragment),
+        "大块 chunk (16KB)": split_random(stream, 16384),
+    }
+    print(f"帧数: {args.frames} | 流大小: {len(stream) / 1024:.1f} KB | 默认 JSON 后端: {JSON_BACKEND}")
+    for label, chunks in scenarios.items():
+        print(f"\n[{label}] chunk 数: {len(chunks)}")
+        run("legacy decode+splitlines", legacy_loop, chunks, args.repeat)
+        run("SSEDecoder (json)", lambda c: decoder_loop(c, json.loads), chunks, args.repeat)
+        if JSON_BACKEND == "orjson":
+            run("SSEDecoder (orjson)", decoder_loop, chunks, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""启动基准：导入耗时（python -X importtime）与冷启动到第一个请求完成的时间
+
+导入部分在子进程中导入 app.main，取 app.main 的累计导入耗时和最慢的若干个模块；
+冷启动部分启动模拟上游与一个新的服务进程，记录从启动进程到就绪（GET / 返回 200）、
+到第一个流式请求收到首 token 以及完成的时间（sdk 后端不经过模拟上游，只记录就绪时间）。运行方式（仓库根目录）:
+    python -m benchmarks.bench_startup [--rounds 5] [--backends http,sdk] [--json startup.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+from benchmarks.load_test import Stack, one_request
+
+# 导入 app.main 所需的最小配置，不会连接上游
+IMPORT_ENV = {"ALLOW_API_KEY": "bench-key", "DEEPSEEK_API_KEY": "bench", "GEMINI_API_KEY": "bench",
+              "LOG_LEVEL": "WARNING"}
+
+
+def import_time(backend: str) -> tuple[float, list[tuple[str, int, float]]]:
+    """在子进程中导入 app.main，返回累计导入耗时（毫秒）与各模块的 (名称, 嵌套深度, 累计耗时)"""
+    env = dict(os.environ, GEMINI_BACKEND=backend, **IMPORT_ENV)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"],
+                          env=env, capture_output=True, text=True, check=True)
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), depth, int(cumulative) / 1000))
+    total = next(ms for name, _, ms in modules if name == "app.main")
+    return total, modules
+
+
+async def cold_start(backend: str, args) -> dict:
+    """启动一个新的服务进程，记录就绪与第一个请求的耗时（毫秒）"""
+    stack_args = argparse.Namespace(mock_args="--reasoning-tokens 20 --answer-tokens 20 --token-rate 0 "
+                                              "--deepseek-ttft 0 --gemini-ttft 0",
+                                    server_env=[f"GEMINI_BACKEND={backend}"],
+                                    prompt_words=10, timeout=30)
+    stack = Stack(stack_args)
+    started = time.perf_counter()
+    stack.start()
+    row = {"backend": backend, "ready_ms": None, "first_token_ms": None, "first_request_ms": None}
+    base = f"http://127.0.0.1:{stack.app_port}"
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=stack_args.timeout)) as session:
+            deadline = started + 30
+            while time.perf_counter() < deadline:
+                try:
+                    async with session.get(f"{base}/", headers={"Authorization": f"Bearer {stack.key}"}) as resp:
+                        if resp.status == 200:
+                            row["ready_ms"] = (time.perf_counter() - started) * 1000
+                            break
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.01)
+            if row["ready_ms"] is None or backend != "http":
+                return row
+            request_started = time.perf_counter()
+            result = await one_request(session, f"{base}/v1/chat/completions", stack.key, 0, stack_args)
+            if result.ok:
+                row["first_token_ms"] = (request_started - started + result.ttft) * 1000
+                row["first_request_ms"] = (time.perf_counter() - started) * 1000
+    finally:
+        stack.stop()
+    return row
+
+
+def _fmt(value) -> str:
+    return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=5, help="每项测量的重复次数，取中位数")
+    parser.add_argument("--backends", default="http", help="逗号分隔的 GEMINI_BACKEND 取值")
+    parser.add_argument("--top", type=int, default=10, help="列出累计导入耗时最长的模块数")
+    parser.add_argument("--json", help="将结果写入 JSON 文件，便于对比回归")
+    args = parser.parse_args()
+
+    results = {"import": {}, "cold_start": []}
+    for backend in args.backends.split(","):
+        runs = [import_time(backend) for _ in range(args.rounds)]
+        total = statistics.median(run[0] for run in runs)
+        modules = runs[-1][1]
+        genai = next((ms for name, _, ms in modules if name == "google.generativeai"), None)
+        results["import"][backend] = {"app_main_ms": total, "google_generativeai_ms": genai}
+        print(f"[{backend}] 导入 app.main: {total:.1f} ms | google.generativeai: "
+              f"{f'{genai:.1f} ms' if genai is not None else '未导入'}")
+        # app.main 直接导入的模块（深度 1），即各依赖的整体开销
+        direct = [(name, ms) for name, depth, ms in modules if depth == 1]
+        for name, ms in sorted(direct, key=lambda item: -item[1])[:args.top]:
+            print(f"    {name:<40} {ms:>8.1f} ms")
+
+    print(f"\n{'backend':>8} {'就绪':>9} {'首 token':>9} {'首个请求':>9}   (ms，自启动服务进程起，{args.rounds} 次取中位数)")
+    for backend in args.backends.split(","):
+        rows = [await cold_start(backend, args) for _ in range(args.rounds)]
+        summary = {"backend": backend}
+        for key in ("ready_ms", "first_token_ms", "first_request_ms"):
+            values = [row[key] for row in rows if row[key] is not None]
+            summary[key] = statistics.median(values) if values else None
+        results["cold_start"].append(summary)
+        print(f"{backend:>8} {_fmt(summary['ready_ms'])} {_fmt(summary['first_token_ms'])} {_fmt(summary['first_request_ms'])}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
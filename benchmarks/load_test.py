@@ -0,0 +1,318 @@
+"""端到端压测：按固定并发级别请求 /v1/chat/completions，统计首 token 延迟、token 间隔、吞吐以及服务端 CPU 与内存
+
+「交接」为最后一个推理帧到第一个回答帧的间隔，即客户端看到的 Gemini 阶段首 token 延迟。
+
+默认（--spawn）在本地启动模拟上游（benchmarks.mock_upstreams）和服务本身，全程离线运行；
+也可以用 --url 指向已运行的服务，并用 --server-pid 指定其进程以采集 CPU 与内存（仅 Linux）。
+运行方式（仓库根目录）:
+    python -m benchmarks.load_test [--concurrency 1,8,32,64] [--requests 4] [--mock-args "--token-rate 500"]
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --key sk-xxx --server-pid 12345
+"""
+import argparse
+import asyncio
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import aiohttp
+
+from app.clients.sse_decoder import SSEDecoder, SSE_DONE
+from app.utils.tokens import estimate_tokens
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+@dataclass
+class RequestResult:
+    """单个请求的测量结果"""
+    ok: bool
+    ttft: Optional[float] = None
+    handoff: Optional[float] = None  # 最后一个推理帧到第一个回答帧的间隔，即 Gemini 阶段的首 token 延迟
+    duration: float = 0.0
+    tokens: int = 0
+    gaps: list[float] = field(default_factory=list)
+    error: str = ""
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class ProcessSampler:
+    """通过 /proc 采集进程的 CPU 时间与 RSS，非 Linux 或未指定进程时不采集"""
+
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid if pid and os.path.exists(f"/proc/{pid}/stat") else None
+        self.peak_rss = 0
+
+    def cpu_seconds(self) -> float:
+        if self.pid is None:
+            return 0.0
+        with open(f"/proc/{self.pid}/stat") as f:
+            # comm 字段可能包含空格，从最后一个右括号之后开始切分
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+
+    def rss_bytes(self) -> int:
+        if self.pid is None:
+            return 0
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    async def watch(self, stop: asyncio.Event, interval: float = 0.1) -> None:
+        """记录采样期间的 RSS 峰值"""
+        self.peak_rss = self.rss_bytes()
+        while not stop.is_set():
+            self.peak_rss = max(self.peak_rss, self.rss_bytes())
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except TimeoutError:
+                pass
+
+
+async def one_request(session: aiohttp.ClientSession, url: str, key: str, index: int, args) -> RequestResult:
+    """发送一个流式请求，记录每个内容帧的到达时间"""
+    body = {
+        "model": "deepgenimi",
+        "stream": True,
+        # 每个请求使用不同的提示词，避免命中推理缓存或请求合并
+        "messages": [{"role": "user", "content": f"压测请求 {index}: " + "背景信息 " * args.prompt_words}],
+    }
+    headers = {"Authorization": f"Bearer {key}"}
+    started = time.perf_counter()
+    result = RequestResult(ok=False)
+    last = last_reasoning = None
+    try:
+        async with session.post(url, json=body, headers=headers) as resp:
+            if resp.status != 200:
+                result.error = f"http_{resp.status}"
+                return result
+            decoder = SSEDecoder()
+            async for chunk in resp.content.iter_any():
+                now = time.perf_counter()
+                for event in decoder.feed(chunk):
+                    if event is SSE_DONE or not isinstance(event, dict):
+                        continue
+                    if event.get("error"):
+                        result.error = "stream_error"
+                        continue
+                    for choice in event.get("choices") or ():
+                        delta = choice.get("delta") or {}
+                        reasoning, answer = delta.get("reasoning_content") or "", delta.get("content") or ""
+                        text = reasoning + answer
+                        if not text:
+                            continue
+                        if reasoning:
+                            last_reasoning = now
+                        elif result.handoff is None and last_reasoning is not None:
+                            result.handoff = now - last_reasoning
+                        result.tokens += estimate_tokens(text)
+                        if last is None:
+                            result.ttft = now - started
+                        else:
+                            result.gaps.append(now - last)
+                        last = now
+            result.ok = not result.error and result.ttft is not None
+            if not result.ok and not result.error:
+                result.error = "empty_stream"
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        result.error = type(e).__name__
+    finally:
+        result.duration = time.perf_counter() - started
+    return result
+
+
+async def run_level(url: str, key: str, concurrency: int, args, sampler: ProcessSampler, offset: int) -> dict:
+    """以固定并发执行一轮压测：concurrency 个工作协程各自连续发送请求"""
+    total = concurrency * args.requests
+    counter = iter(range(offset, offset + total))
+    results: list[RequestResult] = []
+
+    async def worker(session: aiohttp.ClientSession) -> None:
+        for index in counter:
+            results.append(await one_request(session, url, key, index, args))
+
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(sampler.watch(stop))
+    rss_before = sampler.rss_bytes()
+    cpu_before = sampler.cpu_seconds()
+    wall = time.perf_counter()
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    wall = time.perf_counter() - wall
+    cpu = sampler.cpu_seconds() - cpu_before
+    stop.set()
+    await watcher
+
+    ok = [r for r in results if r.ok]
+    errors: dict[str, int] = {}
+    for r in results:
+        if r.error:
+            errors[r.error] = errors.get(r.error, 0) + 1
+    gaps = [gap for r in ok for gap in r.gaps]
+    ttfts = [r.ttft for r in ok]
+    handoffs = [r.handoff for r in ok if r.handoff is not None]
+    tokens = sum(r.tokens for r in ok)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(ok),
+        "errors": errors,
+        "ttft_p50_ms": _percentile(ttfts, 50) * 1000,
+        "ttft_p99_ms": _percentile(ttfts, 99) * 1000,
+        "handoff_p50_ms": _percentile(handoffs, 50) * 1000,
+        "itl_p50_ms": _percentile(gaps, 50) * 1000,
+        "itl_p99_ms": _percentile(gaps, 99) * 1000,
+        "tokens_per_second": tokens / wall if wall else 0.0,
+        "requests_per_second": len(ok) / wall if wall else 0.0,
+        "server_cpu_ms_per_stream": cpu * 1000 / len(ok) if ok and sampler.pid else None,
+        "server_peak_rss_mb": sampler.peak_rss / 2 ** 20 if sampler.pid else None,
+        "server_rss_kb_per_stream": max(0, sampler.peak_rss - rss_before) / 1024 / concurrency if sampler.pid else None,
+    }
+
+
+def _print_row(row: dict) -> None:
+    cpu = row["server_cpu_ms_per_stream"]
+    rss = row["server_rss_kb_per_stream"]
+    print(
+        f"{row['concurrency']:>6} {row['ok']:>5}/{row['requests']:<5} "
+        f"{row['ttft_p50_ms']:>9.1f} {row['ttft_p99_ms']:>9.1f} {row['handoff_p50_ms']:>9.1f} "
+        f"{row['itl_p50_ms']:>8.2f} {row['itl_p99_ms']:>8.2f} "
+        f"{row['tokens_per_second']:>10,.0f} {row['requests_per_second']:>7.2f} "
+        f"{cpu if cpu is not None else float('nan'):>9.2f} {rss if rss is not None else float('nan'):>9.1f}"
+        + (f"  错误: {row['errors']}" if row["errors"] else "")
+    )
+
+
+class Stack:
+    """在本地启动模拟上游与服务进程"""
+
+    def __init__(self, args):
+        self.args = args
+        self.mock_port = _free_port()
+        self.app_port = _free_port()
+        self.key = "bench-key"
+        self.processes: list[subprocess.Popen] = []
+
+    def start(self) -> subprocess.Popen:
+        mock_cmd = [sys.executable, "-m", "benchmarks.mock_upstreams", "--port", str(self.mock_port)]
+        mock_cmd += shlex.split(self.args.mock_args)
+        self.processes.append(subprocess.Popen(mock_cmd))
+
+        upstream = f"http://127.0.0.1:{self.mock_port}"
+        env = dict(os.environ)
+        env.update({
+            "ALLOW_API_KEY": self.key,
+            "DEEPSEEK_API_KEY": "mock",
+            "DEEPSEEK_API_URL": f"{upstream}/v1/chat/completions",
+            "DEEPSEEK_MODEL": "deepseek-reasoner",
+            "GEMINI_API_KEY": "mock",
+            "GEMINI_API_URL": f"{upstream}/v1beta/models/gemini-pro:streamGenerateContent",
+            "GEMINI_MODEL": "gemini-pro",
+            "GEMINI_BACKEND": "http",
+        })
+        env.pop("DEEPSEEK_ENDPOINTS", None)
+        env.pop("API_KEYS", None)
+        env.setdefault("LOG_LEVEL", "WARNING")
+        env.setdefault("REASONING_CACHE_SIZE", "0")
+        for pair in self.args.server_env:
+            name, _, value = pair.partition("=")
+            env[name] = value
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(self.app_port), "--log-level", "warning"],
+            env=env,
+        )
+        self.processes.append(server)
+        return server
+
+    async def wait_ready(self, timeout: float = 30) -> None:
+        deadline = time.monotonic() + timeout
+        async with aiohttp.ClientSession() as session:
+            while time.monotonic() < deadline:
+                try:
+                    async with session.get(f"http://127.0.0.1:{self.app_port}/",
+                                           headers={"Authorization": f"Bearer {self.key}"}) as resp:
+                        if resp.status == 200:
+                            return
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError("服务未能在规定时间内启动")
+
+    def stop(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,8,32,64", help="逗号分隔的并发级别")
+    parser.add_argument("--requests", type=int, default=4, help="每个并发级别下每个工作协程发送的请求数")
+    parser.add_argument("--prompt-words", type=int, default=50, help="提示词长度")
+    parser.add_argument("--timeout", type=float, default=300, help="单个请求的超时时间（秒）")
+    parser.add_argument("--url", help="已运行服务的地址，不指定时在本地启动模拟上游与服务")
+    parser.add_argument("--key", default="", help="配合 --url 使用的 API 密钥")
+    parser.add_argument("--server-pid", type=int, help="配合 --url 使用，采集该进程的 CPU 与内存")
+    parser.add_argument("--mock-args", default="", help="传给 benchmarks.mock_upstreams 的参数")
+    parser.add_argument("--server-env", action="append", default=[], metavar="NAME=VALUE",
+                        help="启动服务时额外设置的环境变量，可重复")
+    parser.add_argument("--json", help="将结果写入 JSON 文件，便于对比回归")
+    args = parser.parse_args()
+
+    stack = None
+    if args.url:
+        base, key, pid = args.url.rstrip("/"), args.key, args.server_pid
+    else:
+        stack = Stack(args)
+        pid = stack.start().pid
+        base, key = f"http://127.0.0.1:{stack.app_port}", stack.key
+    try:
+        if stack is not None:
+            await stack.wait_ready()
+        sampler = ProcessSampler(pid)
+        url = f"{base}/v1/chat/completions"
+        print(f"目标: {url} | 服务端进程: {sampler.pid or '未采集'}")
+        print(f"{'并发':>6} {'成功/总数':>11} {'TTFT p50':>9} {'TTFT p99':>9} {'交接 p50':>9} {'ITL p50':>8} {'ITL p99':>8} "
+              f"{'tokens/s':>10} {'req/s':>7} {'CPU ms/流':>9} {'RSS KB/流':>9}")
+        rows, offset = [], 0
+        for concurrency in (int(level) for level in args.concurrency.split(",")):
+            row = await run_level(url, key, concurrency, args, sampler, offset)
+            offset += row["requests"]
+            rows.append(row)
+            _print_row(row)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"mock_args": args.mock_args, "server_env": args.server_env, "levels": rows},
+                          f, ensure_ascii=False, indent=2)
+    finally:
+        if stack is not None:
+            stack.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,176 @@
+"""本地模拟上游：DeepSeek（OpenAI 兼容 SSE）与 Gemini（streamGenerateContent?alt=sse）
+
+同一进程、同一端口同时提供两种接口，供压测在离线环境下使用，不消耗真实 API 额度。
+推理长度、输出速率、首 token 延迟、网络分片与错误率均可配置。运行方式（仓库根目录）:
+    python -m benchmarks.mock_upstreams [--port 9100] [--reasoning-tokens 300] [--token-rate 200]
+
+服务端对应的配置:
+    DEEPSEEK_API_URL=http://127.0.0.1:9100/v1/chat/completions
+    GEMINI_API_URL=http://127.0.0.1:9100/v1beta/models/gemini-pro:streamGenerateContent
+    GEMINI_BACKEND=http
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Optional
+
+from aiohttp import web
+
+from app.utils.tokens import estimate_tokens
+
+
+def _sse(payload: dict) -> bytes:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+class MockUpstreams:
+    """模拟上游，参数与命令行选项一一对应"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.counts = {"deepseek": 0, "gemini": 0, "deepseek_errors": 0, "gemini_errors": 0, "drops": 0}
+        # 各请求携带的 traceparent 请求头（没有时为 None），用于检查链路传播
+        self.traceparents: list[Optional[str]] = []
+
+    async def _write(self, resp: web.StreamResponse, data: bytes) -> None:
+        """按配置的分片大小写出，模拟被网络拆开的 SSE 帧"""
+        fragment = self.args.fragment
+        if fragment <= 0:
+            await resp.write(data)
+            return
+        for start in range(0, len(data), fragment):
+            await resp.write(data[start:start + fragment])
+
+    async def _pace(self, started: float, emitted: int, rate: float) -> None:
+        """按目标速率输出：按累计 token 数计算应到时刻，避免 sleep 误差累积"""
+        if rate > 0:
+            delay = started + emitted / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif emitted % 16 == 0:
+                await asyncio.sleep(0)
+
+    async def deepseek(self, request: web.Request) -> web.StreamResponse:
+        try:
+            return await self._deepseek(request)
+        except ConnectionResetError:
+            # 服务端在推理交接后会主动关闭 DeepSeek 流
+            return web.Response()
+
+    async def _deepseek(self, request: web.Request) -> web.StreamResponse:
+        args = self.args
+        body = await request.json()
+        self.counts["deepseek"] += 1
+        self.traceparents.append(request.headers.get("traceparent"))
+        if self.rng.random() < args.deepseek_error_rate:
+            self.counts["deepseek_errors"] += 1
+            return web.json_response({"error": {"message": "mock overloaded"}}, status=503)
+
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        await asyncio.sleep(args.deepseek_ttft)
+
+        chat_id = f"chatcmpl-mock-{self.counts['deepseek']}"
+        model = body.get("model", "deepseek-reasoner")
+        drop_at = args.reasoning_tokens // 2 if self.rng.random() < args.drop_rate else -1
+        started = time.perf_counter()
+        for i in range(args.reasoning_tokens):
+            if i == drop_at:
+                # 模拟推理中途断连
+                self.counts["drops"] += 1
+                request.transport.close()
+                return resp
+            await self._write(resp, _sse({
+                "id": chat_id, "object": "chat.completion.chunk", "model": model,
+                "choices": [{"index": 0, "delta": {"role": "assistant", "reasoning_content": self._reasoning_token(i), "content": None}}],
+            }))
+            await self._pace(started, i + 1, args.token_rate)
+
+        for i in range(args.deepseek_answer_tokens):
+            await self._write(resp, _sse({
+                "id": chat_id, "object": "chat.completion.chunk", "model": model,
+                "choices": [{"index": 0, "delta": {"role": "assistant", "reasoning_content": None, "content": f"answer{i} "}}],
+            }))
+            await self._pace(started, args.reasoning_tokens + i + 1, args.token_rate)
+        await resp.write(b"data: [DONE]\n\n")
+        return resp
+
+    def _reasoning_token(self, i: int) -> str:
+        paragraph = self.args.paragraph_tokens
+        if paragraph > 0 and i % paragraph == paragraph - 1:
+            return f"推理{i}\n\n"
+        return f"推理{i} "
+
+    async def gemini(self, request: web.Request) -> web.StreamResponse:
+        try:
+            return await self._gemini(request)
+        except ConnectionResetError:
+            return web.Response()
+
+    async def _gemini(self, request: web.Request) -> web.StreamResponse:
+        args = self.args
+        body = await request.text()
+        self.counts["gemini"] += 1
+        self.traceparents.append(request.headers.get("traceparent"))
+        if self.rng.random() < args.gemini_error_rate:
+            self.counts["gemini_errors"] += 1
+            return web.json_response({"error": {"code": 503, "message": "mock unavailable"}}, status=503)
+
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        # 首 token 延迟随输入长度增加，模拟 prefill 开销
+        await asyncio.sleep(args.gemini_ttft + args.gemini_prefill_ms_per_1k * estimate_tokens(body) / 1e6)
+
+        started = time.perf_counter()
+        for i in range(args.answer_tokens):
+            payload = {"candidates": [{"content": {"parts": [{"text": f"回答{i} "}], "role": "model"}, "index": 0}]}
+            if i == args.answer_tokens - 1:
+                payload["candidates"][0]["finishReason"] = "STOP"
+            # Gemini 的 SSE 以 \r\n\r\n 分隔事件
+            await self._write(resp, f"data: {json.dumps(payload, ensure_ascii=False)}\r\n\r\n".encode("utf-8"))
+            await self._pace(started, i + 1, args.gemini_token_rate)
+        return resp
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.counts)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.deepseek)
+        app.router.add_post("/v1beta/models/{model}", self.gemini)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--reasoning-tokens", type=int, default=300, help="每个请求的推理 token 数")
+    parser.add_argument("--paragraph-tokens", type=int, default=20, help="推理内容每隔多少 token 分段，0 表示不分段")
+    parser.add_argument("--deepseek-answer-tokens", type=int, default=20, help="推理结束后 DeepSeek 继续输出的回答 token 数")
+    parser.add_argument("--token-rate", type=float, default=200, help="DeepSeek 每秒输出 token 数，0 表示不限速")
+    parser.add_argument("--deepseek-ttft", type=float, default=0.3, help="DeepSeek 首 token 延迟（秒）")
+    parser.add_argument("--deepseek-error-rate", type=float, default=0.0, help="DeepSeek 直接返回 503 的比例")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="DeepSeek 推理中途断开连接的比例")
+    parser.add_argument("--answer-tokens", type=int, default=200, help="Gemini 每个请求的回答 token 数")
+    parser.add_argument("--gemini-token-rate", type=float, default=400, help="Gemini 每秒输出 token 数，0 表示不限速")
+    parser.add_argument("--gemini-ttft", type=float, default=0.2, help="Gemini 首 token 延迟（秒）")
+    parser.add_argument("--gemini-prefill-ms-per-1k", type=float, default=0.0,
+                        help="Gemini 输入每 1k token 额外增加的首 token 延迟（毫秒）")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="Gemini 直接返回 503 的比例")
+    parser.add_argument("--fragment", type=int, default=0, help="每次写出的最大字节数，用于模拟 SSE 帧被拆分，0 表示整帧写出")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    web.run_app(MockUpstreams(args).app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
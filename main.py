@@ -1,4 +1,13 @@
-import uvicorn
+from app.utils.settings import get_settings
+from app.utils.server import serve
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8004)
\ No newline at end of file
+    settings = get_settings()
+    serve(
+        "app.main:app",
+        host=settings.host,
+        port=settings.port,
+        workers=settings.workers,
+        graceful_timeout=settings.graceful_shutdown_timeout,
+        state_dir=settings.shared_state_dir,
+    )
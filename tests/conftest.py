@@ -0,0 +1,164 @@
+"""测试公用夹具：在后台线程中运行模拟上游，按测试需要组装 DeepGenimi，以及在进程内调用 API
+
+模拟上游运行在独立线程的事件循环中，测试自己的事件循环里只剩被测代码创建的任务，
+便于断言请求结束后没有遗留的任务。
+"""
+import asyncio
+import dataclasses
+import json
+import os
+import threading
+from typing import Callable, Optional
+
+import pytest
+from aiohttp import web
+
+# app.utils.auth 在导入时加载密钥表，没有任何密钥时拒绝启动；须在导入 app 之前设置
+os.environ.setdefault("ALLOW_API_KEY", "sk-test")
+
+from app.clients import HttpPool
+from app.deepgenimi import DeepGenimi
+from benchmarks.mock_upstreams import MockUpstreams, build_parser
+
+
+class MockServer:
+    """在后台线程中运行的模拟上游"""
+
+    def __init__(self, options: list[str]):
+        self.upstreams = MockUpstreams(build_parser().parse_args(options))
+        self.url = ""
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="mock-upstreams", daemon=True)
+
+    @property
+    def deepseek_url(self) -> str:
+        return f"{self.url}/v1/chat/completions"
+
+    @property
+    def gemini_url(self) -> str:
+        return f"{self.url}/v1beta/models/gemini-pro:streamGenerateContent"
+
+    @property
+    def counts(self) -> dict:
+        return dict(self.upstreams.counts)
+
+    def start(self) -> "MockServer":
+        self._thread.start()
+        if not self._ready.wait(5):
+            raise RuntimeError("mock upstreams did not start")
+        return self
+
+    def stop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        runner = web.AppRunner(self.upstreams.app())
+        self._loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        self.url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(runner.cleanup())
+        self._loop.close()
+
+
+@pytest.fixture
+def mock_upstreams() -> Callable[..., MockServer]:
+    """启动模拟上游，参数与 benchmarks.mock_upstreams 的命令行选项相同"""
+    servers = []
+
+    def start(*options: str) -> MockServer:
+        server = MockServer(list(options)).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def make_deep_genimi() -> Callable[..., DeepGenimi]:
+    """按模拟上游的地址创建 DeepGenimi，其余参数原样传给构造函数"""
+
+    def make(server: MockServer, http_pool: Optional[HttpPool] = None, **kwargs) -> DeepGenimi:
+        return DeepGenimi("sk-test", "test-key", deepseek_api_url=server.deepseek_url,
+                          gemini_api_url=server.gemini_url, http_pool=http_pool, **kwargs)
+
+    return make
+
+
+class AppClient:
+    """直接通过 ASGI 接口调用 app.main 的路由，不经过网络，也不运行 lifespan"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method: str, path: str, body: Optional[dict] = None,
+                      headers: Optional[dict] = None) -> tuple[int, dict, bytes]:
+        """发送请求并读取完整响应
+
+        Returns:
+            tuple[int, dict, bytes]: 状态码、小写的响应头与响应体
+        """
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        raw_headers = [(b"content-type", b"application/json")]
+        raw_headers += [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+        path, _, query = path.partition("?")
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+                 "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+                 "root_path": "", "headers": raw_headers, "client": ("127.0.0.1", 1), "server": ("test", 80)}
+        received = False
+        response = {"status": None, "headers": {}, "body": []}
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": payload, "more_body": False}
+            # 请求体已读完，之后只在响应结束后才会返回断开
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = {name.decode(): value.decode() for name, value in message.get("headers", ())}
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return response["status"], response["headers"], b"".join(response["body"])
+
+
+@pytest.fixture
+def app_client(monkeypatch) -> Callable[..., AppClient]:
+    """按模拟上游的地址创建 app.main 的各组件，并以给定租户通过鉴权
+
+    用法：client = app_client(server, tenant, deepseek_max_concurrency=1, ...)，
+    关键字参数覆盖对应的 Settings 字段。测试结束后恢复 app.main 的全局组件与配置。
+    """
+    from app import main
+    from app.utils import metrics, server as server_module
+    from app.utils.auth import Tenant, verify_api_key
+
+    def start(server: MockServer, tenant: Optional[Tenant] = None, **overrides) -> AppClient:
+        for name in ("http_pool", "deepseek_endpoints", "deepseek_hedge", "reasoning_cache", "single_flight",
+                     "frame_batcher", "history_window", "reasoning_router", "admission", "deep_genimi",
+                     "shared_state", "tracer"):
+            monkeypatch.setattr(main, name, None)
+        # create_services() 注册的抓取时取值的指标与排空回调在测试结束后一并移除
+        monkeypatch.setattr(metrics.registry, "_metrics", list(metrics.registry._metrics))
+        monkeypatch.setattr(server_module, "_drain_callbacks", list(server_module._drain_callbacks))
+        monkeypatch.setattr(main, "settings", dataclasses.replace(
+            main.settings, deepseek_api_key="sk-test", deepseek_api_url=server.deepseek_url, deepseek_endpoints="",
+            gemini_api_key="test-key", gemini_api_url=server.gemini_url, workers=1, **overrides))
+        main.create_services()
+        tenant = tenant or Tenant("default")
+        monkeypatch.setitem(main.app.dependency_overrides, verify_api_key, lambda: tenant)
+        return AppClient(main.app)
+
+    return start
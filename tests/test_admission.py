@@ -0,0 +1,148 @@
+"""准入控制：阶段并发上限、排队与拒绝、按租户公平分配"""
+import asyncio
+
+import pytest
+
+from app.deepgenimi import AdmissionController, OverloadedError
+from app.deepgenimi.admission import StageLimiter
+
+
+def test_rejects_when_queue_is_full_and_admits_after_release():
+    async def scenario():
+        admission = AdmissionController(deepseek_concurrency=1, gemini_concurrency=1, max_queue=1, max_queue_time=5)
+        first = await admission.admit()
+        queued = asyncio.create_task(admission.admit())
+        await asyncio.sleep(0)
+        assert admission.deepseek.waiting == 1
+
+        with pytest.raises(OverloadedError) as rejected:
+            await admission.admit()
+        assert rejected.value.status == 429
+
+        first.release()
+        second = await asyncio.wait_for(queued, 1)
+        assert admission.deepseek.in_flight == 1
+        second.release()
+        assert admission.stats()["deepseek"]["in_flight"] == 0
+        assert admission.stats()["admitted"] == 2
+        assert admission.stats()["rejected"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_is_rejected_and_leaves_no_waiter():
+    async def scenario():
+        admission = AdmissionController(deepseek_concurrency=1, max_queue=4, max_queue_time=0.01)
+        permit = await admission.admit()
+        with pytest.raises(OverloadedError):
+            await admission.admit()
+        assert admission.deepseek.waiting == 0
+        assert admission.timed_out == 1
+        permit.release()
+        assert admission.deepseek.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_permit_hands_off_between_stages_and_releases_once():
+    async def scenario():
+        admission = AdmissionController(deepseek_concurrency=1, gemini_concurrency=1, max_queue=1)
+        permit = await admission.admit()
+        permit.release_deepseek()
+        permit.release_deepseek()
+        assert admission.deepseek.in_flight == 0
+
+        await permit.acquire_gemini()
+        assert admission.gemini.in_flight == 1
+        # 另一个请求的 Gemini 名额要等前一个释放
+        other = await admission.admit()
+        other.release_deepseek()
+        with pytest.raises(TimeoutError):
+            await other.acquire_gemini(timeout=0.01)
+
+        permit.release()
+        permit.release()
+        await other.acquire_gemini(timeout=1)
+        other.release()
+        assert admission.deepseek.in_flight == 0
+        assert admission.gemini.in_flight == 0
+        assert admission.gemini.waiting == 0
+
+    asyncio.run(scenario())
+
+
+def test_draining_rejects_with_503():
+    async def scenario():
+        admission = AdmissionController()
+        admission.begin_drain()
+        with pytest.raises(OverloadedError) as rejected:
+            await admission.admit()
+        assert rejected.value.status == 503
+
+    asyncio.run(scenario())
+
+
+def test_freed_slots_go_to_the_tenant_with_fewest_in_flight():
+    async def scenario():
+        limiter = StageLimiter("deepseek", max_concurrency=2)
+        await limiter.acquire(tenant="heavy")
+        await limiter.acquire(tenant="heavy")
+        # heavy 先排了 3 个，light 后排 1 个
+        heavy = [asyncio.create_task(limiter.acquire(tenant="heavy")) for _ in range(3)]
+        await asyncio.sleep(0)
+        light = asyncio.create_task(limiter.acquire(tenant="light"))
+        await asyncio.sleep(0)
+        assert limiter.waiting == 4
+
+        limiter.release("heavy")
+        await asyncio.sleep(0)
+        assert light.done()
+        assert not any(task.done() for task in heavy)
+
+        limiter.release("heavy")
+        await asyncio.sleep(0)
+        assert sum(task.done() for task in heavy) == 1
+        for task in heavy:
+            task.cancel()
+        await asyncio.gather(*heavy, return_exceptions=True)
+        assert limiter.waiting == 0
+        assert limiter.stats()["tenants"] == {"heavy": {"in_flight": 1, "waiting": 0},
+                                              "light": {"in_flight": 1, "waiting": 0}}
+
+    asyncio.run(scenario())
+
+
+def test_weights_scale_the_fair_share():
+    async def scenario():
+        limiter = StageLimiter("gemini", max_concurrency=3)
+        await limiter.acquire(tenant="gold", weight=2.0)
+        await limiter.acquire(tenant="gold", weight=2.0)
+        await limiter.acquire(tenant="free", weight=1.0)
+        gold = asyncio.create_task(limiter.acquire(tenant="gold", weight=2.0))
+        free = asyncio.create_task(limiter.acquire(tenant="free", weight=1.0))
+        await asyncio.sleep(0)
+
+        # 释放后 gold 进行中 2 / 权重 2 = 1，free 进行中 0 / 权重 1 = 0，名额归 free
+        limiter.release("free")
+        await asyncio.sleep(0)
+        assert free.done() and not gold.done()
+        gold.cancel()
+        await asyncio.gather(gold, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_waiter_cancelled_after_grant_returns_the_slot():
+    async def scenario():
+        limiter = StageLimiter("deepseek", max_concurrency=1)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        limiter.release()  # 名额交给 waiter，但它还没恢复执行
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert limiter.in_flight == 0
+        assert limiter.waiting == 0
+        await asyncio.wait_for(limiter.acquire(), 1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,90 @@
+"""批处理进度文件"""
+import asyncio
+import json
+
+from app.clients import HttpPool
+from app.deepgenimi.batch import BatchProgress, BatchRunner, iter_jsonl
+
+UPSTREAM = ("--deepseek-ttft", "0", "--reasoning-tokens", "2", "--deepseek-answer-tokens", "1", "--token-rate", "0",
+            "--answer-tokens", "2", "--gemini-token-rate", "0", "--gemini-ttft", "0")
+
+
+def test_progress_writes_in_background_and_resumes(tmp_path):
+    path = str(tmp_path / "batch.jsonl")
+
+    async def scenario():
+        progress = BatchProgress(path)
+        for i in range(100):
+            error = {"message": "failed"} if i % 10 == 0 else None
+            progress.append(json.dumps({"custom_id": f"item-{i}", "response": {}, "error": error}))
+        # 写入在后台线程中完成，关闭文件等到写入结束
+        progress.close()
+        await asyncio.sleep(0)
+        await progress.flush()
+
+    asyncio.run(scenario())
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 100
+
+    resumed = BatchProgress(path)
+    try:
+        assert len(resumed.completed) == 90
+        assert "item-0" not in resumed.completed
+        assert "item-1" in resumed.completed
+    finally:
+        resumed.close()
+
+
+async def chunked(data: bytes, size: int = 7):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def test_iter_jsonl_reassembles_lines_and_reports_invalid_ones():
+    data = b'{"custom_id": "a"}\n\n not json\n[1]\n{"custom_id": "b"}'
+
+    async def scenario():
+        return [item async for item in iter_jsonl(chunked(data))]
+
+    items = asyncio.run(scenario())
+    assert items[0] == {"custom_id": "a"} and items[-1] == {"custom_id": "b"}
+    assert [item["_invalid"].split(":")[0] for item in items[1:3]] == ["Invalid JSON", "Each line must be a JSON object"]
+
+
+def test_runner_records_results_and_resume_skips_completed_items(tmp_path, mock_upstreams, make_deep_genimi):
+    server = mock_upstreams(*UPSTREAM)
+    path = str(tmp_path / "batch.jsonl")
+    lines = [json.dumps({"custom_id": f"item-{i}", "body": {"messages": [{"role": "user", "content": f"q{i}"}]}})
+             for i in range(4)] + ["not json"]
+    data = "\n".join(lines).encode()
+
+    def run_batch() -> tuple[list[dict], BatchRunner]:
+        pool = HttpPool()
+        runner = BatchRunner(make_deep_genimi(server, pool), "deepseek-reasoner", "gemini-pro",
+                             parse_params=lambda body: (0.5, 0.9, 0.0, 0.0), concurrency=2)
+
+        async def scenario():
+            await pool.start()
+            progress = await asyncio.to_thread(BatchProgress, path)
+            try:
+                return [json.loads(line) async for line in runner.run(iter_jsonl(chunked(data)), progress)]
+            finally:
+                await progress.flush()
+                progress.close()
+                await pool.close()
+
+        return asyncio.run(scenario()), runner
+
+    results, runner = run_batch()
+    by_id = {result["custom_id"]: result for result in results}
+    assert sorted(by_id) == ["item-0", "item-1", "item-2", "item-3", "line-5"]
+    assert by_id["item-2"]["response"]["choices"][0]["message"]["content"] == "回答0 回答1 "
+    assert by_id["line-5"]["error"]["message"].startswith("Invalid JSON")
+    assert runner.stats() == {"submitted": 4, "succeeded": 4, "failed": 1, "skipped": 0}
+    assert server.counts["deepseek"] == 4
+
+    # 续跑：已成功的项直接回放，失败的项重新执行
+    results, runner = run_batch()
+    assert len(results) == 5
+    assert runner.stats() == {"submitted": 0, "succeeded": 0, "failed": 1, "skipped": 4}
+    assert server.counts["deepseek"] == 4
@@ -0,0 +1,92 @@
+"""客户端中途断开时流水线的清理"""
+import asyncio
+
+import anyio
+import pytest
+
+from app.clients import HttpPool
+from app.deepgenimi import AdmissionController, SingleFlight
+
+MODEL_ARG = (0.7, 0.95, 0.0, 0.0)
+
+
+async def disconnect_after(stream, frames: int, kind: str = "reasoning") -> int:
+    """读取 frames 个指定类型（"reasoning" 或 "answer"）的帧后断开
+
+    与 Starlette 在客户端断开时的行为一致：取消作用域内的每一次 await 都会被再次取消，
+    包括生成器 finally 中的清理逻辑。
+    """
+    received = 0
+    with anyio.CancelScope() as scope:
+        async for chunk in stream:
+            # 已缓冲的帧在下一次 await 之前仍会产出，断开之后不再计数
+            if not scope.cancel_called and (b'"reasoning_content"' in chunk) == (kind == "reasoning"):
+                received += 1
+                if received >= frames:
+                    scope.cancel()
+    return received
+
+
+async def settle(timeout: float = 5.0) -> None:
+    """等待当前任务之外的所有任务结束"""
+    current = asyncio.current_task()
+    async with asyncio.timeout(timeout):
+        while any(task is not current for task in asyncio.all_tasks()):
+            await asyncio.sleep(0.01)
+
+
+@pytest.mark.parametrize("coalescing", [False, True])
+def test_disconnect_mid_stream_releases_buffers(mock_upstreams, make_deep_genimi, coalescing):
+    server = mock_upstreams("--reasoning-tokens", "2000", "--token-rate", "500", "--deepseek-ttft", "0")
+
+    async def scenario():
+        pool = HttpPool()
+        await pool.start()
+        try:
+            service = make_deep_genimi(server, pool, single_flight=SingleFlight() if coalescing else None)
+            streams = [
+                service.chat_completions_with_stream([{"role": "user", "content": f"question {i % 2}"}], MODEL_ARG)
+                for i in range(5)
+            ]
+            received = await asyncio.gather(*(disconnect_after(stream, 3) for stream in streams))
+            assert received == [3] * 5
+            await settle()
+            assert service.stream_stats() == []
+        finally:
+            await pool.close()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("kind", ["reasoning", "answer"])
+def test_no_task_or_connection_outlives_disconnected_request(mock_upstreams, make_deep_genimi, kind):
+    server = mock_upstreams("--reasoning-tokens", "200", "--token-rate", "1000", "--deepseek-ttft", "0",
+                            "--answer-tokens", "2000", "--gemini-token-rate", "500", "--gemini-ttft", "0")
+
+    async def scenario():
+        pool = HttpPool()
+        await pool.start()
+        try:
+            service = make_deep_genimi(server, pool)
+            admission = AdmissionController(deepseek_concurrency=4, gemini_concurrency=4, max_queue=4)
+            permit = await admission.admit()
+            stream = service.chat_completions_with_stream([{"role": "user", "content": "question"}], MODEL_ARG,
+                                                          permit=permit)
+            try:
+                assert await disconnect_after(stream, 5, kind) == 5
+            finally:
+                # 与 main.py 中响应关闭时的回调一致
+                permit.release_unclaimed()
+
+            await settle()
+            assert pool.session.connector._acquired == set()
+            stats = admission.stats()
+            assert stats["deepseek"]["in_flight"] == 0
+            assert stats["gemini"]["in_flight"] == 0
+            assert service.stream_stats() == []
+        finally:
+            await pool.close()
+
+    asyncio.run(scenario())
+    # 断开发生在推理阶段时不会再调用 Gemini
+    assert server.counts["gemini"] == (0 if kind == "reasoning" else 1)
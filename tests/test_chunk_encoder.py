@@ -0,0 +1,42 @@
+"""SSE 帧编码：预计算前后缀的输出与逐帧 json.dumps 逐字节一致"""
+import json
+
+import pytest
+
+from app.deepgenimi.chunk_encoder import ChunkEncoder
+
+TEXTS = ["plain", "", "推理内容", 'quote " and \\ backslash', "line\nbreak\ttab", "emoji 🙂", "\x00\x1f control"]
+
+
+def reference_frame(chat_id: str, created: int, model: str, delta: dict) -> bytes:
+    response = {
+        "id": chat_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "delta": {"role": "assistant", **delta}}],
+    }
+    return f"data: {json.dumps(response)}\n\n".encode("utf-8")
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_frames_match_json_dumps_byte_for_byte(text):
+    encoder = ChunkEncoder("chatcmpl-18f", 1700000000, "deepseek-reasoner", "gemini-pro")
+    assert encoder.reasoning(text) == reference_frame(
+        "chatcmpl-18f", 1700000000, "deepseek-reasoner", {"reasoning_content": text, "content": ""})
+    assert encoder.answer(text) == reference_frame(
+        "chatcmpl-18f", 1700000000, "gemini-pro", {"content": text})
+
+
+def test_model_names_and_id_are_escaped():
+    encoder = ChunkEncoder('id"1', 1, 'model "a"', "模型")
+    assert encoder.reasoning("x") == reference_frame('id"1', 1, 'model "a"', {"reasoning_content": "x", "content": ""})
+    assert encoder.answer("x") == reference_frame('id"1', 1, "模型", {"content": "x"})
+
+
+def test_encode_dispatches_on_content_type():
+    encoder = ChunkEncoder("chatcmpl-1", 1, "r", "a")
+    assert encoder.encode("reasoning", "t") == encoder.reasoning("t")
+    assert encoder.encode("answer", "t") == encoder.answer("t")
+    assert json.loads(encoder.encode("answer", "t")[len(b"data: "):])["choices"][0]["delta"] == \
+        {"role": "assistant", "content": "t"}
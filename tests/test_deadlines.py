@@ -0,0 +1,136 @@
+"""请求截止时间与分阶段超时：超时后降级而不是失败"""
+import asyncio
+import time
+
+import pytest
+
+from app.clients import HttpPool, StageBudget, StageTimeouts, UpstreamTimeout
+from app.clients.base_client import wait_upstream
+from app.deepgenimi import Deadline
+from app.utils import metrics
+
+MODEL_ARG = (0.7, 0.95, 0.0, 0.0)
+MESSAGES = [{"role": "user", "content": "question"}]
+
+
+def test_deadline_splits_budget_between_stages():
+    deadline = Deadline(10, reasoning_share=0.6)
+    assert deadline.reasoning_at == pytest.approx(deadline.start + 6)
+    assert deadline.at == pytest.approx(deadline.start + 10)
+    assert 9.9 < deadline.remaining() <= 10
+    unlimited = Deadline()
+    assert unlimited.at is None and unlimited.reasoning_at is None and unlimited.remaining() is None
+
+
+def test_new_deadline_clamps_to_maximum(make_deep_genimi, mock_upstreams):
+    service = make_deep_genimi(mock_upstreams(), request_timeout=60, max_request_timeout=120)
+    assert service.new_deadline().timeout == 60
+    assert service.new_deadline(30).timeout == 30
+    assert service.new_deadline(600).timeout == 120
+    assert service.new_deadline(0).timeout == 120  # 客户端要求不限制时仍受上限约束
+
+
+def test_stage_budget_is_capped_by_deadline():
+    now = time.monotonic()
+    budget = StageBudget(StageTimeouts(first_byte=5, idle=5), deadline=now + 1)
+    assert budget.first_byte_at(now) == (now + 1, "deadline")
+    budget = StageBudget(StageTimeouts(first_byte=0.5), deadline=now + 1)
+    assert budget.first_byte_at(now) == (now + 0.5, "first_byte")
+    assert StageBudget(StageTimeouts()).idle_at() == (None, "idle")
+
+
+def test_wait_upstream_reports_phase_but_passes_through_upstream_timeouts():
+    async def scenario():
+        with pytest.raises(UpstreamTimeout) as timed_out:
+            await wait_upstream(asyncio.sleep(1), time.monotonic() + 0.01, "idle")
+        assert timed_out.value.phase == "idle"
+
+        async def own_timeout():
+            raise TimeoutError("connect")
+
+        # 上游操作自身的超时不归为分阶段超时，由调用方分类
+        with pytest.raises(TimeoutError) as raised:
+            await wait_upstream(own_timeout(), time.monotonic() + 5, "first_byte")
+        assert not isinstance(raised.value, UpstreamTimeout)
+        assert await wait_upstream(asyncio.sleep(0, "ok"), None, "idle") == "ok"
+
+    asyncio.run(scenario())
+
+
+def run_request(service, pool: HttpPool, deadline=None) -> tuple[dict, float]:
+    async def scenario():
+        await pool.start()
+        try:
+            start = time.monotonic()
+            result = await service.chat_completions_without_stream(
+                MESSAGES, MODEL_ARG, deadline=deadline or service.new_deadline())
+            return result, time.monotonic() - start
+        finally:
+            await pool.close()
+
+    return asyncio.run(scenario())
+
+
+def message_of(result: dict) -> dict:
+    return result["choices"][0]["message"]
+
+
+def test_first_byte_timeout_degrades_straight_to_gemini(mock_upstreams, make_deep_genimi):
+    server = mock_upstreams("--deepseek-ttft", "2", "--answer-tokens", "5", "--gemini-token-rate", "0",
+                            "--gemini-ttft", "0")
+    pool = HttpPool()
+    service = make_deep_genimi(server, pool, deepseek_timeouts=StageTimeouts(first_byte=0.2))
+    degraded = metrics.REASONING_DEGRADED.labels("first_byte")
+    before = degraded.value
+
+    result, elapsed = run_request(service, pool)
+    assert message_of(result)["reasoning_content"] == ""
+    assert message_of(result)["content"].startswith("回答0")
+    assert elapsed < 1.5
+    assert degraded.value == before + 1
+    assert server.counts["gemini"] == 1
+
+
+def test_reasoning_deadline_hands_off_partial_reasoning(mock_upstreams, make_deep_genimi):
+    server = mock_upstreams("--deepseek-ttft", "0", "--reasoning-tokens", "1000", "--token-rate", "50",
+                            "--answer-tokens", "5", "--gemini-token-rate", "0", "--gemini-ttft", "0")
+    pool = HttpPool()
+    service = make_deep_genimi(server, pool, reasoning_deadline_share=0.5)
+    degraded = metrics.REASONING_DEGRADED.labels("deadline")
+    before = degraded.value
+
+    result, elapsed = run_request(service, pool, Deadline(1.0, reasoning_share=0.5))
+    reasoning = message_of(result)["reasoning_content"]
+    assert reasoning.startswith("推理0")
+    assert len(reasoning.split()) < 100  # 推理在截止时间处被截断
+    assert message_of(result)["content"].startswith("回答0")
+    assert elapsed < 1.0
+    assert degraded.value == before + 1
+
+
+def test_gemini_idle_timeout_keeps_partial_answer(mock_upstreams, make_deep_genimi):
+    server = mock_upstreams("--deepseek-ttft", "0", "--reasoning-tokens", "3", "--deepseek-answer-tokens", "1",
+                            "--token-rate", "0", "--answer-tokens", "100", "--gemini-token-rate", "2",
+                            "--gemini-ttft", "0")
+    pool = HttpPool()
+    service = make_deep_genimi(server, pool, gemini_timeouts=StageTimeouts(idle=0.2))
+
+    result, elapsed = run_request(service, pool)
+    answer = message_of(result)["content"]
+    assert answer.startswith("回答0")
+    assert "回答99" not in answer
+    assert elapsed < 1.5
+
+
+def test_request_deadline_ends_gemini_stage(mock_upstreams, make_deep_genimi):
+    server = mock_upstreams("--deepseek-ttft", "0", "--reasoning-tokens", "3", "--deepseek-answer-tokens", "1",
+                            "--token-rate", "0", "--answer-tokens", "1000", "--gemini-token-rate", "100",
+                            "--gemini-ttft", "0")
+    pool = HttpPool()
+    service = make_deep_genimi(server, pool)
+
+    result, elapsed = run_request(service, pool, Deadline(0.8))
+    answer = message_of(result)["content"]
+    assert answer.startswith("回答0")
+    assert "回答999" not in answer
+    assert elapsed < 1.3
@@ -0,0 +1,108 @@
+"""多端点路由：按延迟选择、失败摘除与首 token 前的故障转移"""
+import asyncio
+
+import pytest
+
+from app.clients import DeepSeekClient, Endpoint, EndpointPool, UpstreamError
+from app.clients import endpoint_pool
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(endpoint_pool, "time", clock)
+    return clock
+
+
+def make_pool(*names: str, **kwargs) -> EndpointPool:
+    return EndpointPool([Endpoint(f"http://{name}/v1/chat/completions", "sk", name=name) for name in names], **kwargs)
+
+
+def test_prefers_unsampled_then_fastest_endpoint(clock):
+    pool = make_pool("a", "b")
+    a, b = pool.endpoints
+    pool.record_success(a, 0.5)
+    assert pool.pick() is b  # 没有样本的端点优先
+    pool.record_success(b, 0.1)
+    assert pool.pick() is b
+    b.in_flight = 9  # 进行中的请求按倍数拉高得分
+    assert pool.pick() is a
+    assert pool.pick(exclude=(a,)) is b
+    assert pool.pick(exclude=(a, b)) is None
+
+
+def test_consecutive_failures_eject_until_cooldown(clock):
+    pool = make_pool("a", "b", max_failures=2, eject_error_rate=1.1, cooldown=30)
+    a, b = pool.endpoints
+    pool.record_success(a, 0.1)
+    pool.record_success(b, 0.5)
+    pool.record_failure(a)
+    assert pool.pick() is a
+    pool.record_failure(a)
+    assert a.ejections == 1
+    assert pool.pick() is b
+    clock.now += 31
+    assert pool.pick() is a
+
+
+def test_all_ejected_picks_the_earliest_to_recover(clock):
+    pool = make_pool("a", "b", max_failures=1, cooldown=30)
+    a, b = pool.endpoints
+    pool.record_failure(b)
+    clock.now += 5
+    pool.record_failure(a)
+    assert pool.pick() is b
+
+
+def test_abandoned_request_only_raises_the_latency_estimate(clock):
+    pool = make_pool("a")
+    (a,) = pool.endpoints
+    pool.record_success(a, 1.0)
+    pool.record_abandoned(a, 0.2)
+    assert a.ewma_ttft == 1.0
+    pool.record_abandoned(a, 2.0)
+    assert a.ewma_ttft > 1.0
+    assert a.failures == 0
+
+
+def test_fails_over_to_a_healthy_endpoint_before_first_token(mock_upstreams):
+    broken = mock_upstreams("--deepseek-error-rate", "1", "--deepseek-ttft", "0")
+    healthy = mock_upstreams("--reasoning-tokens", "5", "--deepseek-answer-tokens", "2", "--token-rate", "0",
+                             "--deepseek-ttft", "0")
+    pool = EndpointPool([Endpoint(broken.deepseek_url, "sk", name="broken"),
+                         Endpoint(healthy.deepseek_url, "sk", name="healthy")])
+    # 未传入连接池，每次请求使用临时会话
+    client = DeepSeekClient("sk", endpoint_pool=pool, max_attempts=2)
+
+    async def collect():
+        return [item async for item in client.stream_chat([{"role": "user", "content": "question"}])]
+
+    items = asyncio.run(collect())
+    assert [kind for kind, _ in items] == ["reasoning"] * 5 + ["content"] * 2
+    broken_endpoint, healthy_endpoint = pool.endpoints
+    assert broken_endpoint.failures == 1
+    assert healthy_endpoint.failures == 0
+    assert healthy_endpoint.ewma_ttft is not None
+    assert broken.counts["deepseek"] == 1 and healthy.counts["deepseek"] == 1
+
+
+def test_raises_when_every_endpoint_fails(mock_upstreams):
+    broken = mock_upstreams("--deepseek-error-rate", "1", "--deepseek-ttft", "0")
+    pool = EndpointPool([Endpoint(broken.deepseek_url, "sk", name="a"), Endpoint(broken.deepseek_url, "sk", name="b")])
+    client = DeepSeekClient("sk", endpoint_pool=pool, max_attempts=3)
+
+    async def collect():
+        return [item async for item in client.stream_chat([{"role": "user", "content": "question"}])]
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(collect())
+    assert broken.counts["deepseek"] == 2
+    assert all(endpoint.in_flight == 0 for endpoint in pool.endpoints)
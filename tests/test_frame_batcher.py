@@ -0,0 +1,78 @@
+"""输出帧合并：积压合并、类型切换、字节阈值与计时到期时输出"""
+import asyncio
+
+from app.deepgenimi.frame_batcher import FrameBatcher, drain
+from app.deepgenimi.stream_buffer import StreamBuffer
+
+
+def fill(buffer: StreamBuffer, *items) -> None:
+    for item in items:
+        buffer.put_nowait(item, len(item[1]) if item else 0)
+
+
+def drain_all(batcher: FrameBatcher, buffer: StreamBuffer, producers: int = 1) -> list:
+    async def scenario():
+        return [frame async for frame in batcher.drain(buffer, producers)]
+
+    return asyncio.run(scenario())
+
+
+def test_backlog_is_merged_and_split_on_type_change():
+    buffer = StreamBuffer("chat")
+    fill(buffer, ("reasoning", "a"), ("reasoning", "b"), ("answer", "c"), ("answer", "d"), None)
+    batcher = FrameBatcher(max_bytes=4096, max_delay=0)
+
+    assert drain_all(batcher, buffer) == [("reasoning", "ab"), ("answer", "cd")]
+    assert batcher.stats()["events_in"] == 4
+    assert batcher.stats()["frames_out"] == 2
+    assert batcher.stats()["events_per_frame"] == 2.0
+
+
+def test_frame_is_flushed_once_max_bytes_is_reached():
+    buffer = StreamBuffer("chat")
+    fill(buffer, *[("answer", "xxxx")] * 5, None)
+    batcher = FrameBatcher(max_bytes=10, max_delay=1)
+
+    assert drain_all(batcher, buffer) == [("answer", "x" * 12), ("answer", "x" * 8)]
+    assert batcher.stats()["bytes_out"] == 20
+
+
+def test_frame_is_flushed_when_max_delay_expires():
+    buffer = StreamBuffer("chat")
+    batcher = FrameBatcher(max_bytes=4096, max_delay=0.02)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        frames = []
+
+        async def produce():
+            fill(buffer, ("answer", "a"))
+            await asyncio.sleep(0.005)
+            fill(buffer, ("answer", "b"))
+            await asyncio.sleep(0.2)
+            fill(buffer, ("answer", "c"), None)
+
+        producer = asyncio.create_task(produce())
+        start = loop.time()
+        async for frame in batcher.drain(buffer, 1):
+            frames.append((frame, loop.time() - start))
+        await producer
+        return frames
+
+    frames = asyncio.run(scenario())
+    # 计时内到达的 b 与 a 合并；计时到期后立即输出，不等到 c
+    assert [frame for frame, _ in frames] == [("answer", "ab"), ("answer", "c")]
+    assert frames[0][1] < 0.15
+
+
+def test_waits_for_every_producer():
+    buffer = StreamBuffer("chat")
+    fill(buffer, ("reasoning", "a"), None, ("answer", "b"), None)
+
+    async def scenario():
+        return [item async for item in drain(buffer, 2)]
+
+    assert asyncio.run(scenario()) == [("reasoning", "a"), ("answer", "b")]
+    buffer = StreamBuffer("chat")
+    fill(buffer, ("reasoning", "a"), None, ("answer", "b"), None)
+    assert drain_all(FrameBatcher(max_delay=0), buffer, producers=2) == [("reasoning", "a"), ("answer", "b")]
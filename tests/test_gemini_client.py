@@ -0,0 +1,109 @@
+"""Gemini 客户端：异步 SSE 流、SDK 异步接口与生成参数"""
+import asyncio
+from types import SimpleNamespace
+
+from app.clients import GeminiClient
+from app.utils import metrics
+
+MESSAGES = [{"role": "user", "content": "question"}, {"role": "assistant", "content": "reasoning"}]
+
+
+def collect(client: GeminiClient, **kwargs) -> list:
+    async def scenario():
+        return [item async for item in client.stream_chat(MESSAGES, **kwargs)]
+
+    return asyncio.run(scenario())
+
+
+def test_http_stream_yields_answer_chunks_from_fragmented_sse(mock_upstreams):
+    # 每次只写出 7 字节，\r\n\r\n 分隔的事件被拆到多个分块中
+    server = mock_upstreams("--answer-tokens", "5", "--gemini-token-rate", "0", "--gemini-ttft", "0", "--fragment", "7")
+    client = GeminiClient("test-key", server.gemini_url)
+
+    assert collect(client) == [("answer", f"回答{i} ") for i in range(5)]
+    assert server.counts["gemini"] == 1
+
+
+def test_http_stream_does_not_block_the_event_loop(mock_upstreams):
+    server = mock_upstreams("--answer-tokens", "10", "--gemini-token-rate", "50", "--gemini-ttft", "0.1")
+    client = GeminiClient("test-key", server.gemini_url)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        try:
+            items = [item async for item in client.stream_chat(MESSAGES)]
+        finally:
+            task.cancel()
+        return items, ticks
+
+    items, ticks = asyncio.run(scenario())
+    assert len(items) == 10
+    # 约 0.3 秒的流式输出期间事件循环持续运行其他任务
+    assert ticks >= 10
+
+
+def test_upstream_error_ends_the_stream_and_is_counted(mock_upstreams):
+    server = mock_upstreams("--gemini-error-rate", "1", "--gemini-ttft", "0")
+    client = GeminiClient("test-key", server.gemini_url)
+    errors = metrics.UPSTREAM_ERRORS.labels("gemini", "http_503")
+    before = errors.value
+
+    assert collect(client) == []
+    assert errors.value == before + 1
+
+
+def test_model_and_generation_config_come_from_the_request():
+    client = GeminiClient("test-key", "http://gemini/v1beta/models/gemini-pro:streamGenerateContent",
+                          max_output_tokens=512, model_cache_size=2)
+    assert client.model_name == "gemini-pro"
+
+    config = client._generation_config((0.3, 0.8, 0.0, 0.5))
+    # 未设置的惩罚项不下发
+    assert dict(config) == {"maxOutputTokens": 512, "temperature": 0.3, "topP": 0.8, "frequencyPenalty": 0.5}
+    url, body_config = client._model_handle("gemini-1.5-flash", config)
+    assert url == "http://gemini/v1beta/models/gemini-1.5-flash:streamGenerateContent?alt=sse"
+    assert body_config == dict(config)
+
+    assert client._model_handle("gemini-1.5-flash", config) is client._model_handle("gemini-1.5-flash", config)
+    client._model_handle("a", config)
+    client._model_handle("b", config)
+    assert len(client._model_cache) == 2
+
+
+class FakeModel:
+    """模拟 GenerativeModel：generate_content_async 返回异步迭代的分块"""
+
+    def __init__(self, texts: list[str]):
+        self.texts = texts
+        self.prompts = []
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        assert stream
+        self.prompts.append(prompt)
+
+        async def chunks():
+            for text in self.texts:
+                await asyncio.sleep(0)
+                part = SimpleNamespace(text=text)
+                yield SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+        return chunks()
+
+
+def test_sdk_backend_streams_through_the_async_interface():
+    client = GeminiClient("test-key", "http://gemini/v1beta/models/gemini-pro:streamGenerateContent")
+    model = FakeModel(["a", "", "b"])
+
+    async def scenario():
+        return [text async for text in client._stream_sdk(model, "user: question")]
+
+    assert asyncio.run(scenario()) == ["a", "b"]
+    assert model.prompts == ["user: question"]
@@ -0,0 +1,84 @@
+"""DeepSeek 请求对冲：对冲延迟、预算与先到首 token 的一方胜出"""
+import asyncio
+
+from app.clients import DeepSeekClient, Endpoint, EndpointPool, HedgePolicy
+
+MESSAGES = [{"role": "user", "content": "question"}]
+
+
+def test_delay_uses_percentile_once_enough_samples():
+    policy = HedgePolicy(delay=2.0, percentile=90, min_delay=0.2, min_samples=10)
+    for _ in range(9):
+        policy.record(0.5)
+    assert policy.delay() == 2.0
+    policy.record(1.0)
+    assert policy.delay() == 0.5
+    policy = HedgePolicy(delay=2.0, percentile=50, min_delay=0.2, min_samples=1)
+    policy.record(0.01)
+    assert policy.delay() == 0.2
+
+
+def test_budget_limits_hedges_to_a_share_of_requests():
+    policy = HedgePolicy(budget=0.1, burst=1)
+    policy.requests = 10
+    assert policy.try_fire()
+    assert policy.try_fire()
+    assert not policy.try_fire()
+    assert policy.budget_denied == 1
+    policy.requests = 20
+    assert policy.try_fire()
+
+
+def test_hedge_wins_when_primary_is_slow(mock_upstreams):
+    slow = mock_upstreams("--deepseek-ttft", "2", "--reasoning-tokens", "3", "--token-rate", "0")
+    fast = mock_upstreams("--deepseek-ttft", "0", "--reasoning-tokens", "3", "--deepseek-answer-tokens", "1",
+                          "--token-rate", "0")
+    pool = EndpointPool([Endpoint(slow.deepseek_url, "sk", name="slow"), Endpoint(fast.deepseek_url, "sk", name="fast")])
+    policy = HedgePolicy(delay=0.1, budget=0, burst=1)
+    client = DeepSeekClient("sk", endpoint_pool=pool, hedge=policy)
+
+    async def collect():
+        async with asyncio.timeout(3):
+            return [item async for item in client.stream_chat(MESSAGES)]
+
+    items = asyncio.run(collect())
+    assert [kind for kind, _ in items] == ["reasoning"] * 3 + ["content"]
+    assert policy.stats()["fired"] == 1
+    assert policy.stats()["wins"] == 1
+    slow_endpoint, fast_endpoint = pool.endpoints
+    # 落败的主请求不计为失败，已等待的时间计入其延迟估计
+    assert slow_endpoint.failures == 0
+    assert slow_endpoint.ewma_ttft >= 0.1
+    assert slow_endpoint.in_flight == 0 and fast_endpoint.in_flight == 0
+
+
+def test_no_hedge_when_primary_answers_in_time(mock_upstreams):
+    fast = mock_upstreams("--deepseek-ttft", "0", "--reasoning-tokens", "3", "--deepseek-answer-tokens", "1",
+                          "--token-rate", "0")
+    pool = EndpointPool([Endpoint(fast.deepseek_url, "sk", name="fast")])
+    policy = HedgePolicy(delay=1.0)
+    client = DeepSeekClient("sk", endpoint_pool=pool, hedge=policy)
+
+    async def collect():
+        return [item async for item in client.stream_chat(MESSAGES)]
+
+    assert len(asyncio.run(collect())) == 4
+    assert policy.stats()["fired"] == 0
+    assert policy.stats()["requests"] == 1
+    assert fast.counts["deepseek"] == 1
+
+
+def test_budget_exhausted_waits_for_primary(mock_upstreams):
+    slowish = mock_upstreams("--deepseek-ttft", "0.3", "--reasoning-tokens", "2", "--deepseek-answer-tokens", "1",
+                             "--token-rate", "0")
+    pool = EndpointPool([Endpoint(slowish.deepseek_url, "sk", name="a")])
+    policy = HedgePolicy(delay=0.05, budget=0, burst=0)
+    client = DeepSeekClient("sk", endpoint_pool=pool, hedge=policy)
+
+    async def collect():
+        return [item async for item in client.stream_chat(MESSAGES)]
+
+    assert len(asyncio.run(collect())) == 3
+    assert policy.stats()["fired"] == 0
+    assert policy.stats()["budget_denied"] == 1
+    assert slowish.counts["deepseek"] == 1
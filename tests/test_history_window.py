@@ -0,0 +1,82 @@
+"""历史窗口：固定保留 system 与第一条 user、去掉历史推理内容、按预算与预留量裁剪"""
+from app.clients import GeminiClient
+from app.deepgenimi import HistoryWindow
+
+# 每条消息 40 个 ASCII 字符，估算为 10 token，加上格式开销共 14
+TEXT = "x" * 40
+COST = 14
+
+
+def conversation(turns: int) -> list[dict]:
+    messages = [{"role": "system", "content": "system prompt " + TEXT},
+                {"role": "user", "content": "first question " + TEXT}]
+    for turn in range(turns):
+        messages.append({"role": "assistant", "content": f"a{turn:02d}" + TEXT[3:], "reasoning_content": "thinking"})
+        messages.append({"role": "user", "content": f"u{turn:02d}" + TEXT[3:]})
+    return messages
+
+
+def test_budget_for_prefers_exact_then_longest_prefix():
+    window = HistoryWindow({"gemini": 100, "gemini-1.5": 200, "gemini-1.5-pro": 300}, default_budget=50)
+    assert window.budget_for("gemini-1.5-pro") == 300
+    assert window.budget_for("gemini-1.5-flash") == 200
+    assert window.budget_for("gemini-pro") == 100
+    assert window.budget_for("deepseek-reasoner") == 50
+
+
+def test_unlimited_budget_keeps_everything_but_strips_reasoning():
+    messages = conversation(3)
+    window = HistoryWindow()
+    result = window.window(messages, "any-model")
+
+    assert [message["content"] for message in result] == [message["content"] for message in messages]
+    assert not any("reasoning_content" in message for message in result)
+    # 传入的消息不被修改
+    assert messages[2]["reasoning_content"] == "thinking"
+    assert window.stats()["stripped_reasoning"] == 3
+    assert window.stats()["trimmed"] == 0
+
+
+def test_pins_system_and_first_user_and_keeps_the_newest_messages():
+    messages = conversation(20)
+    window = HistoryWindow({"m": 20 * COST}, stride=1)
+    pinned_cost = window.count(messages[0]) + window.count(messages[1])
+    result = window.window(messages, "m")
+
+    assert result[:2] == messages[:2]
+    assert result[-1] == messages[-1]
+    # 固定部分以 user 结尾，窗口从 assistant 开始
+    assert result[2]["role"] == "assistant"
+    assert sum(window.count(message) for message in result) <= 20 * COST
+    assert sum(window.count(message) for message in result[2:]) > 20 * COST - pinned_cost - 2 * COST
+    assert window.stats()["trimmed"] == 1
+    assert window.stats()["dropped_messages"] == len(messages) - len(result)
+
+
+def test_reserve_shrinks_the_window_but_never_drops_the_newest_message():
+    messages = conversation(20)
+    window = HistoryWindow({"m": 20 * COST}, stride=1)
+    full = window.window(messages, "m")
+    reserved = window.window(messages, "m", reserve=6 * COST)
+    assert len(reserved) == len(full) - 6
+    assert sum(window.count(message) for message in reserved) + 6 * COST <= 20 * COST
+
+    # 预留量超过预算时只剩固定部分与最新一条消息
+    assert window.window(messages, "m", reserve=100 * COST) == messages[:2] + [messages[-1]]
+
+
+def test_window_start_is_aligned_so_consecutive_turns_share_a_prefix():
+    window = HistoryWindow({"m": 30 * COST}, stride=8)
+    starts = []
+    for turns in range(20, 40):
+        result = window.window(conversation(turns), "m")
+        starts.append(result[2]["content"])
+    # 起点只在越过对齐点时前移，大多数相邻轮次的窗口起点相同
+    changes = sum(1 for previous, current in zip(starts, starts[1:]) if previous != current)
+    assert 0 < changes <= len(starts) // 3
+
+
+def test_gemini_prompt_flattens_messages_in_order():
+    client = GeminiClient("test-key")
+    messages = [{"role": "user", "content": "q"}, {"role": "assistant", "content": "r"}]
+    assert client._format_messages(messages) == "user: q\nassistant: r"
@@ -0,0 +1,62 @@
+"""日志：后台线程写出与 token 级调试日志的请求采样"""
+import io
+import json
+import logging
+import queue
+
+from app.utils import logger as logger_module
+from app.utils.logger import _LazyQueueHandler, sample_token_trace, setup_logger
+
+
+def test_queued_record_is_evaluated_before_enqueueing():
+    handler = _LazyQueueHandler(queue.SimpleQueue())
+    items = ["a"]
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError as e:
+        record = logging.LogRecord("test", logging.ERROR, __file__, 1, "items: %s", (items,), (type(e), e, e.__traceback__))
+
+    prepared = handler.prepare(record)
+    items.append("b")
+    assert prepared.getMessage() == "items: ['a']"
+    assert prepared.args is None
+    # 队列中的记录不再引用 traceback 及其栈帧
+    assert prepared.exc_info is None
+    assert "RuntimeError: boom" in prepared.exc_text
+    assert record.args == (items,)
+
+
+def test_async_output_writes_from_the_listener_thread():
+    stream = io.StringIO()
+    log = setup_logger("test-async-json", stream=stream, log_format="json", async_output=True)
+    listener = logger_module._listeners.pop()
+    items = ["a"]
+    try:
+        log.info("items: %s", items)
+        items.append("b")
+        try:
+            raise ValueError("bad value")
+        except ValueError:
+            log.error("failed", exc_info=True)
+    finally:
+        listener.stop()
+
+    first, second = (json.loads(line) for line in stream.getvalue().splitlines())
+    assert first["message"] == "items: ['a']"
+    assert second["message"] == "failed"
+    assert "ValueError: bad value" in second["exc_info"]
+
+
+def test_token_trace_is_sampled_only_at_debug_level(monkeypatch):
+    log = logger_module.logger
+    level = log.level
+    try:
+        monkeypatch.setattr(logger_module, "TOKEN_SAMPLE_RATE", 1.0)
+        log.setLevel(logging.INFO)
+        assert not sample_token_trace()
+        log.setLevel(logging.DEBUG)
+        assert sample_token_trace()
+        monkeypatch.setattr(logger_module, "TOKEN_SAMPLE_RATE", 0.0)
+        assert not sample_token_trace()
+    finally:
+        log.setLevel(level)
@@ -0,0 +1,84 @@
+"""进程内指标：计数器、仪表、直方图的记录与 Prometheus 文本导出"""
+import pytest
+
+from app.clients import UpstreamError, UpstreamTimeout
+from app.utils.metrics import MetricsRegistry, error_type
+
+
+def test_counter_and_labelled_children_render():
+    registry = MetricsRegistry()
+    plain = registry.counter("requests", "请求数")
+    errors = registry.counter("errors", "错误数", ("stage", "type"))
+    plain.inc()
+    plain.inc(2)
+    errors.labels("gemini", "http_503").inc()
+    errors.labels("deepseek", 'quote"d').inc(3)
+
+    text = registry.render()
+    assert "# HELP requests 请求数\n# TYPE requests counter\nrequests_total 3\n" in text
+    assert 'errors_total{stage="gemini",type="http_503"} 1' in text
+    assert 'errors_total{stage="deepseek",type="quote\\"d"} 3' in text
+    assert errors.labels("gemini", "http_503") is errors.labels("gemini", "http_503")
+    with pytest.raises(ValueError):
+        errors.labels("gemini")
+
+
+def test_gauge_callback_is_read_at_scrape_time():
+    registry = MetricsRegistry()
+    value = {"n": 1}
+    registry.gauge("queued", "排队数", callback=lambda: value["n"])
+    gauge = registry.gauge("active", "进行中", ("mode",))
+    gauge.labels("stream").inc()
+    gauge.labels("stream").inc()
+    gauge.labels("stream").dec()
+
+    value["n"] = 7
+    text = registry.render()
+    assert "queued 7\n" in text
+    assert 'active{mode="stream"} 1\n' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("ttft_seconds", "首 token 延迟", (0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+
+    lines = registry.render().splitlines()
+    assert 'ttft_seconds_bucket{le="0.1"} 2' in lines
+    assert 'ttft_seconds_bucket{le="1.0"} 3' in lines
+    assert 'ttft_seconds_bucket{le="+Inf"} 4' in lines
+    assert "ttft_seconds_sum 3.65" in lines
+    assert "ttft_seconds_count 4" in lines
+
+
+def test_render_merges_snapshots_from_other_workers():
+    registry = MetricsRegistry()
+    counter = registry.counter("requests", "请求数", ("mode",))
+    histogram = registry.histogram("duration_seconds", "耗时", (1.0,))
+    counter.labels("stream").inc(2)
+    histogram.observe(0.5)
+
+    other = MetricsRegistry()
+    other_counter = other.counter("requests", "请求数", ("mode",))
+    other_counter.labels("stream").inc(3)
+    other_counter.labels("non_stream").inc(1)
+    other.histogram("duration_seconds", "耗时", (1.0,)).observe(2.0)
+
+    lines = registry.render([other.snapshot()]).splitlines()
+    assert 'requests_total{mode="stream"} 5' in lines
+    assert 'requests_total{mode="non_stream"} 1' in lines
+    assert 'duration_seconds_bucket{le="1.0"} 1' in lines
+    assert 'duration_seconds_bucket{le="+Inf"} 2' in lines
+    assert "duration_seconds_count 2" in lines
+    # 合并只影响导出，本进程的值不变
+    assert counter.labels("stream").value == 2
+
+
+def test_error_type_labels():
+    assert error_type(UpstreamTimeout("idle")) == "timeout_idle"
+    assert error_type(UpstreamError("bad", 429)) == "http_429"
+    try:
+        raise UpstreamError("wrapped") from ConnectionResetError()
+    except UpstreamError as e:
+        assert error_type(e) == "ConnectionResetError"
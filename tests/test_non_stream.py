@@ -0,0 +1,43 @@
+"""非流式模式：汇总推理与回答，返回一个 chat.completion"""
+import asyncio
+import json
+
+from app.clients import HttpPool
+
+MODEL_ARG = (0.7, 0.95, 0.0, 0.0)
+MESSAGES = [{"role": "user", "content": "question"}]
+
+
+def test_returns_one_chat_completion_with_reasoning_and_usage(mock_upstreams, make_deep_genimi):
+    server = mock_upstreams("--deepseek-ttft", "0", "--reasoning-tokens", "3", "--deepseek-answer-tokens", "1",
+                            "--token-rate", "0", "--answer-tokens", "4", "--gemini-token-rate", "0", "--gemini-ttft", "0")
+    pool = HttpPool()
+    service = make_deep_genimi(server, pool)
+
+    async def scenario():
+        await pool.start()
+        try:
+            return await service.chat_completions_without_stream(
+                MESSAGES, MODEL_ARG, deepseek_model="deepseek-reasoner", gemini_model="gemini-pro")
+        finally:
+            await pool.close()
+
+    result = asyncio.run(scenario())
+    # 响应体可直接序列化为 JSON
+    assert json.loads(json.dumps(result)) == result
+    assert result["id"].startswith("chatcmpl-")
+    assert result["object"] == "chat.completion"
+    assert result["model"] == "gemini-pro"
+    (choice,) = result["choices"]
+    assert choice["finish_reason"] == "stop"
+    assert choice["message"] == {
+        "role": "assistant",
+        "reasoning_content": "推理0 推理1 推理2 ",
+        "content": "回答0 回答1 回答2 回答3 ",
+    }
+    usage = result["usage"]
+    assert usage["prompt_tokens"] > 0
+    assert 0 < usage["completion_tokens_details"]["reasoning_tokens"] < usage["completion_tokens"]
+    assert usage["total_tokens"] == usage["prompt_tokens"] + usage["completion_tokens"]
+    assert server.counts["deepseek"] == 1 and server.counts["gemini"] == 1
+    assert service.stream_stats() == []
@@ -0,0 +1,105 @@
+"""推理缓存：LRU 与 TTL 淘汰、SQLite 后端与请求键"""
+import asyncio
+
+import pytest
+
+from app.deepgenimi import reasoning_cache
+from app.deepgenimi.reasoning_cache import ReasoningCache, SQLiteCacheBackend, make_request_key
+from app.utils.settings import Settings
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(reasoning_cache, "time", clock)
+    return clock
+
+
+def test_lru_evicts_least_recently_used(clock):
+    async def scenario():
+        cache = ReasoningCache(max_entries=2, ttl=60)
+        await cache.set("a", "A")
+        await cache.set("b", "B")
+        assert await cache.get("a") == "A"  # a 变为最近使用
+        await cache.set("c", "C")
+        assert await cache.get("b") is None
+        assert await cache.get("a") == "A"
+        assert await cache.get("c") == "C"
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["entries"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_entries_expire_after_ttl(clock):
+    async def scenario():
+        cache = ReasoningCache(max_entries=8, ttl=60)
+        await cache.set("a", "A")
+        clock.now += 59
+        assert await cache.get("a") == "A"
+        clock.now += 2
+        assert await cache.get("a") is None
+        assert cache.stats()["entries"] == 0
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_sqlite_backend_survives_restart_and_backfills_memory(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+
+    async def scenario():
+        first = ReasoningCache(max_entries=8, ttl=60, backend=SQLiteCacheBackend(path))
+        await first.set("a", "推理 A")
+        first.close()
+
+        second = ReasoningCache(max_entries=8, ttl=60, backend=SQLiteCacheBackend(path))
+        try:
+            assert await second.get("a") == "推理 A"
+            assert second.stats()["backend_hits"] == 1
+            # 回填到内存后不再查询后端
+            assert await second.get("a") == "推理 A"
+            assert second.stats()["backend_hits"] == 1
+            assert await second.get("missing") is None
+        finally:
+            second.close()
+
+    asyncio.run(scenario())
+
+
+def test_sqlite_backend_skips_expired_and_prunes_to_capacity(tmp_path, clock):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_entries=3, prune_interval=5)
+    try:
+        backend.set("expired", "old", clock.now - 1)
+        assert backend.get("expired") is None
+        for i in range(4):
+            backend.set(f"k{i}", f"v{i}", clock.now + 100 + i)
+        # 第 5 次写入触发清理：删除过期条目，只保留最晚过期的 3 条
+        count = backend._conn.execute("SELECT COUNT(*) FROM reasoning_cache").fetchone()[0]
+        assert count == 3
+        assert backend.get("k0") is None
+        assert backend.get("k3") == ("v3", clock.now + 103)
+    finally:
+        backend.close()
+
+
+def test_request_key_ignores_surrounding_whitespace_but_not_parameters():
+    messages = [{"role": "user", "content": "  hello \n"}]
+    key = make_request_key(messages, "deepseek-reasoner", (0.7, 0.95, 0.0, 0.0))
+    assert key == make_request_key([{"role": "user", "content": "hello"}], "deepseek-reasoner", (0.7, 0.95, 0.0, 0.0))
+    assert key != make_request_key(messages, "deepseek-reasoner", (0.5, 0.95, 0.0, 0.0))
+    assert key != make_request_key([{"role": "system", "content": "hello"}], "deepseek-reasoner", (0.7, 0.95, 0.0, 0.0))
+
+
+def test_cache_is_opt_in():
+    assert Settings().reasoning_cache_size == 0
+    assert Settings.from_env({"REASONING_CACHE_SIZE": "256"}).reasoning_cache_size == 256
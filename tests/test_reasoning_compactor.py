@@ -0,0 +1,71 @@
+"""推理压缩：预算限制、去重、保留结论与确切的省略标记"""
+import re
+
+import pytest
+
+from app.deepgenimi.reasoning_compactor import STRATEGIES, ReasoningCompactor, parse_strategies
+from app.utils.tokens import estimate_tokens
+
+
+def paragraph(i: int, words: int = 40) -> str:
+    return " ".join(f"step{i}-{j}" for j in range(words))
+
+
+def test_within_budget_is_left_untouched():
+    reasoning = "<think>short reasoning</think>"
+    result = ReasoningCompactor(budget_tokens=100).compact(reasoning)
+    assert result.text == reasoning
+    assert result.applied == []
+    assert result.ratio == 1.0
+
+
+def test_unlimited_budget_only_strips_tags_and_dedupes():
+    reasoning = "<think>A first.\n\nA first.\n\nWait, check A.\n\nLet me verify A again.\n\nSo A.</think>"
+    result = ReasoningCompactor(budget_tokens=0).compact(reasoning)
+    # 重复段落去掉，连续的验证段落只保留最后一段
+    assert result.text == "A first.\n\nLet me verify A again.\n\nSo A."
+    assert result.applied == ["strip_think", "dedupe"]
+
+
+def test_conclusion_keeps_the_last_paragraphs_and_counts_what_was_dropped():
+    paragraphs = [paragraph(i) for i in range(10)]
+    reasoning = "\n\n".join(paragraphs)
+    budget = estimate_tokens(paragraphs[0]) * 3 + 30
+    result = ReasoningCompactor(budget_tokens=budget, strategies=("conclusion",)).compact(reasoning)
+
+    note, *kept = result.text.split("\n\n")
+    assert kept == paragraphs[-len(kept):]
+    assert note == f"[... {10 - len(kept)} earlier paragraphs of reasoning omitted ...]"
+    assert result.tokens <= budget
+    assert result.applied == ["conclusion"]
+
+
+def test_head_tail_respects_the_budget_and_counts_omitted_characters():
+    reasoning = "\n".join(paragraph(i) for i in range(200))
+    budget = 300
+    result = ReasoningCompactor(budget_tokens=budget, strategies=("head_tail",)).compact(reasoning)
+
+    head, note, tail = result.text.split("\n\n")
+    assert reasoning.startswith(head) and reasoning.endswith(tail)
+    omitted = int(re.fullmatch(r"\[\.\.\. (\d+) characters of reasoning omitted \.\.\.\]", note).group(1))
+    assert omitted == len(reasoning) - len(head) - len(tail)
+    assert result.tokens <= budget
+    # 结尾（结论）占预算的大部分
+    assert len(tail) > len(head)
+
+
+def test_strategies_fall_through_until_within_budget():
+    # 最后一段本身超出预算，conclusion 无法生效，由 head_tail 截断
+    reasoning = "<think>" + paragraph(0) + "\n\n" + paragraph(0) + "\n\n" + paragraph(1, words=400) + "</think>"
+    result = ReasoningCompactor(budget_tokens=200).compact(reasoning)
+    assert result.applied == ["strip_think", "dedupe", "head_tail"]
+    assert result.tokens <= 200
+    assert result.original_tokens == estimate_tokens(reasoning)
+    assert result.text.endswith(paragraph(1, words=400)[-200:])
+
+
+def test_parse_strategies_and_unknown_names():
+    assert parse_strategies("") == STRATEGIES
+    assert parse_strategies(" dedupe , head_tail ,") == ("dedupe", "head_tail")
+    with pytest.raises(ValueError):
+        ReasoningCompactor(strategies=("dedupe", "summarize"))
@@ -0,0 +1,145 @@
+"""推理路由：跳过、截断与完整推理的判定，准入前路由，以及节省延迟的统计"""
+import asyncio
+import json
+
+import pytest
+
+from app.clients import HttpPool
+from app.deepgenimi import AdmissionController, OverloadedError, ReasoningRouter
+from app.utils import metrics
+
+MODEL_ARG = (1.0, 1.0, 0.0, 0.0)
+
+
+def ask(content) -> list[dict]:
+    return [{"role": "system", "content": "system prompt"}, {"role": "user", "content": content}]
+
+
+def test_hint_overrides_rules_and_unknown_hints_are_ignored():
+    router = ReasoningRouter(skip_pattern="^hi", cap_tokens=64)
+    assert router.route(ask("prove it"), "none").route == "skip"
+    capped = router.route(ask("hi"), "low")
+    assert (capped.route, capped.reason, capped.max_reasoning_tokens) == ("cap", "hint", 64)
+    assert router.route(ask("hi"), "HIGH").route == "full"
+    assert router.route(ask("hi"), "bogus").reason == "pattern"
+    # 关闭 honor_hint 后忽略客户端提示
+    assert ReasoningRouter(honor_hint=False).route(ask("prove it"), "none").route == "full"
+
+
+def test_full_pattern_wins_over_skip_rules_and_non_text_goes_full():
+    router = ReasoningRouter(short_prompt_tokens=20, skip_pattern="translate", full_pattern="prove")
+    assert router.route(ask("translate this")).reason == "pattern"
+    assert router.route(ask("prove that translate is total")).route == "full"
+    assert router.route(ask("short one")).reason == "length"
+    assert router.route(ask("word " * 100)).route == "full"
+    # 最后一条 user 消息不是文本时不做判断
+    multimodal = ask([{"type": "image_url", "image_url": {"url": "data:"}}])
+    assert router.route(multimodal).route == "full"
+    assert router.stats()["routes"] == {"skip": 2, "cap": 0, "full": 3}
+
+
+def test_saved_latency_uses_the_moving_average_of_full_reasoning():
+    router = ReasoningRouter(ewma_alpha=0.5)
+    assert router.record_saved("skip") == 0.0
+    router.observe_reasoning(4.0)
+    router.observe_reasoning(2.0)
+    assert router.reasoning_latency == pytest.approx(3.0)
+    assert router.record_saved("skip") == pytest.approx(3.0)
+    assert router.record_saved("cap", 1.0) == pytest.approx(2.0)
+    # 截断后实际耗时超过平均值时不记为负数
+    assert router.record_saved("cap", 5.0) == 0.0
+    assert router.stats()["saved_seconds"] == {"skip": 3.0, "cap": 2.0}
+    assert router.stats()["reasoning_latency_ewma"] == 3.0
+
+
+def test_skip_admission_takes_a_gemini_slot_only():
+    async def scenario():
+        admission = AdmissionController(deepseek_concurrency=1, gemini_concurrency=2, max_queue=0)
+        held = await admission.admit()
+        with pytest.raises(OverloadedError):
+            await admission.admit()
+
+        skipped = await admission.admit(skip_reasoning=True)
+        assert (admission.deepseek.in_flight, admission.gemini.in_flight) == (1, 1)
+        # 流水线在交接时的释放与获取对跳过推理的许可都是空操作
+        skipped.release_deepseek()
+        await skipped.acquire_gemini()
+        assert (admission.deepseek.in_flight, admission.gemini.in_flight) == (1, 1)
+        skipped.release()
+        held.release()
+        assert (admission.deepseek.in_flight, admission.gemini.in_flight) == (0, 0)
+
+        # Gemini 阶段满载且排队已满时，跳过推理的请求同样被拒绝
+        first = await admission.admit(skip_reasoning=True)
+        second = await admission.admit(skip_reasoning=True)
+        with pytest.raises(OverloadedError):
+            await admission.admit(skip_reasoning=True)
+        first.release()
+        second.release()
+        assert admission.stats()["rejected"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_skip_routed_prompt_is_admitted_while_the_deepseek_stage_is_full(mock_upstreams, app_client):
+    from app import main
+
+    server = mock_upstreams("--deepseek-ttft", "0", "--token-rate", "0", "--answer-tokens", "5",
+                            "--gemini-token-rate", "0", "--gemini-ttft", "0")
+    client = app_client(server, deepseek_max_concurrency=1, admission_max_queue=0)
+
+    async def scenario():
+        held = await main.admission.admit()
+        try:
+            skipped = await client.request("POST", "/v1/chat/completions", {
+                "messages": ask("question"), "stream": False, "reasoning_effort": "none"})
+            full = await client.request("POST", "/v1/chat/completions", {
+                "messages": ask("question"), "stream": False})
+        finally:
+            held.release()
+        return skipped, full
+
+    (status, _, body), (full_status, _, _) = asyncio.run(scenario())
+    assert status == 200
+    assert json.loads(body)["choices"][0]["message"]["content"].startswith("回答0")
+    assert full_status == 429
+    assert server.counts["deepseek"] == 0
+    assert main.admission.gemini.in_flight == 0
+
+
+def run_request(service, pool: HttpPool, reasoning_effort: str) -> dict:
+    async def scenario():
+        await pool.start()
+        try:
+            return await service.chat_completions_without_stream(ask("question"), MODEL_ARG,
+                                                                 reasoning_effort=reasoning_effort)
+        finally:
+            await pool.close()
+
+    return asyncio.run(scenario())["choices"][0]["message"]
+
+
+def test_skip_and_cap_routes_count_the_latency_saved(mock_upstreams, make_deep_genimi):
+    server = mock_upstreams("--deepseek-ttft", "0", "--reasoning-tokens", "300", "--paragraph-tokens", "0",
+                            "--token-rate", "0", "--answer-tokens", "5", "--gemini-token-rate", "0",
+                            "--gemini-ttft", "0")
+    router = ReasoningRouter(cap_tokens=20)
+    router.observe_reasoning(5.0)
+    pool = HttpPool()
+    service = make_deep_genimi(server, pool, reasoning_router=router)
+    saved_skip = metrics.REASONING_LATENCY_SAVED.labels("skip")
+    saved_cap = metrics.REASONING_LATENCY_SAVED.labels("cap")
+    before_skip, before_cap = saved_skip.value, saved_cap.value
+
+    skipped = run_request(service, pool, "none")
+    assert skipped["reasoning_content"] == ""
+    assert skipped["content"].startswith("回答0")
+    assert server.counts["deepseek"] == 0
+    assert saved_skip.value == pytest.approx(before_skip + 5.0)
+
+    capped = run_request(service, pool, "low")
+    assert capped["reasoning_content"].startswith("推理0")
+    assert len(capped["reasoning_content"].split()) < 300
+    assert server.counts["deepseek"] == 1
+    assert 4.0 < saved_cap.value - before_cap <= 5.0
+    assert router.stats()["routes"] == {"skip": 1, "cap": 1, "full": 0}
@@ -0,0 +1,72 @@
+"""多进程共享状态：发布与汇总各工作进程的快照，清理已退出进程的文件"""
+import os
+import subprocess
+import sys
+
+from app.utils.metrics import MetricsRegistry
+from app.utils.shared_state import SharedState
+
+# 汇总时只读取存活进程的快照，测试用父进程与 1 号进程模拟另外两个工作进程
+OTHER_PIDS = (os.getppid(), 1)
+
+
+def worker_registry() -> tuple[MetricsRegistry, dict]:
+    registry = MetricsRegistry()
+    metrics = {
+        "requests": registry.counter("requests", "请求数", ("mode",)),
+        "active": registry.gauge("active", "进行中的请求数"),
+        "duration": registry.histogram("duration_seconds", "耗时", (1.0,)),
+    }
+    return registry, metrics
+
+
+def test_publish_and_collect_skip_self_unless_asked(tmp_path):
+    state = SharedState(str(tmp_path / "state"))
+    state.publish("worker", {"active_streams": 2})
+    assert state.collect("worker") == []
+    (snapshot,) = state.collect("worker", include_self=True)
+    assert snapshot["pid"] == os.getpid()
+    assert snapshot["data"] == {"active_streams": 2}
+
+    state.remove("worker")
+    assert state.collect("worker", include_self=True) == []
+    # 重复删除没有副作用
+    state.remove("worker")
+
+
+def test_snapshots_of_exited_workers_are_removed(tmp_path):
+    directory = str(tmp_path)
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    SharedState(directory, pid=exited.pid).publish("metrics", {})
+    SharedState(directory, pid=OTHER_PIDS[0]).publish("metrics", {})
+
+    snapshots = SharedState(directory).collect("metrics")
+    assert [snapshot["pid"] for snapshot in snapshots] == [OTHER_PIDS[0]]
+    assert not os.path.exists(os.path.join(directory, f"metrics.{exited.pid}.json"))
+
+
+def test_metrics_merge_across_two_worker_snapshots(tmp_path):
+    directory = str(tmp_path)
+    for pid, (stream, non_stream, active, duration) in zip(OTHER_PIDS, ((3, 1, 2, 0.5), (4, 0, 5, 2.0))):
+        registry, metrics = worker_registry()
+        metrics["requests"].labels("stream").inc(stream)
+        if non_stream:
+            metrics["requests"].labels("non_stream").inc(non_stream)
+        metrics["active"].set(active)
+        metrics["duration"].observe(duration)
+        SharedState(directory, pid=pid).publish("metrics", registry.snapshot())
+
+    registry, metrics = worker_registry()
+    metrics["requests"].labels("stream").inc(1)
+    metrics["active"].set(1)
+    others = [snapshot["data"] for snapshot in SharedState(directory).collect("metrics")]
+    assert len(others) == 2
+
+    lines = registry.render(others).splitlines()
+    assert 'requests_total{mode="stream"} 8' in lines
+    assert 'requests_total{mode="non_stream"} 1' in lines
+    assert "active 8" in lines
+    assert 'duration_seconds_bucket{le="1.0"} 1' in lines
+    assert 'duration_seconds_bucket{le="+Inf"} 2' in lines
+    assert "duration_seconds_sum 2.5" in lines
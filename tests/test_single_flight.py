@@ -0,0 +1,105 @@
+"""单飞合并：共享历史的裁剪、加入窗口与背压"""
+import asyncio
+
+from app.deepgenimi import SingleFlight
+
+
+def counting_factory(count: int, started: list):
+    def factory():
+        async def events():
+            started.append(1)
+            for i in range(count):
+                yield i
+                await asyncio.sleep(0)
+        return events()
+    return factory
+
+
+async def take(stream, count: int) -> list:
+    return [await anext(stream) for _ in range(count)]
+
+
+def test_late_joiner_replays_prefix_without_stalling_leader():
+    async def scenario():
+        started = []
+        flight = SingleFlight(max_lag=4, join_window=64)
+        leader = flight.subscribe("key", counting_factory(50, started))
+        assert await take(leader, 20) == list(range(20))
+
+        joiner = flight.subscribe("key", counting_factory(50, started))
+        assert await anext(joiner) == 0  # 从头回放
+        # 加入者停在回放的开头，发起者仍能从加入点继续读取 max_lag 个事件，不需要等它回放完前缀
+        assert await asyncio.wait_for(take(leader, 4), 1) == list(range(20, 24))
+
+        rest = await asyncio.wait_for(asyncio.gather(take(joiner, 49), take(leader, 26)), 5)
+        assert rest == [list(range(1, 50)), list(range(24, 50))]
+        assert len(started) == 1
+        assert flight.coalesced == 1
+        await leader.aclose()
+        await joiner.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_history_is_trimmed_once_join_window_closes():
+    async def scenario():
+        started = []
+        flight = SingleFlight(max_lag=4, join_window=8)
+        stream = flight.subscribe("key", counting_factory(200, started))
+        peak = 0
+        received = []
+        async for event in stream:
+            received.append(event)
+            peak = max(peak, flight.stats()["buffered_events"])
+        assert received == list(range(200))
+        assert peak <= 8 + 4 + 1
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_request_after_join_window_starts_its_own_flight():
+    async def scenario():
+        started = []
+        flight = SingleFlight(max_lag=4, join_window=8)
+        first = flight.subscribe("key", counting_factory(30, started))
+        await take(first, 12)
+
+        joined = []
+        second = flight.subscribe("key", counting_factory(30, started), on_join=lambda: joined.append(1))
+        assert await take(second, 30) == list(range(30))
+        assert len(started) == 2
+        assert not joined
+        assert flight.too_late == 1
+        await first.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_last_subscriber_leaving_cancels_pipeline():
+    async def scenario():
+        cancelled = asyncio.Event()
+
+        def factory():
+            async def events():
+                try:
+                    for i in range(1000):
+                        yield i
+                        await asyncio.sleep(0.01)
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+            return events()
+
+        flight = SingleFlight(max_lag=4)
+        first = flight.subscribe("key", factory)
+        second = flight.subscribe("key", factory)
+        await take(first, 3)
+        await take(second, 1)
+        await first.aclose()
+        assert not cancelled.is_set()
+        await second.aclose()
+        assert cancelled.is_set()
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,62 @@
+"""增量 SSE 解码器：任意分片、CRLF 与多字节字符"""
+import json
+
+import pytest
+
+from app.clients.sse_decoder import SSEDecoder, SSE_DONE
+
+EVENTS = [
+    {"choices": [{"delta": {"reasoning_content": "推理：先看条件"}}]},
+    {"choices": [{"delta": {"content": "答案 🐬"}}]},
+]
+
+
+def encode(events: list, newline: bytes = b"\n") -> bytes:
+    body = b"".join(b"data: " + json.dumps(event, ensure_ascii=False).encode("utf-8") + newline * 2
+                    for event in events)
+    return b": keep-alive" + newline + body + b"data: [DONE]" + newline * 2
+
+
+def decode(chunks: list[bytes], **kwargs) -> list:
+    decoder = SSEDecoder(**kwargs)
+    events = []
+    for chunk in chunks:
+        events.extend(decoder.feed(chunk))
+    return events + decoder.flush()
+
+
+@pytest.mark.parametrize("newline", [b"\n", b"\r\n"])
+def test_every_split_point_decodes_the_same(newline):
+    stream = encode(EVENTS, newline)
+    for split in range(1, len(stream)):
+        assert decode([stream[:split], stream[split:]]) == EVENTS + [SSE_DONE], split
+
+
+@pytest.mark.parametrize("newline", [b"\n", b"\r\n"])
+def test_byte_by_byte(newline):
+    stream = encode(EVENTS, newline)
+    assert decode([stream[i:i + 1] for i in range(len(stream))]) == EVENTS + [SSE_DONE]
+
+
+def test_crlf_split_between_cr_and_lf():
+    assert decode([b'data: {"a": 1}\r', b'\n\r', b'\n']) == [{"a": 1}]
+
+
+def test_multiline_data_and_ignored_fields():
+    stream = b"event: message\nid: 7\ndata: {\"a\":\ndata: 1}\nretry: 10\n\n"
+    assert decode([stream]) == [{"a": 1}]
+
+
+def test_flush_emits_event_without_trailing_blank_line():
+    decoder = SSEDecoder()
+    assert decoder.feed(b'data: {"a": 1}') == []
+    assert decoder.flush() == [{"a": 1}]
+    assert decoder.flush() == []
+
+
+def test_invalid_json_is_skipped():
+    assert decode([b"data: {not json}\n\ndata: {\"ok\": true}\n\n"]) == [{"ok": True}]
+
+
+def test_raw_mode_returns_bytes():
+    assert decode([b"data: hello\r\n\r\ndata: [DONE]\r\n\r\n"], parse_json=False) == [b"hello", SSE_DONE]
@@ -0,0 +1,79 @@
+"""有界流缓冲区的背压"""
+import asyncio
+
+from app.deepgenimi.stream_buffer import StreamBuffer
+
+
+def test_two_producers_block_at_watermark_and_resume():
+    async def scenario():
+        buffer = StreamBuffer("chatcmpl-test", max_frames=2)
+        written = {"a": 0, "b": 0}
+
+        async def produce(name: str, count: int) -> None:
+            for i in range(count):
+                await buffer.put((name, i))
+                written[name] += 1
+            buffer.put_nowait(None)
+
+        producers = [asyncio.create_task(produce("a", 20)), asyncio.create_task(produce("b", 20))]
+        await asyncio.sleep(0.01)
+        # 两个生产者都被水位线挡住
+        assert buffer.stats.buffered_frames == 2
+        assert sum(written.values()) == 2
+        assert buffer.stats.producer_waits == 2
+
+        items, finished = [], 0
+        while finished < 2:
+            item = await buffer.get()
+            if item is None:
+                finished += 1
+            else:
+                items.append(item)
+            assert buffer.stats.buffered_frames <= 3  # 水位线之外只允许结束标记
+        await asyncio.gather(*producers)
+        assert sorted(items) == sorted([("a", i) for i in range(20)] + [("b", i) for i in range(20)])
+        # 每个生产者内部保持顺序
+        for name in ("a", "b"):
+            assert [i for n, i in items if n == name] == list(range(20))
+        assert buffer.stats.peak_frames <= 3
+
+    asyncio.run(scenario())
+
+
+def test_woken_producer_cancelled_before_resuming_passes_wakeup_on():
+    async def scenario():
+        buffer = StreamBuffer("chatcmpl-test", max_frames=1)
+        buffer.put_nowait("head")
+        first = asyncio.create_task(buffer.put("first"))
+        second = asyncio.create_task(buffer.put("second"))
+        await asyncio.sleep(0)
+        assert len(buffer._putters) == 2
+
+        # 消费者取走一帧并唤醒 first，first 在恢复执行前被取消
+        assert buffer.get_nowait() == "head"
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+
+        # 缓冲区已有空位，second 必须被唤醒而不是一直挂起
+        await asyncio.wait_for(second, 1)
+        assert buffer.get_nowait() == "second"
+        assert buffer.empty()
+
+    asyncio.run(scenario())
+
+
+def test_producer_timeout_while_waiting_leaves_no_stale_waiter():
+    async def scenario():
+        buffer = StreamBuffer("chatcmpl-test", max_frames=1)
+        buffer.put_nowait("head")
+        try:
+            async with asyncio.timeout(0.01):
+                await buffer.put("late")
+        except TimeoutError:
+            pass
+        assert not buffer._putters
+        assert buffer.get_nowait() == "head"
+        await asyncio.wait_for(buffer.put("next"), 1)
+        assert buffer.get_nowait() == "next"
+
+    asyncio.run(scenario())
@@ -0,0 +1,96 @@
+"""多密钥鉴权与租户限额：令牌桶、并发上限与超限时的 429"""
+import asyncio
+import json
+
+import pytest
+
+from app.utils import auth
+from app.utils.auth import Tenant, TokenBucket, _digest, _load_key_table
+from app.utils.settings import Settings
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(auth, "time", clock)
+    return clock
+
+
+def test_token_bucket_allows_a_burst_then_refills_at_rate(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.try_take() for _ in range(3)] == [0, 0, 0]
+    assert bucket.try_take() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.try_take() == 0
+    clock.now += 100
+    # 长时间空闲后最多积累 burst 个令牌
+    assert [bucket.try_take() for _ in range(4)][-1] > 0
+    assert TokenBucket(rate=0, burst=0).try_take() == 0
+
+
+def test_tenant_counts_rate_and_stream_limits(clock):
+    tenant = Tenant("team-a", rate=1, burst=1, max_streams=1)
+    assert tenant.try_acquire_request() == 0
+    assert tenant.try_acquire_request() == pytest.approx(1.0)
+    assert tenant.try_open_stream()
+    assert not tenant.try_open_stream()
+    tenant.close_stream()
+    assert tenant.try_open_stream()
+    stats = tenant.stats()
+    assert (stats["accepted"], stats["rate_limited"], stats["stream_limited"], stats["active_streams"]) == (2, 1, 1, 1)
+
+
+def test_key_table_shares_tenants_and_splits_limits_across_workers():
+    settings = Settings(api_keys=json.dumps({
+        "sk-a1": {"tenant": "team-a", "rate": 10, "burst": 20, "max_streams": 5, "weight": 2},
+        "sk-a2": {"tenant": "team-a"},
+        "sk-b": {"tenant": "team-b"},
+    }), allow_api_key="sk-default", tenant_default_rate=4, workers=2)
+    table = _load_key_table(settings)
+
+    team_a = table[_digest("sk-a1")]
+    assert table[_digest("sk-a2")] is team_a
+    assert (team_a.requests.rate, team_a.requests.burst, team_a.max_streams, team_a.weight) == (5, 10, 3, 2)
+    assert table[_digest("sk-b")].requests.rate == 0
+    assert table[_digest("sk-default")].name == "default"
+    assert table[_digest("sk-default")].requests.rate == 2
+    assert _digest("sk-a1") != _digest("sk-a2")
+
+
+def test_rate_limited_request_gets_429_with_retry_after(mock_upstreams, app_client, clock):
+    server = mock_upstreams()
+    tenant = Tenant("team-a", rate=0.5, burst=1)
+    client = app_client(server, tenant)
+    # 令牌已被之前的请求用完，下一个令牌在 2 秒后补充
+    assert tenant.try_acquire_request() == 0
+
+    status, headers, body = asyncio.run(client.request("POST", "/v1/chat/completions", {
+        "messages": [{"role": "user", "content": "question"}], "stream": False}))
+    assert status == 429
+    assert headers["retry-after"] == "2"
+    assert "team-a" in json.loads(body)["error"]
+    assert tenant.rate_limited == 1
+    assert tenant.active_streams == 0
+    assert server.counts["deepseek"] == 0
+
+
+def test_concurrent_request_limit_gets_429(mock_upstreams, app_client):
+    server = mock_upstreams()
+    tenant = Tenant("team-a", max_streams=1)
+    client = app_client(server, tenant, admission_retry_after=3)
+    assert tenant.try_open_stream()
+
+    status, headers, _ = asyncio.run(client.request("POST", "/v1/chat/completions", {
+        "messages": [{"role": "user", "content": "question"}]}))
+    assert status == 429
+    assert headers["retry-after"] == "3"
+    assert tenant.stream_limited == 1
+    assert tenant.active_streams == 1
@@ -0,0 +1,137 @@
+"""链路追踪：traceparent 解析与采样、导出到文件的请求时间线，以及向上游传播的开关"""
+import asyncio
+import json
+
+import pytest
+
+from app.utils.tracing import NOOP_SPAN, FileSpanExporter, Tracer, encode_otlp, parse_traceparent
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+SAMPLED = f"00-{TRACE_ID}-{PARENT_ID}-01"
+
+
+class ListExporter:
+    def __init__(self):
+        self.batches: list[dict] = []
+
+    def export(self, body: bytes) -> None:
+        self.batches.append(json.loads(body))
+
+
+def test_parse_traceparent_rejects_invalid_headers():
+    assert parse_traceparent(SAMPLED) == (TRACE_ID, PARENT_ID, True)
+    assert parse_traceparent(f" 00-{TRACE_ID.upper()}-{PARENT_ID}-00 ") == (TRACE_ID, PARENT_ID, False)
+    for value in (None, "", "garbage", f"ff-{TRACE_ID}-{PARENT_ID}-01", f"00-{'0' * 32}-{PARENT_ID}-01",
+                  f"00-{TRACE_ID}-{'0' * 16}-01", f"00-{TRACE_ID}-{PARENT_ID}-1"):
+        assert parse_traceparent(value) is None
+
+
+def test_sampling_follows_the_incoming_decision_then_the_ratio():
+    assert Tracer(sample_ratio=1.0).start_trace("request", SAMPLED) is NOOP_SPAN
+
+    tracer = Tracer(sample_ratio=0.0, exporter=ListExporter())
+    assert tracer.start_trace("request") is NOOP_SPAN
+    assert tracer.start_trace("request", f"00-{TRACE_ID}-{PARENT_ID}-00") is NOOP_SPAN
+    continued = tracer.start_trace("request", SAMPLED)
+    assert (continued.trace_id, continued.parent_id) == (TRACE_ID, PARENT_ID)
+
+    tracer = Tracer(sample_ratio=1.0, exporter=ListExporter())
+    root = tracer.start_trace("request")
+    assert root.recording and root.parent_id is None and len(root.trace_id) == 32
+    assert tracer.stats()["sampled_traces"] == 1
+
+
+def test_traceparent_is_only_propagated_when_enabled():
+    child = Tracer(exporter=ListExporter()).start_trace("request", SAMPLED).child("upstream")
+    assert child.traceparent() is None
+    assert NOOP_SPAN.traceparent() is None
+
+    child = Tracer(exporter=ListExporter(), propagate=True).start_trace("request", SAMPLED).child("upstream")
+    assert child.traceparent() == f"00-{TRACE_ID}-{child.span_id}-01"
+
+
+def test_encoded_spans_carry_status_events_and_parents():
+    exporter = ListExporter()
+    tracer = Tracer(exporter=exporter, propagate=True)
+    root = tracer.start_trace("request", SAMPLED, attributes={"tenant": "team-a", "skipped": None})
+    with pytest.raises(ValueError):
+        with root.child("stage") as stage:
+            stage.add_event("first_token", {"tokens": 1})
+            raise ValueError("bad")
+    root.end()
+    root.end()
+
+    body = encode_otlp(list(tracer._queue), "svc")
+    stage_item, root_item = body["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert stage_item["parentSpanId"] == root_item["spanId"]
+    assert root_item["parentSpanId"] == PARENT_ID
+    assert stage_item["status"] == {"code": 2, "message": "ValueError: bad"}
+    assert stage_item["events"][0]["attributes"] == [{"key": "tokens", "value": {"intValue": "1"}}]
+    # 值为 None 的属性不导出
+    assert root_item["attributes"] == [{"key": "tenant", "value": {"stringValue": "team-a"}}]
+
+
+def test_file_exporter_rotates_by_size(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    exporter = FileSpanExporter(str(path), max_bytes=10, backups=2)
+    for line in (b"first-batch", b"second", b"third"):
+        exporter.export(line)
+    exporter.close()
+    assert path.read_bytes() == b"third\n"
+    assert (tmp_path / "spans.jsonl.1").read_bytes() == b"second\n"
+    assert (tmp_path / "spans.jsonl.2").read_bytes() == b"first-batch\n"
+
+
+def read_spans(path) -> list[dict]:
+    spans = []
+    for line in path.read_text().splitlines():
+        for resource in json.loads(line)["resourceSpans"]:
+            for scope in resource["scopeSpans"]:
+                spans.extend(scope["spans"])
+    return spans
+
+
+@pytest.mark.parametrize("propagate", [False, True])
+def test_request_timeline_is_exported_to_the_file(mock_upstreams, app_client, tmp_path, propagate):
+    from app import main
+
+    server = mock_upstreams("--deepseek-ttft", "0", "--token-rate", "0", "--answer-tokens", "5",
+                            "--gemini-token-rate", "0", "--gemini-ttft", "0")
+    path = tmp_path / "traces.jsonl"
+    client = app_client(server, tracing_exporter="file", tracing_file=str(path), tracing_sample_ratio=0.0,
+                        tracing_propagate=propagate)
+    main.tracer.start()
+    try:
+        status, headers, _ = asyncio.run(client.request("POST", "/v1/chat/completions", {
+            "messages": [{"role": "user", "content": "question"}], "stream": False},
+            headers={"traceparent": SAMPLED}))
+    finally:
+        main.tracer.shutdown()
+    assert status == 200
+    assert headers["x-trace-id"] == TRACE_ID
+
+    spans = read_spans(path)
+    assert {span["traceId"] for span in spans} == {TRACE_ID}
+    by_name = {}
+    for span in spans:
+        by_name.setdefault(span["name"], []).append(span)
+    (root,) = by_name["POST /v1/chat/completions"]
+    assert root["parentSpanId"] == PARENT_ID
+    for name in ("admission", "deepseek", "gemini"):
+        (stage,) = by_name[name]
+        assert stage["parentSpanId"] == root["spanId"]
+        assert int(root["startTimeUnixNano"]) <= int(stage["startTimeUnixNano"])
+        assert int(stage["endTimeUnixNano"]) <= int(root["endTimeUnixNano"])
+    # 每个上游调用都是所在阶段的子 Span
+    stage_ids = {by_name["deepseek"][0]["spanId"], by_name["gemini"][0]["spanId"]}
+    upstream = by_name["upstream"]
+    assert len(upstream) == 2
+    assert {span["parentSpanId"] for span in upstream} == stage_ids
+
+    # 只有开启传播时上游请求才带有 traceparent，且父节点是对应的 upstream Span
+    if propagate:
+        assert sorted(server.upstreams.traceparents) == sorted(
+            f"00-{TRACE_ID}-{span['spanId']}-01" for span in upstream)
+    else:
+        assert server.upstreams.traceparents == [None, None]